@@ -4,7 +4,9 @@ EvoGen AI with Tavily integration
 
 使い方:
   - 必要ライブラリ:
-      pip install streamlit requests google-generativeai
+      pip install streamlit requests google-generativeai numpy
+  - 任意ライブラリ（あれば自動で利用）:
+      pip install diskcache sentence-transformers orjson "httpx[http2]"
   - 実行:
       streamlit run app_tavily.py
 """
@@ -13,63 +15,568 @@ import streamlit as st
 import os
 import json
 import abc
-from typing import List, Dict, Any, Generator, Optional
+import asyncio
+import functools
+import heapq
+import operator
+import hashlib
+import datetime
+import string
+import random
+import statistics
+import threading
+import queue
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Dict, Any, Generator, Optional, AsyncIterator
 import time
 
+import numpy as np
+
 # --- 外部ライブラリの読み込み ---
 try:
     import google.generativeai as genai
 except Exception:
     genai = None
 
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
 try:
     import requests
 except ImportError:
     requests = None
 
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = None
+    get_script_run_ctx = None
+
 # ----------------------------
 # 1) LLMクライアント層 (既存)
 # ----------------------------
+def loads_json(data: Any) -> Any:
+    """JSON の str / bytes を読む。orjson があれば C 実装のパーサで高速に読む。"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def dumps_json(obj: Any, indent: bool = False, sort_keys: bool = False) -> str:
+    """JSON 文字列に書き出す。orjson があればそれを使い、無ければ標準の json で同じ形にする。"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None, sort_keys=sort_keys)
+
+# response_schema の正規化済み JSON 文字列。スキーマは定数か solve ごとに1度だけ作る dict なので、
+# 呼び出しのたびにシリアライズし直さず、オブジェクトの id で引く（id の再利用を防ぐため本体も保持する）
+_SCHEMA_KEYS: "OrderedDict[int, tuple]" = OrderedDict()
+_SCHEMA_KEYS_MAXSIZE = 64
+_SCHEMA_KEYS_LOCK = threading.Lock()
+
+def schema_key(schema: Optional[Dict[str, Any]]) -> str:
+    """スキーマをキャッシュ鍵に使う文字列にする。渡した dict を後から書き換えないこと。"""
+    with _SCHEMA_KEYS_LOCK:
+        entry = _SCHEMA_KEYS.get(id(schema))
+        if entry is not None and entry[0] is schema:
+            _SCHEMA_KEYS.move_to_end(id(schema))
+            return entry[1]
+        key = dumps_json(schema, sort_keys=True)
+        _SCHEMA_KEYS[id(schema)] = (schema, key)
+        if len(_SCHEMA_KEYS) > _SCHEMA_KEYS_MAXSIZE:
+            _SCHEMA_KEYS.popitem(last=False)
+        return key
+
+def parse_json_text(text: str) -> Dict[str, Any]:
+    try:
+        return loads_json(text)
+    except Exception:
+        # JSON パースに失敗した場合は raw テキストとして返す
+        return {"raw_text": text}
+
 class LLMClient(abc.ABC):
     """LLMクライアントの基本インタフェース"""
     @abc.abstractmethod
-    def call(self, prompt: str) -> Dict[str, Any]:
+    def call(self, prompt: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None, candidate_count: int = 1, semantic_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        candidate_count > 1 の場合は {"candidates": [...]} の形で複数の応答を返す。
+        semantic_key はプロンプトのうち可変な部分（課題文など）で、近似一致のキャッシュだけが使う。
+        """
         pass
 
+    async def acall(self, prompt: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None, candidate_count: int = 1, semantic_key: Optional[str] = None) -> Dict[str, Any]:
+        """call の非同期版。既定ではワーカースレッドで同期 call を実行する。"""
+        return await asyncio.to_thread(self.call, prompt, use_cache, response_schema, candidate_count, semantic_key)
+
+class AsyncTokenBucket:
+    """rate 回 / per 秒 を上限とする asyncio 用のトークンバケット（RPM 制限の遵守用）"""
+    def __init__(self, rate: int, per: float = 60.0):
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
 class GeminiClient(LLMClient):
     """Google Gemini 用のクライアント（既存実装を踏襲）"""
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash"):
+    MAX_RETRIES = 4
+    # Context Cache に登録できる最小トークン数（gemini-2.5-flash）。これに届かない前置きは登録を試みない
+    CONTEXT_CACHE_MIN_TOKENS = 1024
+    # モデル名 -> 登録に失敗した前置きの推定トークン数の最大値。これ以下の前置きでは同じ失敗を繰り返さない
+    _context_cache_failures: Dict[str, int] = {}
+
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash", max_concurrency: int = 10, rpm: int = 500):
         if genai is None:
             raise ImportError("`google-generativeai`ライブラリが未インストールです。pip install google-generativeai を実行してください。")
+        # transport は既定のまま（同期: grpc / 非同期: grpc_asyncio）にする。
+        # "grpc_asyncio" を明示すると同期クライアントの生成に失敗するため。
         genai.configure(api_key=api_key)
+        self.model_name = model_name
+        # モデル（と内部の gRPC チャネル）は生成時に1度だけ作り、全呼び出しで使い回す
         self.model = genai.GenerativeModel(model_name)
         # ここでは generative model に JSON を返させる想定で設定を使う
         self.generation_config = genai.GenerationConfig(
             response_mime_type="application/json"
         )
+        # 非同期呼び出しの同時実行数と RPM の上限（イベントループごとに作り直す）
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self._limits_loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._bucket: Optional[AsyncTokenBucket] = None
+        # 課題文などの共通プレフィックスを登録した Context Cache（未使用時は None）
+        self._cached_content = None
+        self._cached_model = None
+        self._context_fingerprint = ""
+        # (response_schema, candidate_count) ごとの GenerationConfig（内容をキーに使い回す）
+        self._schema_configs: Dict[tuple, Any] = {}
+
+    def _config_for(self, response_schema: Optional[Dict[str, Any]], candidate_count: int = 1):
+        """
+        response_schema を指定すると、その構造に沿った JSON だけを生成させる（制約付きデコード）。
+        candidate_count > 1 では1回のリクエストでサーバー側に複数の応答を並列サンプリングさせる。
+        """
+        if response_schema is None and candidate_count == 1:
+            return self.generation_config
+        config_key = (schema_key(response_schema), candidate_count)
+        config = self._schema_configs.get(config_key)
+        if config is None:
+            options = {"response_mime_type": "application/json", "candidate_count": candidate_count}
+            if response_schema is not None:
+                options["response_schema"] = response_schema
+            config = genai.GenerationConfig(**options)
+            self._schema_configs[config_key] = config
+        return config
+
+    def create_context_cache(self, contents: List[str], ttl_minutes: int = 10) -> bool:
+        """
+        全プロンプトで共通の前置き（課題文など）を Gemini の Context Cache に登録する。
+        以降の call/acall はキャッシュ済みコンテキストの続きとして差分だけを送る。
+        モデルやトークン数の条件で使えない場合は False を返し、従来どおりインラインで送る。
+        短い課題では登録は必ず失敗するため、推定トークン数が足りない場合や、同じ大きさ以下の前置きで
+        失敗したことがある場合は API を呼ばずに False を返す（solve のたびに失敗する往復を払わない）。
+        """
+        self.release_context_cache()
+        tokens = self._estimate_tokens("\n".join(contents))
+        if tokens < self.CONTEXT_CACHE_MIN_TOKENS or tokens <= self._context_cache_failures.get(self.model_name, -1):
+            return False
+        try:
+            cached = genai.caching.CachedContent.create(
+                model=self.model_name,
+                contents=contents,
+                ttl=datetime.timedelta(minutes=ttl_minutes)
+            )
+            self._cached_model = genai.GenerativeModel.from_cached_content(cached)
+        except Exception:
+            self._context_cache_failures[self.model_name] = max(tokens, self._context_cache_failures.get(self.model_name, -1))
+            return False
+        self._cached_content = cached
+        self._context_fingerprint = hashlib.sha256("\n".join(contents).encode("utf-8")).hexdigest()
+        return True
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        # 日本語などの非 ASCII 文字はおおよそ1文字1トークン、ASCII はおおよそ4文字1トークンとして数える
+        non_ascii = sum(1 for ch in text if ord(ch) > 127)
+        return non_ascii + (len(text) - non_ascii) // 4
+
+    def release_context_cache(self) -> None:
+        if self._cached_content is not None:
+            try:
+                self._cached_content.delete()
+            except Exception:
+                pass
+        self._cached_content = None
+        self._cached_model = None
+        self._context_fingerprint = ""
+
+    @property
+    def _active_model(self):
+        return self._cached_model or self.model
+
+    @property
+    def cache_namespace(self) -> str:
+        # Context Cache 使用中は差分プロンプトだけが同じでも意味が異なるため、登録内容も応答キャッシュの鍵に含める
+        return f"{self.model_name}\n{self._context_fingerprint}"
 
-    def call(self, prompt: str) -> Dict[str, Any]:
+    def call(self, prompt: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None, candidate_count: int = 1, semantic_key: Optional[str] = None) -> Dict[str, Any]:
         """
         prompt -> LLM 呼び出し -> JSON パースを試みる
         返り値: dict（失敗時は {"error": "...", "raw": "<text>"} を返す）
+        応答キャッシュは CachedLLMClient が受け持つため、use_cache と semantic_key はここでは使わない。
         """
+        config = self._config_for(response_schema, candidate_count)
         try:
-            response = self.model.generate_content(
+            response = self._active_model.generate_content(
                 prompt,
-                generation_config=self.generation_config
+                generation_config=config
             )
-            # Gemini の場合 response.text に文字列がある想定
-            text = getattr(response, "text", None) or getattr(response, "response", None) or str(response)
-            try:
-                return json.loads(text)
-            except Exception:
-                # JSON パースに失敗した場合は raw テキストとして返す
-                return {"raw_text": text}
+            return self._parse_response(response, candidate_count)
         except Exception as e:
             # Streamlit上でも見えるようにログ出力するが、戻り値は dict で
             st.error(f"[GeminiClient Error] API 呼び出し中にエラーが発生しました: {e}")
             return {"error": str(e)}
 
+    async def acall(self, prompt: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None, candidate_count: int = 1, semantic_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        call の非同期版。generate_content_async を await するため、
+        複数のリクエストを同時に投げて通信待ちを重ねることができる。
+        """
+        config = self._config_for(response_schema, candidate_count)
+        try:
+            async with self._limits():
+                response = await self._send_async(prompt, config)
+            return self._parse_response(response, candidate_count)
+        except Exception as e:
+            st.error(f"[GeminiClient Error] API 呼び出し中にエラーが発生しました: {e}")
+            return {"error": str(e)}
+
+    def _limits(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._limits_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._bucket = AsyncTokenBucket(self.rpm, 60.0)
+            self._limits_loop = loop
+        return self._semaphore
+
+    @staticmethod
+    def _is_rate_limited(error: Exception) -> bool:
+        if google_exceptions is not None and isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+            return True
+        return "429" in str(error)
+
+    async def _send_async(self, prompt: str, config, **kwargs):
+        """
+        トークンバケットで RPM を守りながら送信し、429 (ResourceExhausted) は
+        指数バックオフ＋ジッターで再試行する。同時実行枠は呼び出し側で確保しておく。
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            await self._bucket.acquire()
+            try:
+                return await self._active_model.generate_content_async(
+                    prompt,
+                    generation_config=config,
+                    **kwargs
+                )
+            except Exception as e:
+                if attempt == self.MAX_RETRIES or not self._is_rate_limited(e):
+                    raise
+            await asyncio.sleep(min(2 ** attempt, 30) + random.random())
+
+    def _parse_response(self, response, candidate_count: int = 1) -> Dict[str, Any]:
+        if candidate_count > 1:
+            return self._parse_candidates(response)
+        # Gemini の場合 response.text に文字列がある想定
+        text = getattr(response, "text", None) or getattr(response, "response", None) or str(response)
+        return parse_json_text(text)
+
+    @staticmethod
+    def _parse_candidates(response) -> Dict[str, Any]:
+        # 複数候補の応答では response.text が使えないため、候補ごとに parts を連結して読む
+        texts = []
+        for candidate in getattr(response, "candidates", None) or []:
+            parts = getattr(getattr(candidate, "content", None), "parts", None) or []
+            texts.append("".join(getattr(part, "text", "") or "" for part in parts))
+        parsed = [parse_json_text(text) for text in texts]
+        candidates = [item for item in parsed if isinstance(item, dict) and "raw_text" not in item]
+        if not candidates:
+            return {"raw_text": texts[0] if texts else str(response)}
+        return {"candidates": candidates}
+
+# ----------------------------
+# 1.5) キャッシュ層（評価結果・LLM 応答・実行結果）
+# ----------------------------
+@st.cache_resource(show_spinner=False)
+def load_embedding_model(model_name: str):
+    """埋め込みモデルは読み込みが重いため、プロセス内で1度だけロードする。"""
+    return SentenceTransformer(model_name)
+
+class SemanticCache:
+    """
+    言い換えただけの解決案に対して過去の評価を再利用するためのキャッシュ。
+    解決案の「name + summary」を正規化済みベクトルにし、内積（=コサイン類似度）の
+    最大値がしきい値以上なら、そのときの評価結果を返す。
+    課題文ごとに名前空間を分け、別の課題の評価が混ざらないようにする。
+    sentence-transformers が無い環境では何もしない。
+    課題文・解決案は日本語なので、英語専用ではなく多言語対応の埋め込みモデルを使う。
+    """
+    def __init__(self, threshold: float = 0.95, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"):
+        self.threshold = threshold
+        self.model_name = model_name
+        self._namespaces: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return SentenceTransformer is not None
+
+    @staticmethod
+    def namespace_for(problem_statement: str, evaluation_frame: tuple = ()) -> str:
+        # 評価は課題だけでなく評価者の役割・評価基準にも依存するため、評価の枠組みも名前空間に含める
+        text = "\n".join([problem_statement, *evaluation_frame])
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def solution_text(solution: Dict[str, str]) -> str:
+        return f"{solution.get('name', '')}\n{solution.get('summary', '')}"
+
+    def embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        if not self.enabled or not texts:
+            return None
+        try:
+            model = load_embedding_model(self.model_name)
+            vectors = model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+            return np.asarray(vectors, dtype=np.float32)
+        except Exception as e:
+            st.warning(f"[SemanticCache] 埋め込みの計算に失敗したため、キャッシュを使わずに評価します: {e}")
+            return None
+
+    def lookup(self, namespace: str, vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        return self.lookup_many(namespace, vector[np.newaxis, :])[0]
+
+    def lookup_many(self, namespace: str, vectors: np.ndarray) -> List[Optional[Dict[str, Any]]]:
+        """複数のベクトルを1回の行列積でまとめて引く。命中しなかった行は None。"""
+        with self._lock:
+            space = self._namespaces.get(namespace)
+            if not space or not space["values"]:
+                return [None] * len(vectors)
+            # 登録済みベクトルの行列は追加があったときだけ組み直す
+            if space["matrix"] is None:
+                space["matrix"] = np.vstack(space["vectors"])
+            similarities = vectors @ space["matrix"].T
+            best = np.argmax(similarities, axis=1)
+            return [
+                dict(space["values"][b]) if similarities[row, b] >= self.threshold else None
+                for row, b in enumerate(best.tolist())
+            ]
+
+    def add(self, namespace: str, vector: np.ndarray, value: Dict[str, Any]) -> None:
+        with self._lock:
+            space = self._namespaces.setdefault(namespace, {"vectors": [], "values": [], "matrix": None})
+            space["vectors"].append(vector)
+            space["values"].append(value)
+            space["matrix"] = None
+
+@st.cache_resource(show_spinner=False)
+def get_semantic_cache() -> SemanticCache:
+    """Streamlit の再実行をまたいで評価キャッシュを共有する。"""
+    return SemanticCache()
+
+@st.cache_resource(show_spinner=False)
+def get_prompt_cache() -> SemanticCache:
+    """CachedLLMClient の意味的キャッシュ（プロンプト単位）。評価キャッシュより厳しいしきい値を使う。"""
+    return SemanticCache(threshold=0.97)
+
+class CachedLLMClient(LLMClient):
+    """
+    任意の LLMClient を包み、応答を2段のキャッシュで再利用する。
+    1段目: 鍵（クライアントの名前空間・スキーマ・候補数・プロンプト）の SHA-256 による完全一致。
+           メモリ上の LRU に加え、diskcache があればディスクにも永続化してセッションをまたいで使う。
+    2段目: 呼び出し側が渡した semantic_key（プロンプトの可変部分）の埋め込みのコサイン類似度による近似一致。
+           プロンプト全体を埋め込むと、先頭の固定部分だけで埋め込みモデルの入力上限に達して課題文が切り捨てられ、
+           別の課題にも一致してしまう。そのため可変部分だけを埋め込み、それ以外の部分が同じプロンプトの中でだけ比べる。
+           評価プロンプトは案ごとの差分が小さく近似一致だと別の案の評価を返してしまうため、semantic_key を渡さない。
+    use_cache=False の呼び出しはどちらも参照・更新しない。
+    """
+    CACHE_DIR = "./.evogen_cache"
+    CACHE_MAXSIZE = 512
+
+    def __init__(self, base: LLMClient, semantic_cache: Optional[SemanticCache] = None):
+        self.base = base
+        self.semantic_cache = semantic_cache
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._disk_cache = diskcache.Cache(self.CACHE_DIR) if diskcache is not None else None
+
+    def __getattr__(self, name: str) -> Any:
+        # create_context_cache など、包んだクライアント固有の機能はそのまま委譲する
+        if name == "base":
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    def _namespace(self, response_schema: Optional[Dict[str, Any]], candidate_count: int) -> str:
+        base_namespace = getattr(self.base, "cache_namespace", type(self.base).__name__)
+        return f"{base_namespace}\n{schema_key(response_schema)}\n{candidate_count}"
+
+    def _uses_semantic(self, semantic_key: Optional[str]) -> bool:
+        return semantic_key is not None and self.semantic_cache is not None and self.semantic_cache.enabled
+
+    @staticmethod
+    def _semantic_namespace(namespace: str, prompt: str, semantic_key: str) -> str:
+        # 可変部分を除いたプロンプト（テンプレートと他の差し込み値）が同じ呼び出し同士だけを比べる
+        template = hashlib.sha256(prompt.replace(semantic_key, "").encode("utf-8")).hexdigest()
+        return SemanticCache.namespace_for(f"{namespace}\n{template}")
+
+    def call(self, prompt: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None, candidate_count: int = 1, semantic_key: Optional[str] = None) -> Dict[str, Any]:
+        if not use_cache:
+            return self.base.call(prompt, False, response_schema, candidate_count)
+        namespace = self._namespace(response_schema, candidate_count)
+        hit, semantic = self._lookup(namespace, prompt, semantic_key)
+        if hit is not None:
+            return hit
+        response = self.base.call(prompt, False, response_schema, candidate_count)
+        self._store(namespace, prompt, semantic, response)
+        return response
+
+    async def acall(self, prompt: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None, candidate_count: int = 1, semantic_key: Optional[str] = None) -> Dict[str, Any]:
+        if not use_cache:
+            return await self.base.acall(prompt, False, response_schema, candidate_count)
+        namespace = self._namespace(response_schema, candidate_count)
+        hit, semantic = self._lookup(namespace, prompt, semantic_key)
+        if hit is not None:
+            return hit
+        response = await self.base.acall(prompt, False, response_schema, candidate_count)
+        self._store(namespace, prompt, semantic, response)
+        return response
+
+    async def arefresh(self, prompt: str, response_schema: Optional[Dict[str, Any]] = None, candidate_count: int = 1) -> Dict[str, Any]:
+        """キャッシュを参照せずに呼び直し、完全一致の段を新しい応答で上書きする（再生成用）。"""
+        response = await self.base.acall(prompt, False, response_schema, candidate_count)
+        self._store(self._namespace(response_schema, candidate_count), prompt, None, response)
+        return response
+
+    def _lookup(self, namespace: str, prompt: str, semantic_key: Optional[str] = None) -> tuple:
+        """(キャッシュ済みの応答 or None, 近似一致用の (名前空間, 埋め込み) or None) を返す。"""
+        cached = self._cache_get(self._cache_key(namespace, prompt))
+        if cached is not None:
+            return parse_json_text(cached), None
+        if not self._uses_semantic(semantic_key):
+            return None, None
+        vectors = self.semantic_cache.embed([semantic_key])
+        if vectors is None:
+            return None, None
+        semantic_namespace = self._semantic_namespace(namespace, prompt, semantic_key)
+        return self.semantic_cache.lookup(semantic_namespace, vectors[0]), (semantic_namespace, vectors[0])
+
+    def _store(self, namespace: str, prompt: str, semantic: Optional[tuple], response: Dict[str, Any]) -> None:
+        # 正しく JSON として読めた応答だけをキャッシュする
+        if not isinstance(response, dict) or not response or "error" in response or "raw_text" in response:
+            return
+        self._cache_put(self._cache_key(namespace, prompt), dumps_json(response))
+        if semantic is not None:
+            self.semantic_cache.add(*semantic, response)
+
+    @staticmethod
+    def _cache_key(namespace: str, prompt: str) -> str:
+        return hashlib.sha256(f"{namespace}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if self._disk_cache is not None:
+            stored = self._disk_cache.get(key)
+            if stored is not None:
+                text = stored.decode("utf-8") if isinstance(stored, bytes) else stored
+                self._cache_put(key, text, persist=False)
+                return text
+        return None
+
+    def _cache_put(self, key: str, text: str, persist: bool = True) -> None:
+        self._cache[key] = text
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.CACHE_MAXSIZE:
+            self._cache.popitem(last=False)
+        if persist and self._disk_cache is not None:
+            # bytes のまま保存すると diskcache が pickle を経由しないため読み書きが軽い
+            self._disk_cache.set(key, text.encode("utf-8"))
+
+class RunStore:
+    """
+    同じ入力での再実行に LLM の予算を使わないよう、solve が yield したイベント列と
+    最終結果を保存しておき、再実行時はそれを再生する。
+    API キーは平文では持たず、ハッシュだけを鍵に含める。
+    """
+    def __init__(self, max_entries: int = 32, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._runs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(api_keys: List[str], problem_statement: str, **params: Any) -> str:
+        key_hashes = [hashlib.sha256(key.encode("utf-8")).hexdigest() for key in api_keys]
+        payload = dumps_json({"keys": key_hashes, "problem": problem_statement, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            run = self._runs.get(key)
+            if run is None:
+                return None
+            if time.time() - run["stored_at"] > self.ttl_seconds:
+                del self._runs[key]
+                return None
+            self._runs.move_to_end(key)
+            return run
+
+    def put(self, key: str, events: List[Any], top_solutions: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._runs[key] = {"events": events, "top_solutions": top_solutions, "stored_at": time.time()}
+            self._runs.move_to_end(key)
+            while len(self._runs) > self.max_entries:
+                self._runs.popitem(last=False)
+
+@st.cache_resource(show_spinner=False)
+def get_run_store() -> RunStore:
+    """Streamlit の再実行やセッションをまたいで実行結果を共有する。"""
+    return RunStore()
+
 # ----------------------------
 # 2) Tavily クライアント (既存)
 # ----------------------------
@@ -85,12 +592,16 @@ class TavilyClient:
         self.api_key = api_key
         self.endpoint = endpoint
         self.timeout = timeout
+        # 接続を使い回し（keep-alive）、検索ごとの TCP/TLS ハンドシェイクを省く
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=8)
+        self.session.mount("https://", adapter)
 
     def search(self, query: str, num_results: int = 5, domain: Optional[str] = None, lang: Optional[str] = None) -> Dict[str, Any]:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
         payload = {"query": query, "max_results": num_results}
         if domain:
             payload["domain"] = domain
@@ -98,10 +609,10 @@ class TavilyClient:
             payload["language"] = lang
 
         try:
-            resp = requests.post(self.endpoint, headers=headers, json=payload, timeout=self.timeout)
+            resp = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
             resp.raise_for_status()
-            data = resp.json()
-            return data
+            # requests 内部の json を通さず、受信したバイト列をそのまま読む
+            return loads_json(resp.content)
         except requests.exceptions.RequestException as e:
             return {"error": f"HTTP error: {e}"}
         except ValueError as e:
@@ -109,17 +620,242 @@ class TavilyClient:
         except Exception as e:
             return {"error": str(e)}
 
+class AsyncTavilyClient:
+    """
+    TavilyClient の非同期版。httpx の AsyncClient（HTTP/2）を1本だけ持ち、
+    同時に発行した検索を1つの接続上で多重化する。
+    AsyncClient は最初の検索を行ったイベントループに結び付くため、solve の終わりに aclose で閉じる。
+    """
+    DEFAULT_ENDPOINT = TavilyClient.DEFAULT_ENDPOINT
+
+    def __init__(self, api_key: str, endpoint: str = DEFAULT_ENDPOINT, timeout: int = 15):
+        if httpx is None:
+            raise ImportError("`httpx`ライブラリが未インストールです。pip install \"httpx[http2]\" を実行してください。")
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}"
+            }
+            try:
+                self._client = httpx.AsyncClient(http2=True, timeout=self.timeout, headers=headers)
+            except ImportError:
+                # h2 が無い環境では HTTP/1.1 の接続プールで代用する
+                self._client = httpx.AsyncClient(timeout=self.timeout, headers=headers)
+        return self._client
+
+    async def search(self, query: str, num_results: int = 5, domain: Optional[str] = None, lang: Optional[str] = None) -> Dict[str, Any]:
+        payload = {"query": query, "max_results": num_results}
+        if domain:
+            payload["domain"] = domain
+        if lang:
+            payload["language"] = lang
+
+        try:
+            resp = await self._get_client().post(self.endpoint, json=payload)
+            resp.raise_for_status()
+            return loads_json(resp.content)
+        except httpx.HTTPError as e:
+            return {"error": f"HTTP error: {e}"}
+        except ValueError as e:
+            return {"error": f"JSON parse error: {e}", "raw": resp.text if 'resp' in locals() else None}
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
 # ----------------------------
 # 3) PromptManager（既存）
 # ----------------------------
-class PromptManager:
-    """AIへの指示書（プロンプト）を管理するクラス"""
-    def get_agent_personas_prompt(self, problem_statement: str) -> str:
-        return f"""
+@dataclass(slots=True)
+class Solution:
+    """プロンプト組み立て用の解決案。LLM 応答の dict から一度だけ作る。"""
+    name: str
+    summary: str
+    specific_method: str
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Solution":
+        return cls(
+            name=data.get("name", "名称不明"),
+            summary=data.get("summary", "概要なし"),
+            specific_method=data.get("specific_method", ""),
+        )
+
+@dataclass(slots=True)
+class EvaluatedSolution:
+    """評価済みの解決案1件。score は total_score を整数化したもの。"""
+    solution: Dict[str, Any]
+    evaluation: Dict[str, Any]
+    score: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"solution": self.solution, "evaluation": self.evaluation}
+
+def score_of(evaluation: Dict[str, Any]) -> int:
+    try:
+        return int(float(evaluation.get("total_score", 0)))
+    except (TypeError, ValueError):
+        return 0
+
+@dataclass(slots=True)
+class Generation:
+    """
+    1世代分の評価結果を列ごとに持つ（SoA）。各列はスコアの降順に並べて保持する。
+    UI へはこれまでどおり to_dict() の {"generation", "results"} 形式で渡す。
+    """
+    number: int
+    scores: np.ndarray
+    names: List[str]
+    solutions: List[Dict[str, Any]]
+    evaluations: List[Dict[str, Any]]
+    # 次世代プロンプト用の表示行（評価確定時に1度だけ作る）
+    score_lines: List[str]
+    weakness_lines: List[str]
+
+    @classmethod
+    def from_evaluations(cls, number: int, solutions: List[Dict[str, Any]], evaluations: Dict[int, Dict[str, Any]]) -> "Generation":
+        valid = [i for i in range(len(solutions)) if evaluations.get(i) and "error" not in evaluations[i]]
+        scores = np.fromiter((score_of(evaluations[i]) for i in valid), dtype=np.int32, count=len(valid))
+        # 同点時は元の順序を保つため stable ソートを使う
+        order = np.argsort(-scores, kind="stable")
+        ranked = [valid[k] for k in order]
+        scores = scores[order]
+        names = [solutions[i].get("name", "N/A") for i in ranked]
+        ranked_evaluations = [evaluations[i] for i in ranked]
+        return cls(
+            number=number,
+            scores=scores,
+            names=names,
+            solutions=[solutions[i] for i in ranked],
+            evaluations=ranked_evaluations,
+            score_lines=[f"- {name} (スコア: {score})" for name, score in zip(names, scores.tolist())],
+            weakness_lines=[f"- {name} (弱点: {eva.get('weaknesses', 'N/A')})" for name, eva in zip(names, ranked_evaluations)],
+        )
+
+    def __len__(self) -> int:
+        return len(self.solutions)
+
+    def ranked(self) -> List[EvaluatedSolution]:
+        return [EvaluatedSolution(sol, eva, int(score)) for sol, eva, score in zip(self.solutions, self.evaluations, self.scores)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "generation": self.number,
+            "results": [{"solution": sol, "evaluation": eva} for sol, eva in zip(self.solutions, self.evaluations)],
+        }
+
+# === 構造化出力（response_schema）用のスキーマ ===
+# JSON の形をデコード時に強制し、キー欠落やパース失敗を起こさせない
+SOLUTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "summary": {"type": "string"},
+        "specific_method": {"type": "string"},
+    },
+    "required": ["name", "summary", "specific_method"],
+}
+
+SOLUTION_LIST_SCHEMA = {
+    "type": "object",
+    "properties": {"solutions": {"type": "array", "items": SOLUTION_SCHEMA}},
+    "required": ["solutions"],
+}
+
+_AGENT_SCHEMA = {
+    "type": "object",
+    "properties": {"role": {"type": "string"}, "instructions": {"type": "string"}},
+    "required": ["role", "instructions"],
+}
+
+AGENT_TEAM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "initial_generator": _AGENT_SCHEMA,
+        "evaluator": {
+            "type": "object",
+            "properties": {
+                "role": {"type": "string"},
+                "criteria": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"criterion": {"type": "string"}, "weight": {"type": "integer"}},
+                        "required": ["criterion", "weight"],
+                    },
+                },
+            },
+            "required": ["role", "criteria"],
+        },
+        "synthesizer": _AGENT_SCHEMA,
+    },
+    "required": ["initial_generator", "evaluator", "synthesizer"],
+}
+
+TAVILY_QUERIES_SCHEMA = {
+    "type": "object",
+    "properties": {"queries": {"type": "array", "items": {"type": "string"}}},
+    "required": ["queries"],
+}
+
+TAVILY_SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "key_points": {"type": "array", "items": {"type": "string"}},
+        "risks": {"type": "array", "items": {"type": "string"}},
+        "top_sources": {"type": "array", "items": {"type": "integer"}},
+    },
+    "required": ["summary", "key_points", "risks", "top_sources"],
+}
+
+def build_evaluation_schema(context: Dict[str, Any], batch: bool = False) -> Dict[str, Any]:
+    """評価基準は課題ごとに変わるため、scores のキーを評価担当の criteria から組み立てる。"""
+    criteria = []
+    if isinstance(context.get("criteria"), list):
+        criteria = [item.get("criterion", "不明な基準") for item in context["criteria"] if isinstance(item, dict)]
+    properties = {
+        "total_score": {"type": "integer"},
+        "strengths": {"type": "string"},
+        "weaknesses": {"type": "string"},
+        "overall_comment": {"type": "string"},
+    }
+    if criteria:
+        properties["scores"] = {
+            "type": "object",
+            "properties": {criterion: {"type": "integer"} for criterion in criteria},
+            "required": criteria,
+        }
+    evaluation = {"type": "object", "properties": properties, "required": list(properties)}
+    if not batch:
+        return evaluation
+    item = {
+        "type": "object",
+        "properties": {"id": {"type": "integer"}, **properties},
+        "required": ["id", *properties],
+    }
+    return {
+        "type": "object",
+        "properties": {"evaluations": {"type": "array", "items": item}},
+        "required": ["evaluations"],
+    }
+
+# プロンプトは「全呼び出しで共通の静的な部分 → solve ごとに決まる部分 → 呼び出しごとの部分」の順に並べる。
+# Gemini 等のプロンプトキャッシュは先頭一致で効くため、変化する内容ほど末尾に寄せる。
+AGENT_PERSONAS_PROMPT_PREFIX = """
         # 役割
         あなたは、非常に複雑な課題を解決するために、AIエージェントからなるドリームチームを編成する「マスタープランナー」です。
         # タスク
-        以下の「課題」を深く分析し、この課題を解決するために最も効果的な思考チームを編成してください。
+        末尾の「課題」を深く分析し、この課題を解決するために最も効果的な思考チームを編成してください。
         チームは以下の3体のAIエージェントで構成されます。それぞれのエージェントについて、その役割（ペルソナ）と具体的な行動指示を定義してください。
 
         1. **initial_generator (初期アイデア生成担当):**
@@ -134,27 +870,141 @@ class PromptManager:
             - **role:** どのようにしてアイデアをより優れたものに進化させるべきか？
             - **instructions:** 高評価案と低評価案をどのように分析し、次世代のアイデアを生成すべきか具体的な指示を与えてください。
 
+        # 出力形式 (JSON)
+        {
+          "initial_generator": {"role": "...", "instructions": "..."},
+          "evaluator": {"role": "...", "criteria": [{"criterion": "...", "weight": 10}]},
+          "synthesizer": {"role": "...", "instructions": "..."}
+        }
+"""
+
+INITIAL_GENERATION_PROMPT_PREFIX = """
+        # タスク: 課題に対し、互いに全く異なるアプローチからの解決策を提案してください。
+        # 出力形式: 各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
+        { "solutions": [ { "name": "解決策1", "summary": "概要1", "specific_method": "具体的方法1" } ] }
+"""
+
+TAVILY_QUERIES_PROMPT_PREFIX = """
+        # 役割: あなたはウェブ調査の専門家です。
+        # タスク: 末尾の課題を解決するために役立つ最新情報を集めるための、ウェブ検索クエリを作成してください。
+        - 事例・データ・制約など、互いに異なる観点を狙ったクエリにしてください。
+        - 各クエリは検索エンジンにそのまま入力できる短い文字列にしてください。
+        # 出力形式: JSON形式で出力してください。
+        { "queries": ["検索クエリ1", "検索クエリ2", "検索クエリ3"] }
+"""
+
+SINGLE_SOLUTION_PROMPT_PREFIX = """
+        # タスク: 課題に対し、末尾で指定する着眼点から考えた解決策を1つだけ提案してください。他の着眼点と重ならない独自のアプローチにしてください。
+        # 出力形式: 「name」「summary」「specific_method」を必ず含め、JSON形式で1件だけ出力してください。
+        { "name": "解決策", "summary": "概要", "specific_method": "具体的方法" }
+"""
+
+NEXT_GENERATION_PROMPT_PREFIX = """
+        # タスク: 前世代の分析に基づき、次世代の新しい解決策を生成してください。
+        # 出力形式: 各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
+        { "solutions": [ { "name": "新しい解決策1", "summary": "概要1", "specific_method": "具体的方法1" } ] }
+"""
+
+SINGLE_NEXT_SOLUTION_PROMPT_PREFIX = """
+        # タスク: 前世代の分析に基づき、末尾で指定する着眼点を軸に、次世代の新しい解決策を1つだけ生成してください。
+        # 出力形式: 「name」「summary」「specific_method」を必ず含め、JSON形式で1件だけ出力してください。
+        { "name": "新しい解決策", "summary": "概要", "specific_method": "具体的方法" }
+"""
+
+# 評価プロンプトは「解決案の数 × 世代数」回組み立てるため、テンプレートをモジュール読み込み時に用意しておく。
+# 解決案以外の部分は solve ごとに1度だけ埋め込み（build_evaluator_prefix）、以降は案の名称・概要を連結するだけにする
+EVALUATION_PROMPT_PREFIX_TEMPLATE = string.Template("""
+        # タスク: 提示された課題に対し、末尾の解決案を評価基準に基づいて厳密に評価してください。
+        # 役割: $role
+        # 評価基準:
+        $criteria_block
+        # 出力形式: 評価結果を必ず以下のJSON形式で出力してください。
+        {
+          "total_score": 合計点(整数),
+          "scores": $scores_block,
+          "strengths": "この解決案が優れている点",
+          "weaknesses": "この解決案の懸念点や改善が必要な点",
+          "overall_comment": "評価の総括"
+        }
+        # 課題文: $problem_statement
+        # 評価対象の解決案:
+""")
+
+BATCH_EVALUATION_PROMPT_TEMPLATE = string.Template("""
+        # タスク: 提示された課題に対し、末尾の解決案それぞれを評価基準に基づいて独立に、厳密に評価してください。
+        # 役割: $role
+        # 評価基準:
+        $criteria_block
+        # 出力形式: すべての ID について、評価結果を必ず以下のJSON形式で出力してください。
+        {
+          "evaluations": [
+            {
+              "id": 解決案のID(整数),
+              "total_score": 合計点(整数),
+              "scores": $scores_block,
+              "strengths": "この解決案が優れている点",
+              "weaknesses": "この解決案の懸念点や改善が必要な点",
+              "overall_comment": "評価の総括"
+            }
+          ]
+        }
+        # 課題文: $problem_statement
+        # 評価対象の解決案:
+        $solutions_block
+        """)
+
+# 1案ずつ並列に生成するときに、各プロンプトへ割り当てる着眼点（案同士の重複を避けるため）
+SOLUTION_ASPECT_HINTS = [
+    "技術的観点", "社会的観点", "経済的観点", "運用・管理の観点", "環境・景観の観点",
+    "行動科学の観点", "制度・ルールの観点", "既存資源の転用", "住民参加の観点", "逆転の発想",
+]
+
+def aspect_hints(count: int) -> List[str]:
+    """着眼点を count 個返す。足りない場合は番号を付けて使い回す。"""
+    hints = []
+    for i in range(count):
+        hint = SOLUTION_ASPECT_HINTS[i % len(SOLUTION_ASPECT_HINTS)]
+        round_number = i // len(SOLUTION_ASPECT_HINTS)
+        hints.append(f"{hint}（{round_number + 1}案目）" if round_number else hint)
+    return hints
+
+class PromptManager:
+    """AIへの指示書（プロンプト）を管理するクラス"""
+    def get_agent_personas_prompt(self, problem_statement: str) -> str:
+        return AGENT_PERSONAS_PROMPT_PREFIX + f"""
         # 課題
         {problem_statement}
+        """
 
-        # 出力形式 (JSON)
-        {{
-          "initial_generator": {{"role": "...", "instructions": "..."}},
-          "evaluator": {{"role": "...", "criteria": [{{"criterion": "...", "weight": 10}}]}},
-          "synthesizer": {{"role": "...", "instructions": "..."}}
-        }}
+    def get_tavily_queries_prompt(self, problem_statement: str, num_queries: int) -> str:
+        return TAVILY_QUERIES_PROMPT_PREFIX + f"""
+        # 作成するクエリの数: {num_queries}個
+        # 課題
+        {problem_statement}
         """
 
     def get_initial_generation_prompt(self, problem_statement: str, num_solutions: int, context: Dict[str, str]) -> str:
-        return f"""
+        return INITIAL_GENERATION_PROMPT_PREFIX + f"""
         # 役割: {context.get('role', 'あなたは一流のイノベーターです。')}
         # 指示: {context.get('instructions', f'以下の課題に対し、互いに全く異なるアプローチからの解決策を{num_solutions}個提案してください。')}
         # 課題文: {problem_statement}
-        # 出力形式: 各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
-        {{ "solutions": [ {{ "name": "解決策1", "summary": "概要1", "specific_method": "具体的方法1" }} ] }}
+        # 提案する解決策の数: {num_solutions}個
         """
 
-    def get_evaluation_prompt(self, solution: Dict[str, str], problem_statement: str, context: Dict[str, Any]) -> str:
+    def get_single_solution_prompt(self, problem_statement: str, aspect_hint: str, context: Dict[str, str]) -> str:
+        """並列生成用。着眼点を1つ割り当て、解決策を1件だけ出させる。"""
+        return SINGLE_SOLUTION_PROMPT_PREFIX + f"""
+        # 役割: {context.get('role', 'あなたは一流のイノベーターです。')}
+        # 指示: {context.get('instructions', '以下の課題に対し、独創的な解決策を提案してください。')}
+        # 課題文: {problem_statement}
+        # 今回の着眼点: {aspect_hint}
+        """
+
+    def build_evaluation_frame(self, context: Dict[str, Any]) -> tuple:
+        """
+        評価担当の役割・評価基準・scores の JSON 構造を組み立てる。
+        solve() ごとに1度だけ呼び、全ての評価プロンプトで使い回す。
+        """
         criteria_text = []
         scores_json_structure = []
         if "criteria" in context and isinstance(context["criteria"], list):
@@ -164,147 +1014,625 @@ class PromptManager:
                 criteria_text.append(f"- {criterion}: {weight}点")
                 scores_json_structure.append(f'"{criterion}": 点数(整数)')
 
-        criteria_prompt_part = "\n".join(criteria_text)
-        scores_json_prompt_part = f"{{ {', '.join(scores_json_structure)} }}"
+        role = context.get('role', 'あなたは客観的で厳しい批評家です。')
+        criteria_block = "\n".join(criteria_text)
+        scores_block = f"{{ {', '.join(scores_json_structure)} }}"
+        return role, criteria_block, scores_block
+
+    def build_evaluator_prefix(self, problem_statement: str, role: str, criteria_block: str, scores_block: str) -> str:
+        """評価プロンプトのうち、解決案によらない部分。"""
+        return EVALUATION_PROMPT_PREFIX_TEMPLATE.substitute(
+            role=role,
+            problem_statement=problem_statement,
+            criteria_block=criteria_block,
+            scores_block=scores_block,
+        )
 
-        return f"""
-        # 役割: {context.get('role', 'あなたは客観的で厳しい批評家です。')}
-        # タスク: 提示された課題に対し、解決案を評価基準に基づいて厳密に評価してください。
+    def render_evaluation(self, evaluator_prefix: str, solution: Solution) -> str:
+        return f"{evaluator_prefix}        - 名称: {solution.name}\n        - 概要: {solution.summary}\n"
+
+    def get_evaluation_prompt(self, solution: Solution, problem_statement: str, role: str, criteria_block: str, scores_block: str) -> str:
+        return self.render_evaluation(self.build_evaluator_prefix(problem_statement, role, criteria_block, scores_block), solution)
+
+    def get_batch_evaluation_prompt(self, solutions: Dict[int, Solution], problem_statement: str, role: str, criteria_block: str, scores_block: str) -> str:
+        """複数の解決案を ID 付きで並べ、1回の呼び出しでまとめて評価させる。"""
+        solutions_text = "\n".join([
+            f"- ID: {solution_id}\n  - 名称: {solution.name}\n  - 概要: {solution.summary}"
+            for solution_id, solution in solutions.items()
+        ])
+        return BATCH_EVALUATION_PROMPT_TEMPLATE.substitute(
+            role=role,
+            problem_statement=problem_statement,
+            solutions_block=solutions_text,
+            criteria_block=criteria_block,
+            scores_block=scores_block,
+        )
+
+    def get_next_generation_prompt(self, elite_text: str, failed_text: str, problem_statement: str, num_solutions: int, context: Dict[str, str]) -> str:
+        """elite_text / failed_text は Generation の表示行を連結済みのものを受け取る。"""
+        return NEXT_GENERATION_PROMPT_PREFIX + f"""
+        # 役割: {context.get('role', 'あなたは優れた戦略家であり編集者です。')}
+        # 新しい解決策の生成指示: {context.get('instructions', '高評価案の良い点を組み合わせ、低評価案の失敗から学び、新しい解決策を生成してください。')}
         # 課題文: {problem_statement}
-        # 評価対象の解決案:
-        - 名称: {solution.get('name', '名称不明')}
-        - 概要: {solution.get('summary', '概要なし')}
-        # 評価基準:
-        {criteria_prompt_part}
-        # 出力形式: 評価結果を必ず以下のJSON形式で出力してください。
-        {{
-          "total_score": 合計点(整数),
-          "scores": {scores_json_prompt_part},
-          "strengths": "この解決案が優れている点",
-          "weaknesses": "この解決案の懸念点や改善が必要な点",
-          "overall_comment": "評価の総括"
-        }}
+        # 生成する解決策の数: {num_solutions}個
+        # 分析対象1：高評価だった解決案（優れた遺伝子）: 
+        {elite_text}
+        # 分析対象2：低評価だった解決案（学ぶべき教訓）: 
+        {failed_text}
         """
 
-    def get_next_generation_prompt(self, elite_solutions: List[Dict], failed_solutions: List[Dict], problem_statement: str, num_solutions: int, context: Dict[str, str]) -> str:
-        elite_text = "\n".join([f"- {s['solution'].get('name', 'N/A')} (スコア: {s['evaluation'].get('total_score', 0)})" for s in elite_solutions])
-        failed_text = "\n".join([f"- {s['solution'].get('name', 'N/A')} (弱点: {s['evaluation'].get('weaknesses', 'N/A')})" for s in failed_solutions])
-
-        return f"""
+    def get_single_next_solution_prompt(self, elite_text: str, failed_text: str, problem_statement: str, aspect_hint: str, context: Dict[str, str]) -> str:
+        """並列生成用の次世代プロンプト。前世代の分析は共通で、着眼点だけを変える。"""
+        return SINGLE_NEXT_SOLUTION_PROMPT_PREFIX + f"""
         # 役割: {context.get('role', 'あなたは優れた戦略家であり編集者です。')}
-        # タスク: 前世代の分析に基づき、次世代の新しい解決策を{num_solutions}個生成してください。
+        # 新しい解決策の生成指示: {context.get('instructions', '高評価案の良い点を組み合わせ、低評価案の失敗から学び、新しい解決策を生成してください。')}
+        # 課題文: {problem_statement}
         # 分析対象1：高評価だった解決案（優れた遺伝子）: 
         {elite_text}
         # 分析対象2：低評価だった解決案（学ぶべき教訓）: 
         {failed_text}
-        # 新しい解決策の生成指示: {context.get('instructions', '高評価案の良い点を組み合わせ、低評価案の失敗から学び、新しい解決策を生成してください。')}
-        
-        # 出力形式: 各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
-        {{ "solutions": [ {{ "name": "新しい解決策1", "summary": "概要1", "specific_method": "具体的方法1" }} ] }}
+        # 今回の着眼点: {aspect_hint}
         """
 
 # ----------------------------
 # 4) EvoGenSolver（既存） + Tavily 拡張
+class ProgressThrottle:
+    """
+    解決案ごとの細かな進捗をまとめ、UI への反映を一定間隔（既定 200ms）に間引く。
+    間隔内に届いたメッセージは最新の1件だけを保持し、間隔が空いた時点で返す。
+    """
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self._message: Optional[str] = None
+        self._last = float("-inf")
+
+    def update(self, message: str) -> None:
+        self._message = message
+
+    def now(self, message: str) -> str:
+        """フェーズの切り替えなど、間引かずにすぐ表示するメッセージ。保留中の進捗は破棄する。"""
+        self._message = None
+        self._last = time.monotonic()
+        return message
+
+    def poll(self, force: bool = False) -> Optional[str]:
+        if self._message is None:
+            return None
+        if not force and time.monotonic() - self._last < self.interval:
+            return None
+        message, self._message = self._message, None
+        self._last = time.monotonic()
+        return message
+
+    def timeout(self) -> Optional[float]:
+        """保留中の進捗を表示できるまでの残り時間（保留が無ければ None = 無期限に待ってよい）。"""
+        if self._message is None:
+            return None
+        return max(0.0, self.interval - (time.monotonic() - self._last))
+
 # ----------------------------
 class EvoGenSolver:
     """元の EvoGenSolver（主要ロジック）"""
-    def __init__(self, llm_client: LLMClient, num_solutions_per_generation: int = 5):
+    # 概要がこの文字数に満たない案は、崩れた出力とみなして LLM で評価しない
+    MIN_SUMMARY_CHARS = 20
+
+    def __init__(self, llm_client: LLMClient, num_solutions_per_generation: int = 5, semantic_cache: Optional[SemanticCache] = None, batch_evaluation: bool = True, early_stop_patience: int = 2, evaluation_samples: int = 3, parallel_generation: bool = True):
         self.client = llm_client
         self.num_solutions = num_solutions_per_generation
+        self.semantic_cache = semantic_cache
+        self.batch_evaluation = batch_evaluation
+        # 最高スコアがこの世代数だけ更新されなければ進化を打ち切る
+        self.early_stop_patience = early_stop_patience
+        # 評価は1リクエストで複数候補をサンプリングし、スコアの中央値で採点のばらつきを抑える
+        self.evaluation_samples = evaluation_samples
+        # 解決策を1案ずつ別リクエストで同時に生成する（1件しか作らない場合は従来の一括生成）
+        self.parallel_generation = parallel_generation
+        # True の場合、キャッシュ済みのチーム編成を使わずに作り直す（UI の「再編成」指定）
+        self.refresh_personas = False
         self.prompter = PromptManager()
         self.history = []
-
-    def _call_llm(self, prompt: str) -> Dict[str, Any]:
-        return self.client.call(prompt)
+        # 評価結果は世代ごとの SoA（Generation）で持ち、history は UI 向けの dict 表現
+        self.generations: List[Generation] = []
+        # 全世代を通したスコアと (世代, 世代内の順位) の対応。世代確定時に追記する
+        self._all_scores: List[int] = []
+        self._all_items: List[tuple] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._context_cached_problem: Optional[str] = None
+        self._received_count = 0
+        # 評価用の response_schema（単体, 一括）。評価基準が決まる solve 内で組み立てる
+        self._evaluation_schemas = (None, None)
+        self._progress = ProgressThrottle()
+        # ((課題文, evaluation_frame), 組み立て済みの評価プロンプト前半)
+        self._evaluator_prefix: Optional[tuple] = None
+        # 内容ハッシュ（summary + specific_method）-> 評価。solve ごとに作り直す
+        self._eval_cache: Dict[str, Dict] = {}
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        非同期呼び出し用のイベントループ。solve はジェネレータのまま保ち、
+        必要な区間だけこのループを回して UI へ逐次 yield できるようにする。
+        """
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop
+
+    def _close_loop(self) -> None:
+        """並行中のチーム編成など、ループ上に残った未完了のタスクを取り消して待ち、ループを閉じる。"""
+        loop, self._loop = self._loop, None
+        if loop is None or loop.is_closed():
+            return
+        try:
+            pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+    def _call_llm(self, prompt: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # 単発の呼び出しも非同期クライアント経由にし、並列評価と同じ HTTP/2 チャネルに相乗りさせる
+        return self._get_loop().run_until_complete(self.client.acall(prompt, use_cache, response_schema))
+
+    PROBLEM_CONTEXT_HEADER = "# 課題（以降のすべてのタスクで共通）"
+    PROBLEM_CONTEXT_REFERENCE = "（共有コンテキスト冒頭の「課題」を参照してください）"
+
+    def _open_problem_context(self, problem_statement: str) -> bool:
+        """課題文を Context Cache に載せ、各プロンプトでの再送を省く。"""
+        self._context_cached_problem = None
+        create = getattr(self.client, "create_context_cache", None)
+        if create is None:
+            return False
+        if create([f"{self.PROBLEM_CONTEXT_HEADER}\n{problem_statement}"]):
+            self._context_cached_problem = problem_statement
+            return True
+        return False
+
+    def _close_problem_context(self) -> None:
+        if self._context_cached_problem is not None:
+            self.client.release_context_cache()
+            self._context_cached_problem = None
+
+    def _problem_for_prompt(self, problem_statement: str) -> str:
+        # Context Cache に載っている課題文は、プロンプト本文では参照だけにする
+        if problem_statement == self._context_cached_problem:
+            return self.PROBLEM_CONTEXT_REFERENCE
+        return problem_statement
 
     def _generate_agent_personas(self, problem_statement: str) -> Dict:
-        prompt = self.prompter.get_agent_personas_prompt(problem_statement)
-        return self._call_llm(prompt)
-
-    def _generate_initial_solutions(self, problem_statement: str, context: Dict) -> List[Dict[str, str]]:
-        prompt = self.prompter.get_initial_generation_prompt(problem_statement, self.num_solutions, context)
-        response = self._call_llm(prompt)
-        return response.get("solutions", []) if isinstance(response, dict) else []
-
-    def _evaluate_solutions(self, solutions: List[Dict[str, str]], problem_statement: str, context: Dict) -> Generator[str | List[Dict], None, None]:
-        evaluated_solutions = []
+        return self._get_loop().run_until_complete(self._start_agent_personas(problem_statement))
+
+    def _start_agent_personas(self, problem_statement: str) -> asyncio.Task:
+        """チーム編成を solver のループ上で開始する。他の処理と並行させたい場合は完了を待たずに使う。"""
+        prompt = self.prompter.get_agent_personas_prompt(self._problem_for_prompt(problem_statement))
+        refresh = getattr(self.client, "arefresh", None) if self.refresh_personas else None
+        if refresh is not None:
+            return self._get_loop().create_task(refresh(prompt, response_schema=AGENT_TEAM_SCHEMA))
+        return self._get_loop().create_task(self.client.acall(prompt, use_cache=not self.refresh_personas, response_schema=AGENT_TEAM_SCHEMA, semantic_key=problem_statement))
+
+    def _generate_initial_solutions(self, problem_statement: str, context: Dict) -> AsyncIterator[Dict[str, str]]:
+        """初期解を生成し、届いた順に1件ずつ返す。"""
+        problem = self._problem_for_prompt(problem_statement)
+        if self._use_parallel_generation:
+            prompts = [self.prompter.get_single_solution_prompt(problem, hint, context) for hint in aspect_hints(self.num_solutions)]
+            return self._fan_out_solutions(prompts)
+        prompt = self.prompter.get_initial_generation_prompt(problem, self.num_solutions, context)
+        return self._list_solutions(prompt)
+
+    @property
+    def _use_parallel_generation(self) -> bool:
+        return self.parallel_generation and self.num_solutions > 1
+
+    async def _list_solutions(self, prompt: str, use_cache: bool = True) -> AsyncIterator[Dict[str, str]]:
+        """全案を1回のリクエストでまとめて生成する（並列生成を使わない場合）。"""
+        response = await self.client.acall(prompt, use_cache, SOLUTION_LIST_SCHEMA)
+        for solution in self._solutions_in(response):
+            yield solution
+
+    async def _fan_out_solutions(self, prompts: List[str], use_cache: bool = True) -> AsyncIterator[Dict[str, str]]:
+        """
+        1案ずつのプロンプトを同時に発行し、届いた順に返す。
+        一部のリクエストが失敗しても残りの案で世代を続けられる。名前が重複した案は捨てる。
+        """
+        tasks = [asyncio.ensure_future(self.client.acall(prompt, use_cache, SOLUTION_SCHEMA)) for prompt in prompts]
+        seen = set()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    response = await next_done
+                except Exception:
+                    continue
+                for solution in self._solutions_in(response):
+                    name = solution.get("name")
+                    if name in seen:
+                        continue
+                    seen.add(name)
+                    yield solution
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def _solutions_in(response: Dict[str, Any]) -> List[Dict[str, str]]:
+        if not isinstance(response, dict) or "error" in response or "raw_text" in response:
+            return []
+        if isinstance(response.get("solutions"), list):
+            return [s for s in response["solutions"] if isinstance(s, dict)]
+        return [response] if "name" in response else []
+
+    @staticmethod
+    async def _anext(stream: AsyncIterator[Any]) -> Any:
+        return await stream.__anext__()
+
+    def _drain_progress(self, force: bool = False) -> Generator[str, None, None]:
+        message = self._progress.poll(force)
+        if message is not None:
+            yield message
+
+    def _evaluate_solutions(self, solutions: List[Dict[str, str]] | AsyncIterator[Dict[str, str]], problem_statement: str, evaluation_frame: tuple, generation_number: int = 0, carried: Optional[List[tuple]] = None) -> Generator[str | Generation, None, None]:
+        """
+        全解決策の評価リクエストを同時に発行し、完了した順に進捗を返す。
+        最後にスコア順に並べた Generation を yield する。
+        solutions にストリームが渡された場合は、受信の進捗を返しながら全件の到着を待ってから評価する。
+        evaluation_frame は PromptManager.build_evaluation_frame で solve ごとに1度だけ作ったもの。
+        carried には前世代から引き継ぐ (solution, evaluation) を渡す。これらは再評価しない。
+        """
+        loop = self._get_loop()
+        carried = carried or []
+        if carried:
+            yield self._progress.now(f"  - 前世代のエリート {len(carried)}件を評価済みのまま引き継ぎます")
+
+        if not isinstance(solutions, list):
+            received = []
+            next_item = None
+            while True:
+                # 受信待ちの間も、保留中の進捗は間隔が来たら表示する
+                if next_item is None:
+                    next_item = loop.create_task(self._anext(solutions))
+                done, _ = loop.run_until_complete(asyncio.wait({next_item}, timeout=self._progress.timeout()))
+                if next_item in done:
+                    try:
+                        solution = next_item.result()
+                    except StopAsyncIteration:
+                        break
+                    next_item = None
+                    received.append(solution)
+                    self._progress.update(f"  - 受信 {len(received)}: {solution.get('name', '名称不明')}")
+                yield from self._drain_progress()
+            yield from self._drain_progress(force=True)
+            solutions = received
+
+        self._received_count = len(solutions)
+        solutions = [solution for solution, _ in carried] + solutions
         if not solutions:
-            yield []
-            return
-
-        for i, solution in enumerate(solutions):
-            yield f"  - 評価中 {i+1}/{len(solutions)}: {solution.get('name', '名称不明')}"
-            prompt = self.prompter.get_evaluation_prompt(solution, problem_statement, context)
-            evaluation = self._call_llm(prompt)
-            if evaluation and "error" not in evaluation:
-                evaluated_solutions.append({"solution": solution, "evaluation": evaluation})
-
-        evaluated_solutions.sort(key=lambda x: x.get("evaluation", {}).get("total_score", 0), reverse=True)
-        yield evaluated_solutions
-
-    def _generate_next_generation(self, evaluated_solutions: List[Dict], problem_statement: str, context: Dict) -> List[Dict[str, str]]:
-        num_elites = max(1, int(len(evaluated_solutions) * 0.4))
-        elite_solutions = evaluated_solutions[:num_elites]
-        failed_solutions = evaluated_solutions[num_elites:]
-        prompt = self.prompter.get_next_generation_prompt(elite_solutions, failed_solutions, problem_statement, self.num_solutions, context)
-        response = self._call_llm(prompt)
-        return response.get("solutions", []) if isinstance(response, dict) else []
-
-    def solve(self, problem_statement: str, generations: int = 3) -> Generator[str | Dict, None, None]:
-        self.history = []
-
-        # STEP 1: AIエージェントチームの編成
-        yield "--- 🧠 課題を分析し、最適なAIエージェントチームを編成中... ---"
-        agent_personas = self._generate_agent_personas(problem_statement)
-
-        if not agent_personas or "error" in agent_personas or not all(k in agent_personas for k in ["initial_generator", "evaluator", "synthesizer"]):
-            yield "エラー: チーム編成に失敗しました。処理を中断します。"
-            yield f"**デバッグ情報:** AIからの応答が不正です。APIキーが正しいか確認してください。\n```\n{agent_personas}\n```"
+            yield self._rank_evaluations([], {}, generation_number)
             return
 
-        yield f"--- ✔️ チーム編成完了 ---"
-        yield {"agent_team": agent_personas}
-
-        # STEP 2: 最初のアイデア生成と評価
-        yield "\n--- 💡 Generation 0: 最初のアイデアを生成中... ---"
-        solutions = self._generate_initial_solutions(problem_statement, agent_personas["initial_generator"])
-
-        yield "--- 🧐 アイデアを評価中... ---"
-        eval_generator = self._evaluate_solutions(solutions, problem_statement, agent_personas["evaluator"])
-        evaluated_solutions = []
-        for item in eval_generator:
-            if isinstance(item, str):
-                yield item
+        evaluations: Dict[int, Dict] = {index: evaluation for index, (_, evaluation) in enumerate(carried)}
+
+        # 中身の欠けた案は評価を省いて0点にし、名前だけ変えて内容が同じ案は、過去の評価をそのまま使う
+        for index, solution in enumerate(solutions):
+            if index in evaluations:
+                continue
+            skipped = self._malformed_evaluation(solution)
+            if skipped is not None:
+                evaluations[index] = skipped
+                self._progress.update(f"  - 評価を省略（内容が不十分） {len(evaluations)}/{len(solutions)}: {solution.get('name', '名称不明')}")
+                continue
+            cached = self._cached_evaluation(solution)
+            if cached is not None:
+                evaluations[index] = cached
+                self._progress.update(f"  - 評価を再利用（キャッシュ命中） {len(evaluations)}/{len(solutions)}: {solution.get('name', '名称不明')}")
+        yield from self._drain_progress(force=True)
+
+        # 言い換えだけの案は、過去の評価をセマンティックキャッシュから再利用する。
+        # 未評価の案だけを1回の encode で埋め込み、1回の行列積でまとめて引く
+        vectors: Dict[int, np.ndarray] = {}
+        namespace = ""
+        pending_indices = [index for index in range(len(solutions)) if index not in evaluations]
+        if pending_indices and self.semantic_cache is not None and self.semantic_cache.enabled:
+            namespace = SemanticCache.namespace_for(problem_statement, evaluation_frame)
+            matrix = self.semantic_cache.embed([SemanticCache.solution_text(solutions[index]) for index in pending_indices])
+            if matrix is not None:
+                vectors = dict(zip(pending_indices, matrix))
+                for index, cached in zip(pending_indices, self.semantic_cache.lookup_many(namespace, matrix)):
+                    if cached is None:
+                        continue
+                    evaluations[index] = cached
+                    self._progress.update(f"  - 評価を再利用 {len(evaluations)}/{len(solutions)}: {solutions[index].get('name', '名称不明')}")
+                yield from self._drain_progress(force=True)
+
+        # まずは未評価の案をまとめて1回で評価し、検証に通らなかった分だけ個別評価に回す
+        remaining = {index: solution for index, solution in enumerate(solutions) if index not in evaluations}
+        if self.batch_evaluation and len(remaining) > 1:
+            yield self._progress.now(f"  - {len(remaining)}件の解決案を一括評価中...")
+            prompt = self.prompter.get_batch_evaluation_prompt(
+                {index: Solution.from_dict(solution) for index, solution in remaining.items()},
+                self._problem_for_prompt(problem_statement), *evaluation_frame
+            )
+            response = loop.run_until_complete(self.client.acall(prompt, response_schema=self._evaluation_schemas[1], candidate_count=self.evaluation_samples))
+            samples: Dict[int, List[Dict]] = {}
+            for candidate in self._candidates_of(response):
+                for index, evaluation in self._validate_batch_evaluations(candidate, remaining).items():
+                    samples.setdefault(index, []).append(evaluation)
+            batch_results = {index: self._median_evaluation(evaluations_of) for index, evaluations_of in samples.items()}
+            for index, evaluation in batch_results.items():
+                evaluations[index] = evaluation
+                self._remember_evaluation(solutions[index], evaluation, namespace, vectors.get(index))
+            if len(batch_results) < len(remaining):
+                yield self._progress.now(f"  - 一括評価で得られなかった {len(remaining) - len(batch_results)}件を個別に評価します")
             else:
-                evaluated_solutions = item
+                yield self._progress.now(f"  - 一括評価完了 {len(evaluations)}/{len(solutions)}")
+
+        tasks = {}
+        for index, solution in enumerate(solutions):
+            if index in evaluations:
+                continue
+            prompt = self._evaluation_prompt(solution, problem_statement, evaluation_frame)
+            tasks[loop.create_task(self._evaluate_one(prompt))] = index
+
+        pending = set(tasks)
+        while pending:
+            done, pending = loop.run_until_complete(asyncio.wait(pending, timeout=self._progress.timeout(), return_when=asyncio.FIRST_COMPLETED))
+            for task in done:
+                index = tasks[task]
+                evaluation = task.result() if task.exception() is None else {"error": str(task.exception())}
+                evaluations[index] = evaluation
+                self._remember_evaluation(solutions[index], evaluation, namespace, vectors.get(index))
+                self._progress.update(f"  - 評価完了 {len(evaluations)}/{len(solutions)}: {solutions[index].get('name', '名称不明')}")
+            yield from self._drain_progress()
+
+        yield from self._drain_progress(force=True)
+        yield self._rank_evaluations(solutions, evaluations, generation_number)
+
+    @staticmethod
+    def _content_key(solution: Dict[str, str]) -> str:
+        # 空白の揺れと大文字小文字の違いは同じ内容とみなす
+        normalized = "|".join(" ".join(str(solution.get(key, "")).split()).lower() for key in ("summary", "specific_method"))
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _malformed_evaluation(self, solution: Dict[str, str]) -> Optional[Dict]:
+        """概要か具体的方法が欠けている・概要が極端に短い案には、LLM を呼ばずに0点の評価を返す。"""
+        summary = str(solution.get("summary") or "").strip()
+        method = str(solution.get("specific_method") or "").strip()
+        if summary and method and len(summary) >= self.MIN_SUMMARY_CHARS:
+            return None
+        return {
+            "total_score": 0,
+            "scores": {},
+            "strengths": "",
+            "weaknesses": "概要または具体的方法が欠けているため、評価の対象外としました。",
+            "overall_comment": "出力が不完全な解決案のため、評価を省略して0点としました。",
+        }
 
-        self.history.append({"generation": 0, "results": evaluated_solutions})
-        yield self.history[-1]
+    def _cached_evaluation(self, solution: Dict[str, str]) -> Optional[Dict]:
+        cached = self._eval_cache.get(self._content_key(solution))
+        return dict(cached) if cached is not None else None
 
-        # STEP 3: 世代の進化
-        for i in range(1, generations):
-            yield f"\n--- 🚀 Generation {i}: 次のアイデアへ進化中... ---"
-            previous_generation_results = self.history[-1]["results"]
+    def _remember_evaluation(self, solution: Dict[str, str], evaluation: Dict, namespace: str = "", vector: Optional[np.ndarray] = None) -> None:
+        """採点できた評価だけを、内容ハッシュ（完全一致）と意味的キャッシュ（近似一致）に登録する。"""
+        if not isinstance(evaluation, dict) or not isinstance(evaluation.get("total_score"), (int, float)):
+            return
+        self._eval_cache[self._content_key(solution)] = evaluation
+        if vector is not None:
+            self.semantic_cache.add(namespace, vector, evaluation)
+
+    def _evaluation_prompt(self, solution: Dict[str, str], problem_statement: str, evaluation_frame: tuple) -> str:
+        # 評価プロンプトの前半は課題と評価基準が同じ間は使い回し、案ごとには名称と概要を連結するだけにする
+        key = (problem_statement, evaluation_frame)
+        if self._evaluator_prefix is None or self._evaluator_prefix[0] != key:
+            prefix = self.prompter.build_evaluator_prefix(self._problem_for_prompt(problem_statement), *evaluation_frame)
+            self._evaluator_prefix = (key, prefix)
+        return self.prompter.render_evaluation(self._evaluator_prefix[1], Solution.from_dict(solution))
+
+    async def _evaluate_one(self, prompt: str) -> Dict[str, Any]:
+        response = await self.client.acall(prompt, response_schema=self._evaluation_schemas[0], candidate_count=self.evaluation_samples)
+        candidates = self._candidates_of(response)
+        scored = [c for c in candidates if isinstance(c.get("total_score"), (int, float))]
+        if not scored:
+            # 採点できた候補が無い場合は、エラーや生テキストをそのまま返して従来どおり除外させる
+            return candidates[0] if candidates else response
+        return self._median_evaluation(scored)
+
+    @staticmethod
+    def _candidates_of(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if isinstance(response, dict) and isinstance(response.get("candidates"), list):
+            return [c for c in response["candidates"] if isinstance(c, dict)]
+        return [response] if isinstance(response, dict) else []
+
+    @staticmethod
+    def _median_evaluation(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        同じ案に対する複数の評価を1つにまとめる。total_score と各基準の点数は中央値をとり、
+        コメント類は中央値に最も近い評価のものを使う。
+        """
+        if len(samples) == 1:
+            return samples[0]
+        median = statistics.median(sample["total_score"] for sample in samples)
+        result = dict(min(samples, key=lambda sample: abs(sample["total_score"] - median)))
+        result["total_score"] = int(round(median))
+        scores = [sample.get("scores") for sample in samples]
+        if all(isinstance(item, dict) for item in scores):
+            merged = {}
+            for criterion in scores[0]:
+                values = [item.get(criterion) for item in scores]
+                if all(isinstance(value, (int, float)) for value in values):
+                    merged[criterion] = int(round(statistics.median(values)))
+                else:
+                    merged[criterion] = scores[0][criterion]
+            result["scores"] = merged
+        result["score_samples"] = [sample["total_score"] for sample in samples]
+        return result
+
+    @staticmethod
+    def _validate_batch_evaluations(response: Dict[str, Any], expected: Dict[int, Dict[str, str]]) -> Dict[int, Dict]:
+        """一括評価の応答から、ID が対応し total_score が数値の評価だけを取り出す。"""
+        results: Dict[int, Dict] = {}
+        items = response.get("evaluations") if isinstance(response, dict) else None
+        if not isinstance(items, list):
+            return results
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.get("id"))
+            except (TypeError, ValueError):
+                continue
+            if index in expected and index not in results and isinstance(item.get("total_score"), (int, float)):
+                results[index] = {k: v for k, v in item.items() if k != "id"}
+        return results
+
+    def _rank_evaluations(self, solutions: List[Dict[str, str]], evaluations: Dict[int, Dict], generation_number: int = 0) -> Generation:
+        return Generation.from_evaluations(generation_number, solutions, evaluations)
+
+    @staticmethod
+    def _num_elites(generation: Generation) -> int:
+        return max(1, int(len(generation) * 0.4))
+
+    def _next_generation_stream(self, generation: Generation, num_elites: int, problem_statement: str, context: Dict) -> AsyncIterator[Dict[str, str]]:
+        elite_text = "\n".join(generation.score_lines[:num_elites])
+        failed_text = "\n".join(generation.weakness_lines[num_elites:])
+        problem = self._problem_for_prompt(problem_statement)
+        # 次世代生成は毎回新しい案を得たいのでキャッシュを使わない
+        if self._use_parallel_generation:
+            prompts = [
+                self.prompter.get_single_next_solution_prompt(elite_text, failed_text, problem, hint, context)
+                for hint in aspect_hints(self.num_solutions)
+            ]
+            return self._fan_out_solutions(prompts, use_cache=False)
+        prompt = self.prompter.get_next_generation_prompt(elite_text, failed_text, problem, self.num_solutions, context)
+        return self._list_solutions(prompt, use_cache=False)
+
+    def _generate_next_generation(self, previous: Generation, problem_statement: str, context: Dict) -> AsyncIterator[Dict[str, str]]:
+        return self._next_generation_stream(previous, self._num_elites(previous), problem_statement, context)
+
+    @staticmethod
+    def _best_score(generation: Generation) -> int:
+        return int(generation.scores[0]) if len(generation) else 0
+
+    def _record_generation(self, generation: Generation) -> None:
+        self.generations.append(generation)
+        self.history.append(generation.to_dict())
+        gen_index = len(self.generations) - 1
+        self._all_scores.extend(generation.scores.tolist())
+        self._all_items.extend((gen_index, rank) for rank in range(len(generation)))
+
+    def _item_at(self, index: int) -> tuple:
+        gen_index, rank = self._all_items[index]
+        generation = self.generations[gen_index]
+        return generation.solutions[rank], generation.evaluations[rank]
+
+    def best_solution(self) -> Optional[Dict[str, Any]]:
+        """全世代を通した最高スコアの解決案を返す。"""
+        if not self._all_scores:
+            return None
+        solution, evaluation = self._item_at(int(np.argmax(np.asarray(self._all_scores, dtype=np.int32))))
+        return {"solution": solution, "evaluation": evaluation}
+
+    def top_solutions(self, k: int = 5) -> List[Dict[str, Any]]:
+        """全世代を通したスコア上位 k 件を {"solution", "evaluation"} の形で返す。"""
+        # 引き継がれたエリートは複数の世代に現れるため、同じ解決案は1度だけ数える
+        candidates: List[EvaluatedSolution] = []
+        seen = set()
+        for generation in self.generations:
+            for item in generation.ranked():
+                # total_score を返さなかった評価はランキングの対象外にする
+                if "total_score" not in item.evaluation or id(item.solution) in seen:
+                    continue
+                seen.add(id(item.solution))
+                candidates.append(item)
+        # 全件の整列はせず、整数化済みの score だけを見て上位 k 件をヒープで取り出す（同点は先に記録された順）
+        return [item.to_dict() for item in heapq.nlargest(k, candidates, key=operator.attrgetter("score"))]
+
+    def solve(self, problem_statement: str, generations: int = 3, agent_personas: Optional[Dict] = None) -> Generator[str | Dict, None, None]:
+        """agent_personas を渡した場合はチーム編成を省き、それを使う（先行して編成済みの場合）。"""
+        self.history = []
+        self._eval_cache = {}
+        self.generations = []
+        self._all_scores = []
+        self._all_items = []
 
-            solutions = self._generate_next_generation(previous_generation_results, problem_statement, agent_personas["synthesizer"])
+        try:
+            # 課題文を Context Cache に載せられれば、以降のプロンプトは差分だけを送る
+            if self._open_problem_context(problem_statement):
+                yield "--- 📦 課題文をコンテキストキャッシュに登録しました ---"
+
+            # STEP 1: AIエージェントチームの編成
+            if agent_personas is None:
+                yield "--- 🧠 課題を分析し、最適なAIエージェントチームを編成中... ---"
+                agent_personas = self._generate_agent_personas(problem_statement)
+
+            if not agent_personas or "error" in agent_personas or not all(k in agent_personas for k in ["initial_generator", "evaluator", "synthesizer"]):
+                yield "エラー: チーム編成に失敗しました。処理を中断します。"
+                yield f"**デバッグ情報:** AIからの応答が不正です。APIキーが正しいか確認してください。\n```\n{agent_personas}\n```"
+                return
+
+            yield f"--- ✔️ チーム編成完了 ---"
+            yield {"_kind": "agent_team", "data": agent_personas}
+            evaluation_frame = self.prompter.build_evaluation_frame(agent_personas["evaluator"])
+            self._evaluation_schemas = (
+                build_evaluation_schema(agent_personas["evaluator"]),
+                build_evaluation_schema(agent_personas["evaluator"], batch=True),
+            )
 
-            if not solutions:
-                yield f"エラー: Generation {i} の解決策生成に失敗しました。AIが適切な応答を返さなかった可能性があります。処理を終了します。"
-                break
+            # STEP 2: 最初のアイデア生成と評価
+            yield "\n--- 💡 Generation 0: 最初のアイデアを生成中... ---"
+            solutions = self._generate_initial_solutions(problem_statement, agent_personas["initial_generator"])
 
-            yield f"--- 🧐 Generation {i} のアイデアを評価中... ---"
-            eval_generator_next = self._evaluate_solutions(solutions, problem_statement, agent_personas["evaluator"])
-            evaluated_solutions_next = []
-            for item in eval_generator_next:
+            eval_generator = self._evaluate_solutions(solutions, problem_statement, evaluation_frame, generation_number=0)
+            generation = None
+            for item in eval_generator:
                 if isinstance(item, str):
                     yield item
                 else:
-                    evaluated_solutions_next = item
-
-            self.history.append({"generation": i, "results": evaluated_solutions_next})
-            yield self.history[-1]
-
-        yield "\n--- ✅ 進化プロセス完了 ---"
+                    generation = item
+
+            self._record_generation(generation)
+            yield {"_kind": "generation", "data": self.history[-1]}
+
+            # STEP 3: 世代の進化
+            best_scores_per_gen = [self._best_score(generation)]
+            for i in range(1, generations):
+                yield f"\n--- 🚀 Generation {i}: 次のアイデアへ進化中... ---"
+                previous = self.generations[-1]
+                solutions = self._generate_next_generation(previous, problem_statement, agent_personas["synthesizer"])
+                # 前世代のエリートは評価ごと引き継ぎ、LLM での再評価を省く
+                num_elites = self._num_elites(previous) if len(previous) else 0
+                carried = list(zip(previous.solutions[:num_elites], previous.evaluations[:num_elites]))
+
+                yield f"--- 🧐 Generation {i} のアイデアを評価中... ---"
+                eval_generator_next = self._evaluate_solutions(solutions, problem_statement, evaluation_frame, generation_number=i, carried=carried)
+                generation_next = None
+                for item in eval_generator_next:
+                    if isinstance(item, str):
+                        yield item
+                    else:
+                        generation_next = item
+
+                if not self._received_count:
+                    yield f"エラー: Generation {i} の解決策生成に失敗しました。AIが適切な応答を返さなかった可能性があります。処理を終了します。"
+                    break
+
+                self._record_generation(generation_next)
+                yield {"_kind": "generation", "data": self.history[-1]}
+
+                # 最高スコアが頭打ちになったら、残りの世代を回さずに終了する
+                best_scores_per_gen.append(self._best_score(generation_next))
+                patience = self.early_stop_patience
+                if patience > 0 and i < generations - 1 and len(best_scores_per_gen) > patience \
+                        and max(best_scores_per_gen[-patience:]) <= best_scores_per_gen[-patience - 1]:
+                    yield f"--- ⏹️ 最高スコアが {patience} 世代更新されなかったため、Generation {i} で進化を打ち切ります ---"
+                    break
+
+            best = self.best_solution()
+            if best is not None:
+                yield f"\n--- ✅ 進化プロセス完了（最高スコア: {best['evaluation'].get('total_score', 'N/A')}「{best['solution'].get('name', 'N/A')}」） ---"
+            else:
+                yield "\n--- ✅ 進化プロセス完了 ---"
+        finally:
+            self._close_problem_context()
+            self._close_loop()
 
 # EvoGenSolver_Tavily: Tavily 統合版
 class EvoGenSolver_Tavily(EvoGenSolver):
@@ -312,11 +1640,85 @@ class EvoGenSolver_Tavily(EvoGenSolver):
     Tavily を用いて課題に関連する最新情報を収集し、その情報を
     問題文に組み込んで EvoGen のフローを回す拡張版。
     """
-    def __init__(self, llm_client: LLMClient, tavily_client: TavilyClient, num_solutions_per_generation: int = 5, tavily_results_per_search: int = 5):
-        super().__init__(llm_client, num_solutions_per_generation)
+    NUM_SEARCH_QUERIES = 3
+    # 要約プロンプトに載せる抜粋の上限（件数・1件あたりの文字数）と、重複とみなす類似度
+    MAX_SNIPPETS = 8
+    SNIPPET_MAX_CHARS = 400
+    SNIPPET_DUPLICATE_JACCARD = 0.8
+
+    def __init__(self, llm_client: LLMClient, tavily_client: TavilyClient | AsyncTavilyClient, num_solutions_per_generation: int = 5, tavily_results_per_search: int = 5, semantic_cache: Optional[SemanticCache] = None):
+        super().__init__(llm_client, num_solutions_per_generation, semantic_cache)
         self.tavily = tavily_client
         self.tavily_results_per_search = tavily_results_per_search
 
+    async def _generate_tavily_queries(self, problem_statement: str) -> List[str]:
+        """課題から観点の異なる検索クエリを作る。失敗した場合は課題文そのものを1件のクエリにする。"""
+        prompt = self.prompter.get_tavily_queries_prompt(problem_statement, self.NUM_SEARCH_QUERIES)
+        response = await self.client.acall(prompt, response_schema=TAVILY_QUERIES_SCHEMA, semantic_key=problem_statement)
+        queries = response.get("queries") if isinstance(response, dict) else None
+        queries = [q.strip() for q in queries if isinstance(q, str) and q.strip()] if isinstance(queries, list) else []
+        return queries[:self.NUM_SEARCH_QUERIES] or [problem_statement]
+
+    async def _multi_search(self, queries: List[str]) -> Dict[str, Any]:
+        """
+        全クエリの検索を同時に発行し、URL で重複を除いて結果をまとめる。
+        まとめた件数は 1検索あたりの件数の2倍までにする。全件失敗した場合だけエラーを返す。
+        """
+        if asyncio.iscoroutinefunction(self.tavily.search):
+            searches = [self.tavily.search(query, num_results=self.tavily_results_per_search) for query in queries]
+        else:
+            # 同期クライアントはデフォルトの executor で並行させる
+            loop = asyncio.get_running_loop()
+            searches = [
+                loop.run_in_executor(None, functools.partial(self.tavily.search, query, num_results=self.tavily_results_per_search))
+                for query in queries
+            ]
+        try:
+            responses = await asyncio.gather(*searches)
+        finally:
+            # 検索は solve ごとにここで1度だけ行うため、AsyncClient もここで閉じる
+            aclose = getattr(self.tavily, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        valid = [r for r in responses if isinstance(r, dict) and "error" not in r]
+        if not valid:
+            return responses[0] if responses and isinstance(responses[0], dict) else {"error": "Unknown Tavily response"}
+
+        seen_urls = set()
+        merged = []
+        for response in valid:
+            for result in response.get("results", []) or []:
+                url = result.get("url", "") if isinstance(result, dict) else ""
+                if not url or url in seen_urls:
+                    continue
+                seen_urls.add(url)
+                merged.append(result)
+        return {"results": merged[:self.tavily_results_per_search * 2], "queries": queries}
+
+    @staticmethod
+    def _snippet_of(result: Dict[str, Any]) -> str:
+        return result.get("snippet", "") or result.get("content", "") or result.get("description", "")
+
+    @staticmethod
+    def _shingles(text: str, size: int = 5) -> set:
+        # 日本語は空白で区切れないため、文字単位の n-gram で比較する
+        text = "".join(text.split())
+        return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+    def _dedupe_snippets(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """抜粋のシングル集合の Jaccard 係数がしきい値以上の結果は、先に出たものだけを残す。"""
+        kept: List[Dict[str, Any]] = []
+        kept_shingles: List[set] = []
+        for result in results:
+            if not isinstance(result, dict):
+                continue
+            shingles = self._shingles(self._snippet_of(result)[:self.SNIPPET_MAX_CHARS])
+            if any(len(shingles & other) / len(shingles | other) >= self.SNIPPET_DUPLICATE_JACCARD for other in kept_shingles):
+                continue
+            kept.append(result)
+            kept_shingles.append(shingles)
+        return kept
+
     def _summarize_tavily_results_with_llm(self, tavily_results: Dict[str, Any], problem_statement: str) -> str:
         """
         Tavily の検索結果を LLM に要約させ、問題文に統合する。
@@ -326,23 +1728,25 @@ class EvoGenSolver_Tavily(EvoGenSolver):
         if not results:
             return problem_statement
 
+        # URL は LLM に見せず、番号 -> 出典の対応表だけを手元に残して引用の復元に使う
+        results = self._dedupe_snippets(results)[:self.MAX_SNIPPETS]
+        sources_map = {i: r for i, r in enumerate(results, start=1)}
         snippet_texts = []
-        for r in results[:min(len(results), 8)]:
-            title = r.get("title", "")
-            snippet = r.get("snippet", "") or r.get("description", "")
-            url = r.get("url", "")
-            snippet_texts.append(f"Title: {title}\nSnippet: {snippet}\nURL: {url}\n---")
+        for i, r in sources_map.items():
+            snippet = self._snippet_of(r)[:self.SNIPPET_MAX_CHARS]
+            snippet_texts.append(f"[{i}] {r.get('title', '')} — {snippet}")
 
         combined = "\n".join(snippet_texts)
         prompt = f"""
-        以下は、Tavily によって取得されたウェブ検索結果の抜粋です。各結果は出典（URL）を持ちます。
+        以下は、Tavily によって取得されたウェブ検索結果の抜粋です。各結果には [番号] が付いています。
         あなたはこの情報を3点セットで要約し、課題にとって「特に重要な事実/データ」「潜在的な制約やリスク」「引用すべき出典(最大3つ)」を簡潔に整理して下さい。
+        出典は抜粋の番号で示してください。
         出力は必ず JSON 形式で以下のキーを持ってください:
         {{
           "summary": "簡潔な要約（日本語、3-4文）",
           "key_points": ["重要な事実1", "重要な事実2"],
           "risks": ["リスク1", "リスク2"],
-          "top_sources": [{{"title":"...", "url":"..."}}]
+          "top_sources": [1, 2]
         }}
 
         ### Tavily Results (抜粋)
@@ -351,7 +1755,7 @@ class EvoGenSolver_Tavily(EvoGenSolver):
         ### 元の課題:
         {problem_statement}
         """
-        llm_ret = self._call_llm(prompt)
+        llm_ret = self._call_llm(prompt, response_schema=TAVILY_SUMMARY_SCHEMA)
         
         if isinstance(llm_ret, dict):
             if any(k in llm_ret for k in ["summary", "key_points", "top_sources", "risks"]):
@@ -360,7 +1764,8 @@ class EvoGenSolver_Tavily(EvoGenSolver):
                     kp = llm_ret.get("key_points", [])
                     risks = llm_ret.get("risks", [])
                     top = llm_ret.get("top_sources", [])
-                    top_text = "\n".join([f"- {s.get('title','')}: {s.get('url','')}" for s in top]) if isinstance(top, list) else ""
+                    cited = [sources_map[s] for s in top if isinstance(s, int) and s in sources_map] if isinstance(top, list) else []
+                    top_text = "\n".join([f"- {s.get('title','')}: {s.get('url','')}" for s in cited])
                     composed = f"## Tavily要約（LLM生成）\n{summary_text}\n\n重要点:\n" + "\n".join([f"- {p}" for p in kp]) + "\n\nリスク:\n" + "\n".join([f"- {r}" for r in risks]) + "\n\n出典:\n" + top_text + "\n\n" + problem_statement
                     return composed
                 except Exception:
@@ -377,29 +1782,86 @@ class EvoGenSolver_Tavily(EvoGenSolver):
                    "最新のウェブ情報を参照しました。上位出典:\n" + "\n".join(fallback_sources) + "\n\n" + problem_statement
         return fallback
 
-    def solve(self, problem_statement: str, generations: int = 3) -> Generator[str | Dict, None, None]:
-        yield "--- 🌐 Tavily による関連情報の検索を開始しています... ---"
-        tavily_resp = self.tavily.search(problem_statement, num_results=self.tavily_results_per_search)
-
-        if not isinstance(tavily_resp, dict) or "error" in tavily_resp:
-            err = tavily_resp.get("error", "Unknown error") if isinstance(tavily_resp, dict) else "Unknown Tavily response"
-            yield f"エラー: Tavily API の呼び出しに失敗しました: {err}"
-            return
+    def solve(self, problem_statement: str, generations: int = 3, agent_personas: Optional[Dict] = None) -> Generator[str | Dict, None, None]:
+        loop = self._get_loop()
+        try:
+            # チーム編成は元の課題文だけで決まるため、Tavily の検索・要約と並行して進めておく
+            personas_task = self._start_agent_personas(problem_statement) if agent_personas is None else None
+            yield "--- 🌐 検索クエリの作成と、AIエージェントチームの編成を並行して開始しています... ---"
+            queries = loop.run_until_complete(self._generate_tavily_queries(problem_statement))
+            yield f"--- 🔎 Tavily で {len(queries)}件のクエリを同時に検索しています... ---"
+            tavily_resp = loop.run_until_complete(self._multi_search(queries))
 
-        yield {"tavily_info": tavily_resp}
+            if not isinstance(tavily_resp, dict) or "error" in tavily_resp:
+                err = tavily_resp.get("error", "Unknown error") if isinstance(tavily_resp, dict) else "Unknown Tavily response"
+                yield f"エラー: Tavily API の呼び出しに失敗しました: {err}"
+                return
 
-        yield "--- ✍️ Tavily 結果を要約し、問題文に統合します... ---"
-        try:
-            augmented_problem = self._summarize_tavily_results_with_llm(tavily_resp, problem_statement)
-        except Exception as e:
-            augmented_problem = problem_statement
-            yield f"警告: Tavily 要約中にエラーが発生しました: {e}"
+            yield {"_kind": "tavily", "data": tavily_resp}
 
-        yield from super().solve(augmented_problem, generations)
+            yield "--- ✍️ Tavily 結果を要約し、問題文に統合します... ---"
+            try:
+                augmented_problem = self._summarize_tavily_results_with_llm(tavily_resp, problem_statement)
+            except Exception as e:
+                augmented_problem = problem_statement
+                yield f"警告: Tavily 要約中にエラーが発生しました: {e}"
+
+            if personas_task is not None:
+                if not personas_task.done():
+                    yield "--- 🧠 AIエージェントチームの編成完了を待っています... ---"
+                agent_personas = loop.run_until_complete(personas_task)
+            yield from super().solve(augmented_problem, generations, agent_personas=agent_personas)
+        finally:
+            # 途中で中断・失敗した場合も、並行中のチーム編成を取り消してループを閉じる
+            self._close_loop()
 
 # ----------------------------
 # 5) Streamlit UI
 # ----------------------------
+_WORKER_DONE = object()
+
+def iterate_in_background(events: Generator[Any, None, None], poll_interval: float = 0.1) -> Generator[Any, None, None]:
+    """
+    solve のジェネレータをワーカースレッドで回し、yield された項目をキュー経由で受け取る。
+    LLM・検索の通信待ちはワーカー側で進むため、スクリプト側は描画に専念できる。
+    ワーカーにもスクリプトのコンテキストを引き継ぎ、st.error などをそこから呼べるようにする。
+    キューは poll_interval ごとに待ちを区切り、停止・再実行を次の項目の到着まで待たせない。
+    """
+    items: "queue.Queue[Any]" = queue.Queue()
+    stop = threading.Event()
+
+    def worker():
+        try:
+            for item in events:
+                if stop.is_set():
+                    break
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            # 途中で止めた場合も、solve の finally（ループの後始末など）をこのスレッドで確実に実行する
+            events.close()
+            items.put(_WORKER_DONE)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    if add_script_run_ctx is not None and get_script_run_ctx is not None:
+        add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    try:
+        while True:
+            try:
+                item = items.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+            if item is _WORKER_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # 描画側が途中で抜けた場合は、ワーカーにも次の区切りで止まるよう伝える
+        stop.set()
+
 st.set_page_config(page_title="EvoGen AI + Tavily", layout="wide")
 st.title("EvoGen AI (Tavily 統合版) 🧬🌐")
 st.markdown("Tavily による最新ウェブ情報を参照しながら、AIエージェントチームが進化的に解決策を探索します。")
@@ -413,6 +1875,7 @@ with st.sidebar:
     num_generations = st.slider("世代数", 1, 5, 2, help="解決策を進化させる回数です。")
     num_solutions = st.slider("世代ごとの解決策の数", 3, 10, 4, help="1世代あたりに生成・評価する解決策の数です。")
     tavily_results_per_search = st.slider("Tavily 検索結果数", 1, 10, 5, help="Tavily から取得する検索結果数。")
+    refresh_personas = st.checkbox("AIエージェントチームを再編成する", value=False, help="同じ課題で保存済みのチーム編成や実行結果を使わず、作り直します。")
     st.markdown("---")
     st.info("Tavily を使って課題に関連する最新情報を取得し、それを参考に解決策を生成します。")
 
@@ -444,110 +1907,134 @@ if st.button("解決策の生成を開始", type="primary"):
         results_area = st.container()
         final_result_placeholder = st.container()
 
+        # 同じ課題・パラメータの実行結果があれば、LLM を呼ばずにそれを再生する
+        run_store = get_run_store()
+        run_key = RunStore.key_for(
+            [gemini_key, tavily_key], problem_statement,
+            generations=num_generations, num_solutions=num_solutions,
+            tavily_results=tavily_results_per_search, model_name="gemini-2.5-flash"
+        )
+        cached_run = run_store.get(run_key) if not refresh_personas else None
+        recorded_events: List[Any] = []
+
         with st.spinner("🌀 AIが思考中です..."):
-            try:
-                gemini_client = GeminiClient(api_key=gemini_key)
-                tavily_client = TavilyClient(api_key=tavily_key)
-            except Exception as e:
-                st.error(f"クライアントの初期化に失敗しました: {e}")
-                st.stop()
-
-            solver = EvoGenSolver_Tavily(
-                llm_client=gemini_client,
-                tavily_client=tavily_client,
-                num_solutions_per_generation=num_solutions,
-                tavily_results_per_search=tavily_results_per_search
-            )
+            if cached_run is not None:
+                st.info("同じ条件での実行結果が保存されていたため、それを再表示します。")
+                events = cached_run["events"]
+            else:
+                try:
+                    # ペルソナ編成と検索クエリ作成は、課題文が言い換え程度の差なら近似一致でも再利用する
+                    gemini_client = CachedLLMClient(GeminiClient(api_key=gemini_key), semantic_cache=get_prompt_cache())
+                    # httpx があれば、同時検索を1本の HTTP/2 接続に多重化する非同期クライアントを使う
+                    tavily_client = AsyncTavilyClient(api_key=tavily_key) if httpx is not None else TavilyClient(api_key=tavily_key)
+                except Exception as e:
+                    st.error(f"クライアントの初期化に失敗しました: {e}")
+                    st.stop()
+
+                solver = EvoGenSolver_Tavily(
+                    llm_client=gemini_client,
+                    tavily_client=tavily_client,
+                    num_solutions_per_generation=num_solutions,
+                    tavily_results_per_search=tavily_results_per_search,
+                    semantic_cache=get_semantic_cache()
+                )
+                solver.refresh_personas = refresh_personas
+                events = iterate_in_background(solver.solve(problem_statement, generations=num_generations))
 
             # --- Solverを実行し、結果をUIにストリーミング表示 ---
-            for result in solver.solve(problem_statement, generations=num_generations):
+            def render_tavily(tavily_data):
+                with tavily_placeholder.container():
+                    st.subheader("🌐 Tavily 検索結果（出典付き）")
+                    if tavily_data.get("queries"):
+                        st.caption("検索クエリ: " + " / ".join(tavily_data["queries"]))
+                    if "results" in tavily_data and isinstance(tavily_data["results"], list):
+                        for r in tavily_data["results"]:
+                            title = r.get("title", "No title")
+                            url = r.get("url", "")
+                            snippet = r.get("snippet", "") or r.get("description", "")
+                            st.markdown(f"- [{title}]({url})")
+                            if snippet:
+                                st.caption(snippet)
+                    else:
+                        st.warning("Tavily から想定外のレスポンスが返ってきました。")
+                        st.text(dumps_json(tavily_data, indent=True))
+
+            def render_team(team):
+                with team_placeholder.container():
+                    st.subheader("🤖 編成されたAIエージェントチーム")
+                    with st.expander("チームの詳細を表示"):
+                        gen = team.get("initial_generator", {})
+                        st.markdown("##### 💡 アイデア生成担当")
+                        st.markdown(f"**役割:** {gen.get('role', '未定義')}")
+                        st.markdown(f"**指示:** {gen.get('instructions', '未定義')}")
+                        eva = team.get("evaluator", {})
+                        st.markdown("##### 🧐 評価担当")
+                        st.markdown(f"**役割:** {eva.get('role', '未定義')}")
+                        criteria_list = eva.get('criteria', [])
+                        criteria_md = ""
+                        if criteria_list:
+                            for c in criteria_list:
+                                criteria_md += f"- **{c.get('criterion', '項目名なし')}:** {c.get('weight', 0)}点\n"
+                        st.markdown(f"**評価基準:**\n{criteria_md or '未定義'}")
+                        syn = team.get("synthesizer", {})
+                        st.markdown("##### 🧬 進化・統合担当")
+                        st.markdown(f"**役割:** {syn.get('role', '未定義')}")
+                        st.markdown(f"**指示:** {syn.get('instructions', '未定義')}")
+
+            # === ここから修正箇所 (1) ===
+            def render_generation(gen_data):
+                with results_area.container():
+                    st.subheader(f"第 {gen_data['generation']} 世代の結果")
+                    with st.container(border=True):
+                        results = gen_data.get('results', [])
+                        if not results:
+                            st.write("この世代では有効な解決策が生成されませんでした。")
+                            return
+
+                        last = len(results) - 1
+                        for i, item in enumerate(results):
+                            sol = item.get('solution', {})
+                            eva = item.get('evaluation', {})
+                            score = eva.get('total_score', 0)
+
+                            # 依頼に沿った「題名」と「内容」の形式で表示
+                            st.markdown(f"**題名:** {sol.get('name', 'N/A')} (スコア: {score})")
+                            content = sol.get('summary', 'N/A')
+                            st.markdown(f"**内容:** {content}")
+
+                            # 各解決案の区切り線
+                            if i != last:
+                                st.markdown("---")
+            # === ここまで修正箇所 (1) ===
+
+            # Solver は進捗を文字列で、それ以外を {"_kind": ..., "data": ...} で返すので、種別で描画関数を引く
+            HANDLERS = {
+                "tavily": render_tavily,
+                "agent_team": render_team,
+                "generation": render_generation,
+            }
+
+            for result in events:
+                if cached_run is None:
+                    recorded_events.append(result)
+
                 if isinstance(result, str):
                     status_placeholder.info(result)
-
-                elif isinstance(result, dict) and "tavily_info" in result:
-                    tavily_data = result["tavily_info"]
-                    with tavily_placeholder.container():
-                        st.subheader("🌐 Tavily 検索結果（出典付き）")
-                        if "results" in tavily_data and isinstance(tavily_data["results"], list):
-                            for r in tavily_data["results"]:
-                                title = r.get("title", "No title")
-                                url = r.get("url", "")
-                                snippet = r.get("snippet", "") or r.get("description", "")
-                                st.markdown(f"- [{title}]({url})")
-                                if snippet:
-                                    st.caption(snippet)
-                        else:
-                            st.warning("Tavily から想定外のレスポンスが返ってきました。")
-                            st.text(json.dumps(tavily_data, ensure_ascii=False, indent=2))
-
-                elif isinstance(result, dict) and "agent_team" in result:
-                    with team_placeholder.container():
-                        st.subheader("🤖 編成されたAIエージェントチーム")
-                        team = result["agent_team"]
-                        with st.expander("チームの詳細を表示"):
-                            gen = team.get("initial_generator", {})
-                            st.markdown("##### 💡 アイデア生成担当")
-                            st.markdown(f"**役割:** {gen.get('role', '未定義')}")
-                            st.markdown(f"**指示:** {gen.get('instructions', '未定義')}")
-                            eva = team.get("evaluator", {})
-                            st.markdown("##### 🧐 評価担当")
-                            st.markdown(f"**役割:** {eva.get('role', '未定義')}")
-                            criteria_list = eva.get('criteria', [])
-                            criteria_md = ""
-                            if criteria_list:
-                                for c in criteria_list:
-                                    criteria_md += f"- **{c.get('criterion', '項目名なし')}:** {c.get('weight', 0)}点\n"
-                            st.markdown(f"**評価基準:**\n{criteria_md or '未定義'}")
-                            syn = team.get("synthesizer", {})
-                            st.markdown("##### 🧬 進化・統合担当")
-                            st.markdown(f"**役割:** {syn.get('role', '未定義')}")
-                            st.markdown(f"**指示:** {syn.get('instructions', '未定義')}")
-
-                # === ここから修正箇所 (1) ===
-                elif isinstance(result, dict) and "generation" in result:
-                    gen_data = result
-                    with results_area.container():
-                        st.subheader(f"第 {gen_data['generation']} 世代の結果")
-                        with st.container(border=True):
-                            if not gen_data.get('results'):
-                                st.write("この世代では有効な解決策が生成されませんでした。")
-                                continue
-                            
-                            for item in gen_data.get('results', []):
-                                sol = item.get('solution', {})
-                                eva = item.get('evaluation', {})
-                                score = eva.get('total_score', 0)
-                                
-                                # 依頼に沿った「題名」と「内容」の形式で表示
-                                st.markdown(f"**題名:** {sol.get('name', 'N/A')} (スコア: {score})")
-                                content = sol.get('summary', 'N/A')
-                                st.markdown(f"**内容:** {content}")
-                                
-                                # 各解決案の区切り線
-                                if item != gen_data.get('results', [])[-1]:
-                                    st.markdown("---")
-                # === ここまで修正箇所 (1) ===
+                else:
+                    HANDLERS[result["_kind"]](result["data"])
 
         # === ここから修正箇所 (2) ===
         # --- 最終結果の表示（トップ5ランキング） ---
         
-        # すべての世代から評価済みの解決策を収集
-        all_solutions = [
-            item for gen in solver.history
-            for item in gen.get("results", [])
-            if item.get("evaluation") and "total_score" in item["evaluation"]
-        ]
-
-        if all_solutions:
-            # スコアで降順にソート
-            sorted_solutions = sorted(
-                all_solutions,
-                key=lambda x: x["evaluation"]["total_score"],
-                reverse=True
-            )
-            
-            top_5_solutions = sorted_solutions[:5]
+        # すべての世代から、スコア上位5件を取り出す
+        if cached_run is not None:
+            top_5_solutions = cached_run["top_solutions"]
+        else:
+            top_5_solutions = solver.top_solutions(5)
+            if top_5_solutions:
+                run_store.put(run_key, recorded_events, top_5_solutions)
 
+        if top_5_solutions:
             status_placeholder.empty()
             st.balloons()
 
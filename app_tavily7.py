@@ -21,6 +21,8 @@ v8 の特徴 (v7から変更):
 使い方:
   - 必要ライブラリ:
       pip install streamlit requests google-generativeai
+  - 任意ライブラリ（あれば自動で利用）:
+      pip install orjson
   - 実行:
       streamlit run app_tavily_fixed_v9_mutation_json_repair.py
 """
@@ -32,6 +34,15 @@ import abc
 from typing import List, Dict, Any, Generator, Optional
 import time
 import random 
+import datetime
+import threading
+import asyncio
+import queue
+import hashlib
+import collections
+import string
+from urllib.parse import urlparse
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # --- 外部ライブラリの読み込み ---
 try:
@@ -39,69 +50,169 @@ try:
 except Exception:
     genai = None
 
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
 try:
     import requests
+    from urllib3.util.retry import Retry
 except ImportError:
     requests = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = None
+    get_script_run_ctx = None
+
 # ----------------------------
 # 1) LLMクライアント層 (★修正箇所★)
 # ----------------------------
+def loads_json(data: Any) -> Any:
+    """JSON の str / bytes を読む。orjson があれば C 実装のパーサで高速に読む。"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
 class LLMClient(abc.ABC):
     """LLMクライアントの基本インタフェース"""
     @abc.abstractmethod
-    def call(self, prompt: str) -> Dict[str, Any]:
+    def call(self, prompt: str, use_cache: bool = True, cached_content: Optional[str] = None, temperature: Optional[float] = None) -> Dict[str, Any]:
         pass
 
+class ResponseCache:
+    """
+    LLM 応答の完全一致キャッシュ（プロンプトの SHA-256 をキーにする）。
+    一定時間 (ttl 秒) で失効し、件数が maxsize を超えたら古いものから捨てる。
+    並列呼び出しから使われるためロックで保護する。
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "collections.OrderedDict[str, tuple]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        # 正しく JSON として読めた応答だけを残す
+        if not isinstance(response, dict) or not response or any(k in response for k in ("error", "raw_text", "parse_error")):
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+@st.cache_resource(show_spinner=False)
+def get_llm_cache() -> ResponseCache:
+    """Streamlit の再実行をまたいで LLM 応答キャッシュを共有する。"""
+    return ResponseCache()
+
+@st.cache_resource(show_spinner=False)
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    acall（generate_content_async）を流すイベントループ。専用スレッドで回し続け、プロセス内で共有する。
+    gRPC の非同期チャネルは作られたループに結び付くため、実行ごとにループを作り直さない。
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="gemini-event-loop", daemon=True).start()
+    return loop
+
 class GeminiClient(LLMClient):
     """Google Gemini 用のクライアント（★v9.0 修正★）"""
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash"):
+    # 429 (ResourceExhausted) を受けたときに待ってから再試行する回数
+    MAX_RETRIES = 3
+
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash", cache: Optional[ResponseCache] = None, progress_queue: Optional[queue.Queue] = None):
         if genai is None:
             raise ImportError("`google-generativeai`ライブラリが未インストールです。pip install google-generativeai を実行してください。")
         genai.configure(api_key=api_key)
+        self.model_name = model_name
         self.model = genai.GenerativeModel(model_name)
+        self.cache = cache
+        # ワーカースレッドから呼ばれても st.* を直接触らないよう、警告などは (種類, 文面) としてこのキューに積む。
+        # None のときは従来どおりその場で表示する
+        self.progress_queue = progress_queue
+        # Context Cache の名前 -> (CachedContent, そのキャッシュを使うモデル, 登録した前置き)
+        self._contexts: Dict[str, tuple] = {}
+        self._contexts_lock = threading.Lock()
+        # 並列呼び出しが同時に Gemini へ送るリクエスト数の上限（QPM を超えて 429 を受けないようにする）
+        self._max_inflight = int(os.getenv("GEMINI_MAX_INFLIGHT", "8"))
+        self._limiter = threading.BoundedSemaphore(self._max_inflight)
+        # acall 用の上限（イベントループ, asyncio.Semaphore）。ループ上で初めて使うときに作る
+        self._alimiter: Optional[tuple] = None
         self.generation_config = genai.GenerationConfig(
             response_mime_type="application/json"
         )
 
+    def _report(self, kind: str, message: str) -> None:
+        if self.progress_queue is not None:
+            self.progress_queue.put((kind, message))
+        else:
+            getattr(st, kind)(message)
+
     def _extract_json(self, text: str) -> Optional[str]:
         """
         マークダウンや他のテキストでラップされている可能性のある
-        文字列から、最初と最後の波括弧/角括弧に基づいてJSONブロックを抽出する。
-        (v8.2のまま)
+        文字列から、最初の波括弧/角括弧と、それに対応する閉じ括弧までのJSONブロックを抽出する。
+        先頭から1回だけ走査し、文字列リテラル内の括弧は数えない。
         """
         if not text:
             return None
-        
+
         # 最初の '{' または '[' を見つける
-        start_brace = text.find('{')
-        start_bracket = text.find('[')
-        
-        if start_brace == -1 and start_bracket == -1:
-            return None
-            
-        if start_brace == -1:
-            start = start_bracket
-        elif start_bracket == -1:
-            start = start_brace
+        for start, c in enumerate(text):
+            if c == '{' or c == '[':
+                opener = c
+                closer = '}' if c == '{' else ']'
+                break
         else:
-            start = min(start_brace, start_bracket)
-            
-        # 最後の '}' または ']' を見つける
-        end_brace = text.rfind('}')
-        end_bracket = text.rfind(']')
-        
-        if end_brace == -1 and end_bracket == -1:
             return None
-            
-        end = max(end_brace, end_bracket)
-        
-        if end <= start:
-            return None
-            
-        # 潜在的なJSONブロックを抽出
-        potential_json = text[start:end+1]
-        return potential_json
+
+        # 対応する閉じ括弧を深さで追う（後ろに続く余計な文字列は無視される）
+        depth = 0
+        in_string = False
+        escaped = False
+        for end in range(start, len(text)):
+            c = text[end]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif c == '\\':
+                    escaped = True
+                elif c == '"':
+                    in_string = False
+            elif c == '"':
+                in_string = True
+            elif c == opener:
+                depth += 1
+            elif c == closer:
+                depth -= 1
+                if depth == 0:
+                    return text[start:end+1]
+
+        # 閉じ括弧が足りない（途中で切れた応答など）
+        return None
 
     # === ★v9.0: 修正点 1 (JSON修復用プロンプトヘルパー追加) ===
     def _get_json_repair_prompt(self, malformed_text: str) -> str:
@@ -125,8 +236,244 @@ class GeminiClient(LLMClient):
         """
     # === ★v9.0: 修正点 1 終了★ ===
 
+    def create_context_cache(self, prefix: str, ttl_minutes: int = 60) -> Optional[str]:
+        """
+        何度も送る前置き（評価者の役割・評価基準・課題・出力形式など）を Gemini の Context Cache に登録し、
+        call の cached_content に渡す名前を返す。トークン数が足りないなどで使えない場合は None。
+        """
+        try:
+            cached = genai.caching.CachedContent.create(
+                model=self.model_name,
+                contents=[prefix],
+                ttl=datetime.timedelta(minutes=ttl_minutes)
+            )
+            model = genai.GenerativeModel.from_cached_content(cached)
+        except Exception:
+            return None
+        with self._contexts_lock:
+            self._contexts[cached.name] = (cached, model, prefix)
+        return cached.name
+
+    def release_context_cache(self, name: str) -> None:
+        with self._contexts_lock:
+            context = self._contexts.pop(name, None)
+        if context is not None:
+            try:
+                context[0].delete()
+            except Exception:
+                pass
+
+    def _prepare_call(self, prompt: str, use_cache: bool, temperature: Optional[float]) -> tuple:
+        """呼び出しに使う生成設定と、応答キャッシュのキー（キャッシュしないときは None）を決める。"""
+        config = self.generation_config
+        if temperature is not None:
+            config = genai.GenerationConfig(response_mime_type="application/json", temperature=temperature)
+        if not use_cache or self.cache is None or getattr(config, "temperature", None) not in (None, 0):
+            return config, None
+        return config, self.cache.key(f"{self.model_name}\n{config}\n{prompt}")
+
+    def call(self, prompt: str, use_cache: bool = True, cached_content: Optional[str] = None, temperature: Optional[float] = None) -> Dict[str, Any]:
+        """
+        キャッシュを引き、無ければ LLM を呼んで結果をキャッシュする。
+        temperature が 0 以外の設定では同じプロンプトでも応答を変えたいはずなので、キャッシュしない（0 ならキャッシュする）。
+        cached_content を渡すと、prompt のうち登録済みの前置きを除いた差分だけを送る。
+        temperature を渡すと、その呼び出しだけ既定の生成設定の temperature を差し替える（評価では 0 を渡す）。
+        """
+        config, key = self._prepare_call(prompt, use_cache, temperature)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        response = self._generate(prompt, cached_content=cached_content, config=config)
+        if key is not None:
+            self.cache.put(key, response)
+        return response
+
+    async def acall(self, prompt: str, use_cache: bool = True, cached_content: Optional[str] = None, temperature: Optional[float] = None) -> Dict[str, Any]:
+        """
+        call の非同期版。generate_content_async で送り、応答の読み取り・JSON の取り出しは call と同じ処理を通す。
+        呼び出し1件ごとにスレッドを占有しないので、評価のように数十件を同時に待つ場面で使う。
+        """
+        config, key = self._prepare_call(prompt, use_cache, temperature)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        response = await self._agenerate(prompt, cached_content=cached_content, config=config)
+        if key is not None:
+            self.cache.put(key, response)
+        return response
+
+    def _context_for(self, prompt: str, cached_content: Optional[str]) -> Optional[tuple]:
+        """cached_content の前置きで始まるプロンプトなら、その Context Cache の (CachedContent, モデル, 前置き) を返す。"""
+        with self._contexts_lock:
+            context = self._contexts.get(cached_content) if cached_content else None
+        if context is not None and prompt.startswith(context[2]):
+            return context
+        return None
+
+    def _send(self, prompt: str, cached_content: Optional[str] = None, config=None):
+        config = config or self.generation_config
+        context = self._context_for(prompt, cached_content)
+        if context is not None:
+            try:
+                return context[1].generate_content(
+                    prompt[len(context[2]):],
+                    generation_config=config,
+                    stream=True
+                )
+            except Exception as e:
+                if self._is_rate_limited(e):
+                    raise
+                # 期限切れなどで使えなくなったキャッシュは捨て、全文をそのまま送る
+                self.release_context_cache(cached_content)
+        return self.model.generate_content(
+            prompt,
+            generation_config=config,
+            stream=True
+        )
+
+    async def _asend(self, prompt: str, cached_content: Optional[str] = None, config=None):
+        config = config or self.generation_config
+        context = self._context_for(prompt, cached_content)
+        if context is not None:
+            try:
+                return await context[1].generate_content_async(
+                    prompt[len(context[2]):],
+                    generation_config=config,
+                    stream=True
+                )
+            except Exception as e:
+                if self._is_rate_limited(e):
+                    raise
+                await asyncio.to_thread(self.release_context_cache, cached_content)
+        return await self.model.generate_content_async(
+            prompt,
+            generation_config=config,
+            stream=True
+        )
+
+    @staticmethod
+    def _is_rate_limited(error: Exception) -> bool:
+        return google_exceptions is not None and isinstance(error, google_exceptions.ResourceExhausted)
+
+    def _send_and_read(self, prompt: str, cached_content: Optional[str] = None, config=None) -> tuple:
+        """
+        同時実行数の上限内で送信し、応答を最後まで読む。429 を受けたら指数バックオフで待って再試行する。
+        返り値: (応答オブジェクト, 全文, パース結果 or None)
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                with self._limiter:
+                    response = self._send(prompt, cached_content, config)
+                    text, parsed = self._read_stream(response)
+                return response, text, parsed
+            except Exception as e:
+                if attempt == self.MAX_RETRIES or not self._is_rate_limited(e):
+                    raise
+            # 待っている間は枠を空けておき、他の呼び出しを先に通す
+            time.sleep(2 ** attempt + random.random())
+
+    def _async_limiter(self) -> asyncio.Semaphore:
+        # asyncio.Semaphore は使われたイベントループに結び付くので、ループごとに作る
+        loop = asyncio.get_running_loop()
+        if self._alimiter is None or self._alimiter[0] is not loop:
+            self._alimiter = (loop, asyncio.Semaphore(self._max_inflight))
+        return self._alimiter[1]
+
+    async def _asend_and_read(self, prompt: str, cached_content: Optional[str] = None, config=None) -> tuple:
+        """_send_and_read の非同期版。待つ間はイベントループを止めない。"""
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                async with self._async_limiter():
+                    response = await self._asend(prompt, cached_content, config)
+                    text, parsed = await self._aread_stream(response)
+                return response, text, parsed
+            except Exception as e:
+                if attempt == self.MAX_RETRIES or not self._is_rate_limited(e):
+                    raise
+            await asyncio.sleep(2 ** attempt + random.random())
+
+    def _take_chunk(self, chunks: List[str], chunk) -> Optional[Any]:
+        """
+        ストリーミング応答のチャンクをリストに溜める。(文字列の += による再コピーを避ける)
+        チャンクが '}' か ']' で終わったときだけ、溜めた全文のパースを試みてその結果を返す。
+        """
+        try:
+            text = chunk.text
+        except ValueError:
+            # 本文を含まないチャンク（終了理由だけのもの等）は読み飛ばす
+            return None
+        if not text:
+            return None
+        chunks.append(text)
+        # 明らかに途中のバッファではパースを試みない（毎回の全文パースで O(n²) にならないようにする）
+        if text.rstrip()[-1:] not in ("}", "]"):
+            return None
+        cleaned_text = self._extract_json("".join(chunks))
+        if cleaned_text:
+            try:
+                return loads_json(cleaned_text)
+            except ValueError:
+                pass
+        return None
+
+    def _read_stream(self, response) -> tuple:
+        """
+        ストリーミング応答をチャンクが届くそばから受け取り、パースできた時点で
+        (全文, パース結果) を返す。最後までパースできなければ (全文, None)。
+        """
+        chunks = []
+        for chunk in response:
+            parsed = self._take_chunk(chunks, chunk)
+            if parsed is not None:
+                return "".join(chunks), parsed
+        return "".join(chunks), None
+
+    async def _aread_stream(self, response) -> tuple:
+        """_read_stream の非同期版。"""
+        chunks = []
+        async for chunk in response:
+            parsed = self._take_chunk(chunks, chunk)
+            if parsed is not None:
+                return "".join(chunks), parsed
+        return "".join(chunks), None
+
+    def _parse_text(self, text: str, is_retry: bool) -> Optional[Dict[str, Any]]:
+        """
+        応答の全文から JSON ブロックを取り出してパースする。
+        修復プロンプトでリトライすべきときは None を返す（リトライ済みなら失敗の dict を返して諦める）。
+        """
+        # 2. JSONブロックの抽出
+        cleaned_text = self._extract_json(text)
+
+        if cleaned_text:
+            try:
+                # 3. クリーニングされたテキストのパースを試みる
+                return loads_json(cleaned_text)
+            except Exception as e_clean:
+                # 4a. パース失敗
+                self._report("warning", f"[GeminiClient Warning] JSONのパースに失敗しました (クリーニング後)。 Error: {e_clean}")
+
+                if is_retry:
+                    # 4a-1. リトライ済みなら諦める
+                    self._report("error", f"[GeminiClient Error] JSON修復リトライにも失敗しました。")
+                    return {"raw_text": text, "parse_error": f"Retry failed: {e_clean}"}
+        else:
+            # 4b. JSONブロックが見つからない
+            self._report("warning", f"[GeminiClient Warning] 応答からJSONブロックが見つかりませんでした。")
+
+            if is_retry:
+                # 4b-1. リトライ済みなら諦める
+                self._report("error", f"[GeminiClient Error] JSON修復リトライ後も、JSONブロックが見つかりませんでした。")
+                return {"raw_text": text, "parse_error": "Retry failed: No JSON block found"}
+
+        # 4a-2 / 4b-2. 初回失敗なら修復プロンプトでリトライ
+        self._report("info", f"[GeminiClient Info] JSON修復のため、LLMにリトライします...")
+        return None
+
     # === ★v9.0: 修正点 2 (call メソッドにJSON修復リトライロジックを追加) ===
-    def call(self, prompt: str, is_retry: bool = False) -> Dict[str, Any]:
+    def _generate(self, prompt: str, is_retry: bool = False, cached_content: Optional[str] = None, config=None) -> Dict[str, Any]:
         """
         prompt -> LLM 呼び出し -> JSON クリーニング -> JSON パースを試みる
         パースに失敗した場合、LLMに修復を依頼するリトライを1回行う。
@@ -135,49 +482,37 @@ class GeminiClient(LLMClient):
         """
         try:
             # 1. API呼び出し
-            response = self.model.generate_content(
-                prompt,
-                generation_config=self.generation_config
-            )
-            text = getattr(response, "text", None) or getattr(response, "response", None) or str(response)
-            
-            # 2. JSONブロックの抽出
-            cleaned_text = self._extract_json(text)
-            
-            if cleaned_text:
-                try:
-                    # 3. クリーニングされたテキストのパースを試みる
-                    return json.loads(cleaned_text) 
-                except Exception as e_clean:
-                    # 4a. パース失敗
-                    st.warning(f"[GeminiClient Warning] JSONのパースに失敗しました (クリーニング後)。 Error: {e_clean}")
-                    
-                    if is_retry:
-                        # 4a-1. リトライ済みなら諦める
-                        st.error(f"[GeminiClient Error] JSON修復リトライにも失敗しました。")
-                        return {"raw_text": text, "parse_error": f"Retry failed: {e_clean}"}
-                    else:
-                        # 4a-2. 初回失敗なら修復プロンプトでリトライ
-                        st.info(f"[GeminiClient Info] JSON修復のため、LLMにリトライします...")
-                        repair_prompt = self._get_json_repair_prompt(text)
-                        return self.call(repair_prompt, is_retry=True)
-            else:
-                # 4b. JSONブロックが見つからない
-                st.warning(f"[GeminiClient Warning] 応答からJSONブロックが見つかりませんでした。")
-                
-                if is_retry:
-                    # 4b-1. リトライ済みなら諦める
-                    st.error(f"[GeminiClient Error] JSON修復リトライ後も、JSONブロックが見つかりませんでした。")
-                    return {"raw_text": text, "parse_error": "Retry failed: No JSON block found"}
-                else:
-                    # 4b-2. 初回失敗なら修復プロンプトでリトライ
-                    st.info(f"[GeminiClient Info] JSON修復のため、LLMにリトライします...")
-                    repair_prompt = self._get_json_repair_prompt(text)
-                    return self.call(repair_prompt, is_retry=True)
+            response, text, parsed = self._send_and_read(prompt, cached_content, config)
+            if parsed is not None:
+                return parsed
+            text = text or str(response)
+            result = self._parse_text(text, is_retry)
+            if result is not None:
+                return result
+            return self._generate(self._get_json_repair_prompt(text), is_retry=True, config=config)
                 
         except Exception as e:
             # 5. API呼び出し自体のエラー
-            st.error(f"[GeminiClient Error] API 呼び出し中にエラーが発生しました: {e}")
+            self._report("error", f"[GeminiClient Error] API 呼び出し中にエラーが発生しました: {e}")
+            if is_retry:
+                return {"error": f"API call failed during retry: {e}"}
+            else:
+                return {"error": str(e)}
+
+    async def _agenerate(self, prompt: str, is_retry: bool = False, cached_content: Optional[str] = None, config=None) -> Dict[str, Any]:
+        """_generate の非同期版（パースと修復リトライの流れは同じ）。"""
+        try:
+            response, text, parsed = await self._asend_and_read(prompt, cached_content, config)
+            if parsed is not None:
+                return parsed
+            text = text or str(response)
+            result = self._parse_text(text, is_retry)
+            if result is not None:
+                return result
+            return await self._agenerate(self._get_json_repair_prompt(text), is_retry=True, config=config)
+
+        except Exception as e:
+            self._report("error", f"[GeminiClient Error] API 呼び出し中にエラーが発生しました: {e}")
             if is_retry:
                 return {"error": f"API call failed during retry: {e}"}
             else:
@@ -200,12 +535,18 @@ class TavilyClient:
         self.api_key = api_key
         self.endpoint = endpoint
         self.timeout = timeout
+        # 接続を使い回し（keep-alive）、検索ごとの TCP/TLS ハンドシェイクを省く。
+        # 一時的なエラー (429/5xx) は短い間隔で再試行する
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=frozenset(["POST"]))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        self.session.mount("https://", adapter)
 
     def search(self, query: str, num_results: int = 5, domain: Optional[str] = None, lang: Optional[str] = None) -> Dict[str, Any]:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
         payload = {"query": query, "max_results": num_results}
         if domain:
             payload["domain"] = domain
@@ -213,9 +554,9 @@ class TavilyClient:
             payload["language"] = lang
 
         try:
-            resp = requests.post(self.endpoint, headers=headers, json=payload, timeout=self.timeout)
+            resp = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
             resp.raise_for_status()
-            data = resp.json()
+            data = loads_json(resp.content)
             return data
         except requests.exceptions.RequestException as e:
             return {"error": f"HTTP error: {e}"}
@@ -224,23 +565,26 @@ class TavilyClient:
         except Exception as e:
             return {"error": str(e)}
 
+    def search_many(self, queries: List[str], max_workers: int = 16, **kwargs) -> List[Dict[str, Any]]:
+        """
+        複数クエリを同時に検索し、クエリと同じ順序で結果を返す。
+        各検索は独立した HTTPS 往復なので、全体の待ち時間は最も遅い1件分に近くなる。
+        """
+        if not queries:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries)))) as executor:
+            return list(executor.map(lambda q: self.search(q, **kwargs), queries))
+
 # ----------------------------
 # 3) PromptManager (★修正箇所★)
 # ----------------------------
 # ----------------------------
 # 3) PromptManager (★修正箇所★)
 # ----------------------------
-class PromptManager:
-    """AIへの指示書（プロンプト）を管理するクラス"""
-    
-    def get_tavily_multi_phase_query_prompt(self, problem_statement: str) -> str:
-        # ... (このメソッドは v9.0 から変更ありません) ...
-        """
-        (v8.2のまま)
-        課題解決に必要な情報を「分析」と「解決策」の2フェーズで検索するための
-        クエリをLLMに生成させるプロンプト。(クエリ数4)
-        """
-        return f"""
+# プロンプトの固定部分はモジュール定数の string.Template にしておき、呼び出しごとには差し込む値だけを埋める。
+# 同じ入力なら毎回バイト単位で同じプロンプトになるので、応答キャッシュや Context Cache がそのまま当たる。
+
+_TAVILY_QUERY_SKELETON = string.Template("""
         あなたは、提示された「課題」を解決するための調査を2段階で行う専門の調査員です。
 
         以下の「課題」を分析し、2つのフェーズに対応する**日本語の検索クエリ**をそれぞれ4つずつ生成してください。
@@ -255,10 +599,10 @@ class PromptManager:
         (例: 「データベース パフォーマンス改善 事例」, 「BtoBマーケティング 最新手法」)
 
         # 課題
-        {problem_statement}
+        ${problem}
 
         # 出力形式 (JSON)
-        {{
+        {
           "analysis_queries": [
             "フェーズ1のクエリ1 (日本語)",
             "フェーズ1のクエリ2 (日本語)",
@@ -271,17 +615,10 @@ class PromptManager:
             "フェーズ2のクエリ3 (日本語)",
             "フェーズ2のクエリ4 (日本語)"
           ]
-        }}
-        """
+        }
+        """)
 
-    # === ★v10.0: 修正箇所 (評価エージェントの定義を柔軟に変更) ===
-    def get_agent_personas_prompt(self, problem_statement: str) -> str:
-        """
-        (★v10.0: 柔軟な評価エージェント生成 版★)
-        あらゆる課題を分析し、専門特化した「解決エージェント」と、
-        課題に応じて最適化された「評価エージェント」をゼロから生成する。
-        """
-        return f"""
+_AGENT_PERSONAS_SKELETON = string.Template("""
         # 役割
         あなたは、非常に複雑な課題を解決するために、AIエージェントからなる「スウォーム（群れ）」を編成する「マスタープランナー」です。
 
@@ -312,66 +649,58 @@ class PromptManager:
         - `criteria`: その役割が使用する、課題に特化した評価基準（合計100点になるように複数を設定）を定義してください。
 
         # 課題
-        {problem_statement}
+        ${problem}
 
         # 出力形式 (JSON)
-        {{
+        {
           "solver_agents": [
-            {{ "role": "（ステップ2で定義した専門的役割1）", "instructions": "..." }},
-            {{ "role": "（ステップ2で定義した専門的役割2）", "instructions": "..." }},
-            {{ "role": "（ステップ2で定義した専門的役割3）", "instructions": "..." }},
-            {{ "role": "（ステップ2で定義した専門的役割4）", "instructions": "..." }},
-            {{ "role": "（ステップ2で定義した専門的役割5）", "instructions": "..." }},
-            {{ "role": "（ステップ2で定義した専門的役割6）", "instructions": "..." }},
-            {{ "role": "（ステップ2で定義した専門的役割7）", "instructions": "..." }},
-            {{ "role": "（ステップ2で定義した専門的役割8）", "instructions": "..." }},
-            {{ "role": "（ステップ2で定義した専門的役割9）", "instructions": "..." }},
-            {{ "role": "（ステップ2で定義した専門的役割10）", "instructions": "..." }}
+            { "role": "（ステップ2で定義した専門的役割1）", "instructions": "..." },
+            { "role": "（ステップ2で定義した専門的役割2）", "instructions": "..." },
+            { "role": "（ステップ2で定義した専門的役割3）", "instructions": "..." },
+            { "role": "（ステップ2で定義した専門的役割4）", "instructions": "..." },
+            { "role": "（ステップ2で定義した専門的役割5）", "instructions": "..." },
+            { "role": "（ステップ2で定義した専門的役割6）", "instructions": "..." },
+            { "role": "（ステップ2で定義した専門的役割7）", "instructions": "..." },
+            { "role": "（ステップ2で定義した専門的役割8）", "instructions": "..." },
+            { "role": "（ステップ2で定義した専門的役割9）", "instructions": "..." },
+            { "role": "（ステップ2で定義した専門的役割10）", "instructions": "..." }
           ],
           "evaluators": [
             // 評価者1: あなたが考案した課題特化の役割
-            {{ 
+            { 
               "role": "（ステップ3で考案した評価役割1）", 
               "instructions": "（その役割のための具体的な評価指示）", 
               "criteria": [
-                {{ "criterion": "（その役割の評価基準A）", "weight": 60 }}, 
-                {{ "criterion": "（その役割の評価基準B）", "weight": 40 }}
+                { "criterion": "（その役割の評価基準A）", "weight": 60 }, 
+                { "criterion": "（その役割の評価基準B）", "weight": 40 }
               ] 
-            }},
+            },
             // 評価者2: あなたが考案した課題特化の役割
-            {{ 
+            { 
               "role": "（ステップ3で考案した評価役割2）", 
               "instructions": "（その役割のための具体的な評価指示）", 
               "criteria": [
-                {{ "criterion": "（その役割の評価基準C）", "weight": 50 }}, 
-                {{ "criterion": "（その役割の評価基準D）", "weight": 50 }}
+                { "criterion": "（その役割の評価基準C）", "weight": 50 }, 
+                { "criterion": "（その役割の評価基準D）", "weight": 50 }
               ] 
-            }},
+            },
             // 評価者3: あなたが考案した課題特化の役割
-            {{ 
+            { 
               "role": "（ステップ3で考案した評価役割3）", 
               "instructions": "（その役割のための具体的な評価指示）", 
               "criteria": [
-                {{ "criterion": "（その役割の評価基準E）", "weight": 70 }}, 
-                {{ "criterion": "（その役割の評価基準F）", "weight": 30 }}
+                { "criterion": "（その役割の評価基準E）", "weight": 70 }, 
+                { "criterion": "（その役割の評価基準F）", "weight": 30 }
               ] 
-            }}
+            }
           ]
-        }}
-        """
-    # === ★v10.0: 修正箇所 終了 ===
-
+        }
+        """)
 
-    def get_initial_generation_prompt(self, problem_statement: str, num_solutions: int, context: Dict[str, str]) -> str:
-        # ... (このメソッドは v9.0 から変更ありません) ...
-        """
-        (v8.2のまま)
-        (★v8: 詳細度向上版★)
-        """
-        return f"""
-        # 役割: {context.get('role', 'あなたは一流のイノベーターです。')}
-        # 指示: {context.get('instructions', f'以下の課題に対し、互いに全く異なるアプローチからの解決策を{num_solutions}個提案してください。')}
-        # 課題文: {problem_statement}
+_INITIAL_SKELETON = string.Template("""
+        # 役割: ${role}
+        # 指示: ${instructions}
+        # 課題文: ${problem}
         # 出力形式: 
         各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
         
@@ -379,75 +708,85 @@ class PromptManager:
         - 「specific_method」の内容は、その方法論やメカニズム、その理由などを説明する**2〜4行程度の具体的な文章**にしてください。
         - 「specific_method」には**箇条書き、マークダウン、ネストされたJSONを使用しないでください。** ただし、**文章内での改行コード(\n)は使用して構いません。**
 
-        {{ 
+        { 
           "solutions": [ 
-            {{ 
+            { 
               "name": "解決策1の名称", 
               "summary": "解決策1の簡潔な概要", 
               "specific_method": "解決策1の具体的な方法や理由を説明する2〜4行の文章です。\nこのように改行を含めても構いません。"
-            }}
+            }
           ] 
-        }}
-        """
-
-    def get_evaluation_prompt(self, solution: Dict[str, str], problem_statement: str, context: Dict[str, Any]) -> str:
-        # ... (このメソッドは v9.0 から変更ありません) ...
-        # (v8.2のまま)
-        criteria_text = []
-        scores_json_structure = []
-        if "criteria" in context and isinstance(context["criteria"], list):
-            for item in context["criteria"]:
-                criterion = item.get("criterion", "不明な基準")
-                weight = item.get("weight", 0)
-                criteria_text.append(f"- {criterion}: {weight}点")
-                scores_json_structure.append(f'"{criterion}": 点数(整数)')
-
-        criteria_prompt_part = "\n".join(criteria_text)
-        scores_json_prompt_part = f"{{ {', '.join(scores_json_structure)} }}"
+        }
+        """)
 
-        return f"""
-        # 役割: {context.get('role', 'あなたは客観的で厳しい批評家です。')}
-        # 指示: {context.get('instructions', 'あなたは客観的で厳しい批評家です。提示された解決案を評価基準に基づいて厳密に評価してください。')}
-        # タスク: 提示された課題に対し、解決案をあなたの役割と評価基準に基づいて厳密に評価してください。
-        # 課題文: {problem_statement}
-        
-        # 評価対象の解決案:
-        - 名称: {solution.get('name', '名称不明')}
-        - 概要: {solution.get('summary', '概要なし')}
-        - 具体的な方法: {solution.get('specific_method', '具体的な方法なし')}
+_EVALUATION_PREFIX_SKELETON = string.Template("""
+        # 役割: ${role}
+        # 指示: ${instructions}
+        # タスク: 提示された課題に対し、末尾の解決案をあなたの役割と評価基準に基づいて厳密に評価してください。
+        # 課題文: ${problem}
         
         # あなたの役割と評価基準:
-        {criteria_prompt_part}
+        ${criteria}
         
         # 出力形式: 評価結果を必ず以下のJSON形式で出力してください。
-        {{
+        {
           "total_score": 合計点(整数),
-          "scores": {scores_json_prompt_part},
+          "scores": ${scores_json},
           "strengths": "この解決案が（あなたの役割の観点で）優れている点（簡潔に）",
           "weaknesses": "この解決案が（あなたの役割の観点で）懸念・改善が必要な点（簡潔に）",
           "overall_comment": "評価の総括（簡潔に）"
-        }}
-        """
-
-    def get_next_generation_prompt(self, elite_solutions: List[Dict], failed_solutions: List[Dict], problem_statement: str, num_solutions: int, context: Dict[str, str]) -> str:
-        # ... (このメソッドは v9.0 から変更ありません) ...
-        """
-        (v8.2のまま)
-        (★v8: 詳細度向上版★)
-        既存の解を「進化」させるためのプロンプト (80%の確率で使われる)
-        """
-        elite_text = "\n".join([f"- {s['solution'].get('name', 'N/A')} (スコア: {s['evaluation'].get('total_score', 0)})" for s in elite_solutions])
-        failed_text = "\n".join([f"- {s['solution'].get('name', 'N/A')} (弱点: {s['evaluation'].get('weaknesses', 'N/A')})" for s in failed_solutions])
+        }
+        """)
 
-        return f"""
-        # 役割: {context.get('role', 'あなたは優れた戦略家であり編集者です。')}
-        # 指示: {context.get('instructions', '高評価案の良い点を組み合わせ、低評価案の失敗から学び、新しい解決策を生成してください。')}
-        # タスク: 前世代の分析に基づき、次世代の新しい解決策を{num_solutions}個生成してください。
+_EVALUATION_SUFFIX_SKELETON = string.Template("""
+        # 評価対象の解決案:
+        - 名称: ${name}
+        - 概要: ${summary}
+        - 具体的な方法: ${method}
+        """)
+
+_BATCH_EVALUATION_PREFIX_SKELETON = string.Template("""
+        # 役割: ${role}
+        # 指示: ${instructions}
+        # タスク: 提示された課題に対し、末尾に列挙した解決案を**1件ずつ独立に**、あなたの役割と評価基準に基づいて厳密に評価してください。
+        解決案どうしを比べて点数を調整せず、それぞれを評価基準だけに基づいて採点してください。
+        # 課題文: ${problem}
+        
+        # あなたの役割と評価基準:
+        ${criteria}
+        
+        # 出力形式: 評価結果を必ず以下のJSON形式で出力してください。
+        `evaluations` には、列挙したすべての解決案について、その `id` を付けて1件ずつ、列挙した順に含めてください。
+        {
+          "evaluations": [
+            {
+              "id": 解決案の番号(整数),
+              "total_score": 合計点(整数),
+              "scores": ${scores_json},
+              "strengths": "この解決案が（あなたの役割の観点で）優れている点（簡潔に）",
+              "weaknesses": "この解決案が（あなたの役割の観点で）懸念・改善が必要な点（簡潔に）",
+              "overall_comment": "評価の総括（簡潔に）"
+            }
+          ]
+        }
+        """)
+
+_BATCH_EVALUATION_ITEM_SKELETON = string.Template("""
+        ## 解決案 (id: ${id})
+        - 名称: ${name}
+        - 概要: ${summary}
+        - 具体的な方法: ${method}
+""")
+
+_NEXT_GENERATION_SKELETON = string.Template("""
+        # 役割: ${role}
+        # 指示: ${instructions}
+        # タスク: 前世代の分析に基づき、次世代の新しい解決策を${num_solutions}個生成してください。
         # 分析対象1：高評価だった解決案（優れた遺伝子）: 
-        {elite_text}
+        ${elite}
         # 分析対象2：低評価だった解決案（学ぶべき教訓）: 
-        {failed_text}
-        # 新しい解決策の生成指示: {context.get('instructions')}
+        ${failed}
+        # 新しい解決策の生成指示: ${generation_instructions}
         
         # 出力形式: 
         各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
@@ -456,43 +795,32 @@ class PromptManager:
         - 「specific_method」の内容は、その方法論やメカニズム、その理由などを説明する**2〜4行程度の具体的な文章**にしてください。
         - 「specific_method」には**箇条書き、マークダウン、ネストされたJSONを使用しないでください。** ただし、**文章内での改行コード(\n)は使用して構いません。**
 
-        {{ 
+        { 
           "solutions": [ 
-            {{ 
+            { 
               "name": "新しい解決策1の名称", 
               "summary": "新しい解決策1の簡潔な概要", 
               "specific_method": "新しい解決策1の具体的な方法や理由を説明する2〜4行の文章です。\nこのように改行を含めても構いません。"
-            }}
+            }
           ] 
-        }}
-        """
-
-    def get_revolutionary_generation_prompt(self, problem_statement: str, num_solutions: int, existing_roles: List[str]) -> str:
-        # ... (このメソッドは v9.0 から変更ありません) ...
-        """
-        (★v9.0: 動的エージェント生成 版★)
-        過去の世代分析を「無視」し、全く新しい「革新的なエージェント」を
-        その場で動的に定義させ、そのエージェントに解決策を生成させる。
-        """
-        
-        # 既存ロールのリストを文字列に
-        existing_roles_list = "\n".join([f"- {role}" for role in existing_roles]) if existing_roles else "なし"
+        }
+        """)
 
-        return f"""
+_REVOLUTIONARY_SKELETON = string.Template("""
         # 役割: 
         あなたは「常識外れのイノベーター」を任命するマスタープランナーです。
         あなたは「突然変異」を引き起こすため、既存の解決策や過去の評価（エリート解、失敗解）は**完全に無視**します。
 
         # タスク:
         以下の「課題」に対し、既存のエージェントとは**全く異なる新しい観点**を持つ
-        「革新的な専門家」を{num_solutions}人（または{num_solutions}個）定義し、
-        その専門家の視点から、革新的な解決策を{num_solutions}個生成してください。
+        「革新的な専門家」を${num_solutions}人（または${num_solutions}個）定義し、
+        その専門家の視点から、革新的な解決策を${num_solutions}個生成してください。
 
         # 課題文: 
-        {problem_statement}
+        ${problem}
 
         # 既存の専門家ロール (これらとは異なる視点にすること):
-        {existing_roles_list}
+        ${existing_roles}
 
         # !!重要!! 
         - ステップ1（内部思考）: 既存ロールがカバーしていない、全く新しい「役割（ロール）」を考案する。
@@ -507,16 +835,163 @@ class PromptManager:
         - 「specific_method」の内容は、その方法論やメカニズム、その理由などを説明する**2〜4行程度の具体的な文章**にしてください。
         - 「specific_method」には**箇条書き、マークダウン、ネストされたJSONを使用しないでください。** ただし、**文章内での改行コード(\n)は使用して構いません。**
 
-        {{ 
+        { 
           "solutions": [ 
-            {{ 
+            { 
               "name": "（考案した新専門家の役割を反映した革新的な名称）", 
               "summary": "（その専門家が生成した革新的な解決策の概要）", 
               "specific_method": "（その解決策の具体的な方法や理由を説明する2〜4行の文章です。）" 
-            }}
+            }
           ] 
-        }}
+        }
+        """)
+
+
+class PromptManager:
+    """AIへの指示書（プロンプト）を管理するクラス"""
+    
+    def get_tavily_multi_phase_query_prompt(self, problem_statement: str) -> str:
+        # ... (このメソッドは v9.0 から変更ありません) ...
+        """
+        (v8.2のまま)
+        課題解決に必要な情報を「分析」と「解決策」の2フェーズで検索するための
+        クエリをLLMに生成させるプロンプト。(クエリ数4)
+        """
+        return _TAVILY_QUERY_SKELETON.substitute(problem=problem_statement)
+
+    # === ★v10.0: 修正箇所 (評価エージェントの定義を柔軟に変更) ===
+    def get_agent_personas_prompt(self, problem_statement: str) -> str:
+        """
+        (★v10.0: 柔軟な評価エージェント生成 版★)
+        あらゆる課題を分析し、専門特化した「解決エージェント」と、
+        課題に応じて最適化された「評価エージェント」をゼロから生成する。
+        """
+        return _AGENT_PERSONAS_SKELETON.substitute(problem=problem_statement)
+    # === ★v10.0: 修正箇所 終了 ===
+
+
+    def get_initial_generation_prompt(self, problem_statement: str, num_solutions: int, context: Dict[str, str]) -> str:
+        # ... (このメソッドは v9.0 から変更ありません) ...
+        """
+        (v8.2のまま)
+        (★v8: 詳細度向上版★)
+        """
+        return _INITIAL_SKELETON.substitute(
+            role=context.get('role', 'あなたは一流のイノベーターです。'),
+            instructions=context.get('instructions', f'以下の課題に対し、互いに全く異なるアプローチからの解決策を{num_solutions}個提案してください。'),
+            problem=problem_statement,
+        )
+
+    @staticmethod
+    def precompile_evaluator(context: Dict[str, Any]) -> Dict[str, str]:
+        """
+        評価者の評価基準から、基準の一覧と scores の JSON 構造の文字列を作る。
+        評価者ごとに固定なので、世代ごとに1度だけ作って評価プロンプトに渡す。
+        """
+        # (v8.2のまま)
+        criteria_text = []
+        scores_json_structure = []
+        if "criteria" in context and isinstance(context["criteria"], list):
+            for item in context["criteria"]:
+                criterion = item.get("criterion", "不明な基準")
+                weight = item.get("weight", 0)
+                criteria_text.append(f"- {criterion}: {weight}点")
+                scores_json_structure.append(f'"{criterion}": 点数(整数)')
+
+        criteria_prompt_part = "\n".join(criteria_text)
+        scores_json_prompt_part = f"{{ {', '.join(scores_json_structure)} }}"
+        return {"criteria_prompt_part": criteria_prompt_part, "scores_json_prompt_part": scores_json_prompt_part}
+
+    def get_evaluation_prefix(self, problem_statement: str, context: Dict[str, Any], precompiled: Optional[Dict[str, str]] = None) -> str:
+        """
+        評価プロンプトのうち、解決案によらない前半（役割・指示・課題・評価基準・出力形式）。
+        同じ評価者では全解決案で共通なので、Context Cache に載せて使い回せるよう先頭にまとめる。
+        """
+        precompiled = precompiled or self.precompile_evaluator(context)
+
+        return _EVALUATION_PREFIX_SKELETON.substitute(
+            role=context.get('role', 'あなたは客観的で厳しい批評家です。'),
+            instructions=context.get('instructions', 'あなたは客観的で厳しい批評家です。提示された解決案を評価基準に基づいて厳密に評価してください。'),
+            problem=problem_statement,
+            criteria=precompiled["criteria_prompt_part"],
+            scores_json=precompiled["scores_json_prompt_part"],
+        )
+
+    def get_evaluation_suffix(self, solution: Dict[str, str]) -> str:
+        """評価プロンプトのうち、解決案ごとに変わる後半。"""
+        return _EVALUATION_SUFFIX_SKELETON.substitute(
+            name=solution.get('name', '名称不明'),
+            summary=solution.get('summary', '概要なし'),
+            method=solution.get('specific_method', '具体的な方法なし'),
+        )
+
+    def get_evaluation_prompt(self, solution: Dict[str, str], problem_statement: str, context: Dict[str, Any], precompiled: Optional[Dict[str, str]] = None) -> str:
+        # ... (このメソッドは v9.0 から変更ありません) ...
+        return self.get_evaluation_prefix(problem_statement, context, precompiled) + self.get_evaluation_suffix(solution)
+
+    def get_batch_evaluation_prefix(self, problem_statement: str, context: Dict[str, Any], precompiled: Optional[Dict[str, str]] = None) -> str:
+        """複数の解決案を1回の呼び出しで評価するプロンプトの前半。get_evaluation_prefix と同じく評価者ごとに共通。"""
+        precompiled = precompiled or self.precompile_evaluator(context)
+
+        return _BATCH_EVALUATION_PREFIX_SKELETON.substitute(
+            role=context.get('role', 'あなたは客観的で厳しい批評家です。'),
+            instructions=context.get('instructions', 'あなたは客観的で厳しい批評家です。提示された解決案を評価基準に基づいて厳密に評価してください。'),
+            problem=problem_statement,
+            criteria=precompiled["criteria_prompt_part"],
+            scores_json=precompiled["scores_json_prompt_part"],
+        )
+
+    def get_batch_evaluation_suffix(self, solutions: List[Dict[str, str]]) -> str:
+        """評価対象の解決案を、入力順に 1 から id を振って列挙する。"""
+        return "\n        # 評価対象の解決案:\n" + "".join(
+            _BATCH_EVALUATION_ITEM_SKELETON.substitute(
+                id=k + 1,
+                name=solution.get('name', '名称不明'),
+                summary=solution.get('summary', '概要なし'),
+                method=solution.get('specific_method', '具体的な方法なし'),
+            )
+            for k, solution in enumerate(solutions)
+        )
+
+    def get_batch_evaluation_prompt(self, solutions: List[Dict[str, str]], problem_statement: str, context: Dict[str, Any], precompiled: Optional[Dict[str, str]] = None) -> str:
+        """1体の評価者が、複数の解決案を1回の呼び出しでまとめて評価するためのプロンプト。"""
+        return self.get_batch_evaluation_prefix(problem_statement, context, precompiled) + self.get_batch_evaluation_suffix(solutions)
+
+    def get_next_generation_prompt(self, elite_solutions: List[Dict], failed_solutions: List[Dict], problem_statement: str, num_solutions: int, context: Dict[str, str]) -> str:
+        # ... (このメソッドは v9.0 から変更ありません) ...
+        """
+        (v8.2のまま)
+        (★v8: 詳細度向上版★)
+        既存の解を「進化」させるためのプロンプト (80%の確率で使われる)
+        """
+        elite_text = "\n".join([f"- {s['solution'].get('name', 'N/A')} (スコア: {s['evaluation'].get('total_score', 0)})" for s in elite_solutions])
+        failed_text = "\n".join([f"- {s['solution'].get('name', 'N/A')} (弱点: {s['evaluation'].get('weaknesses', 'N/A')})" for s in failed_solutions])
+
+        return _NEXT_GENERATION_SKELETON.substitute(
+            role=context.get('role', 'あなたは優れた戦略家であり編集者です。'),
+            instructions=context.get('instructions', '高評価案の良い点を組み合わせ、低評価案の失敗から学び、新しい解決策を生成してください。'),
+            num_solutions=num_solutions,
+            elite=elite_text,
+            failed=failed_text,
+            generation_instructions=context.get('instructions'),
+        )
+
+    def get_revolutionary_generation_prompt(self, problem_statement: str, num_solutions: int, existing_roles: List[str]) -> str:
+        # ... (このメソッドは v9.0 から変更ありません) ...
+        """
+        (★v9.0: 動的エージェント生成 版★)
+        過去の世代分析を「無視」し、全く新しい「革新的なエージェント」を
+        その場で動的に定義させ、そのエージェントに解決策を生成させる。
         """
+        
+        # 既存ロールのリストを文字列に
+        existing_roles_list = "\n".join([f"- {role}" for role in existing_roles]) if existing_roles else "なし"
+
+        return _REVOLUTIONARY_SKELETON.substitute(
+            num_solutions=num_solutions,
+            problem=problem_statement,
+            existing_roles=existing_roles_list,
+        )
 
 
 # ----------------------------
@@ -524,51 +999,176 @@ class PromptManager:
 # ----------------------------
 class EvoGenSolver:
     """元の EvoGenSolver（主要ロジック）"""
-    def __init__(self, llm_client: LLMClient, num_solutions_per_generation: int = 10):
+    # 1回の一括評価に含める解決案の最大数（多すぎると応答が長くなり、取りこぼしが増える）
+    BATCH_EVALUATION_MAX = 10
+    # 呼び出しの完了を待つ間、通知キューを描画しに戻ってくる間隔（秒）
+    PROGRESS_POLL_INTERVAL = 0.2
+    # 評価は同じ入力なら同じ点数になってほしい（順位を安定させ、評価結果を使い回せるようにする）ので temperature を 0 にする
+    EVALUATION_TEMPERATURE = 0
+
+    def __init__(self, llm_client: LLMClient, num_solutions_per_generation: int = 10, max_workers: int = 16, progress_queue: Optional[queue.Queue] = None):
         self.client = llm_client
         self.num_solutions = num_solutions_per_generation 
         self.prompter = PromptManager()
         self.history = []
+        # LLM 呼び出しを同時に発行するスレッド数の上限（レート制限に当たらない程度に抑える）
+        self.max_workers = max_workers
+        # 評価者ごとの前置きを登録した Context Cache の名前（登録できなかった評価者は None）。solve の終わりに解放する
+        self._evaluator_contexts: Dict[str, Optional[str]] = {}
+        # (解決案, 評価者) の内容から作ったキー -> 有効だった評価。同じ組は2度 LLM に評価させない
+        self._eval_cache: Dict[str, Dict] = {}
+        # 共有のイベントループに投げて、まだ終わっていない呼び出し（中断時に solve の finally で取り消す）
+        self._pending: set = set()
+        # 警告・進捗の通知は (st の関数名, 文面) としてこのキューに積み、Streamlit のメインスレッドだけが描画する。
+        # クライアント側にキューが渡されていなければ同じキューを共有させる
+        self.progress_queue = progress_queue if progress_queue is not None else queue.Queue()
+        if getattr(llm_client, "progress_queue", False) is None:
+            llm_client.progress_queue = self.progress_queue
+
+    def _report(self, kind: str, message: str) -> None:
+        self.progress_queue.put((kind, message))
+
+    def _drain_progress(self) -> None:
+        """溜まった通知をメインスレッドからまとめて描画する。"""
+        while True:
+            try:
+                kind, message = self.progress_queue.get_nowait()
+            except queue.Empty:
+                return
+            getattr(st, kind)(message)
+
+    def _as_completed(self, futures) -> Generator[Any, None, None]:
+        """as_completed と同じく完了したものから返すが、待っている間も短い間隔で通知を描画する。"""
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=self.PROGRESS_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            self._pending.difference_update(done)
+            self._drain_progress()
+            yield from done
+
+    def _submit_llm(self, executor: ThreadPoolExecutor, prompt: str, use_cache: bool = True, cached_content: Optional[str] = None, temperature: Optional[float] = None) -> Future:
+        """
+        LLM 呼び出しを1件投げて Future を返す。クライアントが acall を持っていれば共有のイベントループ上の
+        コルーチンとして流し（1件ごとにスレッドを占有しない）、無ければ従来どおりスレッドプールで実行する。
+        どちらも concurrent.futures.Future なので、待ち方 (_as_completed) は変わらない。
+        """
+        acall = getattr(self.client, "acall", None)
+        if acall is None:
+            return executor.submit(self._call_llm, prompt, use_cache, cached_content, temperature)
+        future = asyncio.run_coroutine_threadsafe(
+            acall(prompt, use_cache=use_cache, cached_content=cached_content, temperature=temperature),
+            get_event_loop()
+        )
+        self._pending.add(future)
+        return future
+
+    def _cancel_pending(self) -> None:
+        # 中断で残った呼び出しは取り消し、取り消しが反映されるまで待つ（ループ自体は他の solve と共有なので閉じない）
+        pending, self._pending = self._pending, set()
+        for future in pending:
+            future.cancel()
+        if pending:
+            wait(pending, timeout=5)
+
+    def _run_blocking(self, fn, *args, **kwargs) -> Any:
+        """1回きりの LLM・Tavily 呼び出しもワーカースレッドで行い、メインスレッドは待つ間に通知を描画する。"""
+        with self._executor(1) as executor:
+            future = executor.submit(fn, *args, **kwargs)
+            for _ in self._as_completed([future]):
+                pass
+            return future.result()
+
+    def _call_llm(self, prompt: str, use_cache: bool = True, cached_content: Optional[str] = None, temperature: Optional[float] = None) -> Dict[str, Any]:
+        return self.client.call(prompt, use_cache=use_cache, cached_content=cached_content, temperature=temperature) # 修正された v9.0 の call (リトライ機能付き) が呼ばれる
+
+    @staticmethod
+    def _evaluation_key(solution: Dict[str, str], evaluator: Dict[str, Any]) -> str:
+        """解決案と評価者の定義の内容だけから決まるキー（辞書のキー順によらない）。"""
+        payload = json.dumps({"solution": solution, "evaluator": evaluator}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _evaluator_context(self, prefix: str) -> Optional[str]:
+        """評価者の前置きを Context Cache に1度だけ登録し、世代をまたいで使い回す。"""
+        key = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+        if key not in self._evaluator_contexts:
+            create = getattr(self.client, "create_context_cache", None)
+            self._evaluator_contexts[key] = create(prefix) if create is not None else None
+        return self._evaluator_contexts[key]
+
+    def _release_evaluator_contexts(self) -> None:
+        release = getattr(self.client, "release_context_cache", None)
+        for name in self._evaluator_contexts.values():
+            if name is not None and release is not None:
+                release(name)
+        self._evaluator_contexts = {}
+
+    def _executor(self, num_jobs: int) -> ThreadPoolExecutor:
+        """
+        LLM 呼び出しを並列に流すためのスレッドプール。
+        画面への描画は progress_queue 経由でメインスレッドが行うが、
+        念のためワーカースレッドにも Streamlit の実行コンテキストを引き継いでおく。
+        """
+        ctx = get_script_run_ctx() if get_script_run_ctx is not None else None
 
-    def _call_llm(self, prompt: str) -> Dict[str, Any]:
-        return self.client.call(prompt) # 修正された v9.0 の call (リトライ機能付き) が呼ばれる
+        def attach_ctx():
+            if ctx is not None:
+                add_script_run_ctx(threading.current_thread(), ctx)
+
+        return ThreadPoolExecutor(max_workers=max(1, min(num_jobs, self.max_workers)), initializer=attach_ctx)
+
+    def _generate_in_parallel(self, prompts: List[str], labels: List[str], use_cache: bool = True) -> List[Dict[str, str]]:
+        """
+        各エージェントの生成プロンプトを同時に投げ、完了した順に進捗バーを進める。
+        返り値は完了順ではなく元のエージェント順に並べ直した解決策のリスト。
+        """
+        num_jobs = len(prompts)
+        progress = st.progress(0.0, text=f"0/{num_jobs} エージェントが完了")
+        results: Dict[int, Dict[str, str]] = {}
+        with self._executor(num_jobs) as executor:
+            futures = {self._submit_llm(executor, prompt, use_cache): i for i, prompt in enumerate(prompts)}
+            for done, future in enumerate(self._as_completed(futures), start=1):
+                i = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    response = {"error": str(e)}
+
+                # v9.0 の call により、 response はパース済みの dict (または修復済み) のはず
+                if isinstance(response, dict) and "solutions" in response and isinstance(response["solutions"], list) and len(response["solutions"]) > 0:
+                    results[i] = response["solutions"][0]
+                else:
+                    # パースが成功しても "solutions" がないか、リストでない場合、または v9.0 が修復に失敗して {"raw_text":...} を返した場合
+                    self._report("warning", f"[EvoGenSolver] エージェント {i+1} が不正な形式を返しました。デバッグ情報: {response}")
+                # 進捗表示はメインスレッド (_as_completed のループ) からのみ更新する
+                progress.progress(done / num_jobs, text=f"{done}/{num_jobs} エージェントが完了: {labels[i]}")
+        progress.empty()
+        return [results[i] for i in sorted(results)]
 
     def _generate_agent_personas(self, problem_statement: str) -> Dict:
         # (v8.2のまま)
         prompt = self.prompter.get_agent_personas_prompt(problem_statement)
-        return self._call_llm(prompt)
+        return self._run_blocking(self._call_llm, prompt)
 
     def _generate_initial_solutions(self, problem_statement: str, context: Dict) -> List[Dict[str, str]]:
         # (v8.2のまま)
         initial_agent_list = context 
         if not isinstance(initial_agent_list, list) or len(initial_agent_list) == 0:
-            st.warning(f"[EvoGenSolver] 解決・進化エージェントのリストが不正です。")
+            self._report("warning", f"[EvoGenSolver] 解決・進化エージェントのリストが不正です。")
             return []
         
         num_initial_agents = len(initial_agent_list)
-        st.info(f"💡 {num_initial_agents}体の専門エージェントが初期解（10個）を分担して生成中...")
+        self._report("info", f"💡 {num_initial_agents}体の専門エージェントが初期解（10個）を分担して生成中...")
         
-        all_solutions = []
-        for i, agent_context in enumerate(initial_agent_list):
-            st.caption(f"  - エージェント {i+1}/{num_initial_agents} ({agent_context.get('role', 'N/A')}) が生成中...")
-            
-            prompt = self.prompter.get_initial_generation_prompt(problem_statement, 1, agent_context)
-            response = self._call_llm(prompt) # 修正された v9.0 の call が呼ばれる
-            
-            # v9.0 の call により、 response はパース済みの dict (または修復済み) のはず
-            if isinstance(response, dict) and "solutions" in response and isinstance(response["solutions"], list) and len(response["solutions"]) > 0:
-                all_solutions.append(response["solutions"][0])
-            else:
-                # パースが成功しても "solutions" がないか、リストでない場合、または v9.0 が修復に失敗して {"raw_text":...} を返した場合
-                st.warning(f"[EvoGenSolver] エージェント {i+1} が不正な形式を返しました。デバッグ情報: {response}")
-                
-        return all_solutions
+        # 各エージェントの呼び出しは互いに独立しているため、すべて同時に発行する
+        prompts = [self.prompter.get_initial_generation_prompt(problem_statement, 1, agent_context) for agent_context in initial_agent_list]
+        labels = [f"エージェント {i+1} ({agent_context.get('role', 'N/A')})" for i, agent_context in enumerate(initial_agent_list)]
+        return self._generate_in_parallel(prompts, labels)
 
     def _evaluate_solutions(self, solutions: List[Dict[str, str]], problem_statement: str, context: Dict) -> Generator[str | List[Dict], None, None]:
         # (v8.2のまま)
         evaluator_agent_list = context
         if not isinstance(evaluator_agent_list, list) or len(evaluator_agent_list) == 0:
-            st.error("[EvoGenSolver] 評価エージェントのリストが不正です。処理を中断します。")
+            self._report("error", "[EvoGenSolver] 評価エージェントのリストが不正です。処理を中断します。")
             yield []
             return
 
@@ -579,73 +1179,192 @@ class EvoGenSolver:
 
         num_evaluators = len(evaluator_agent_list)
 
-        for i, solution in enumerate(solutions):
+        valid_solutions = []
+        for solution in solutions:
             if not isinstance(solution, dict) or "name" not in solution:
                 yield f"  - 評価スキップ: 不正な形式の解決策データです。"
                 continue
-                
-            yield f"  - 評価中 {i+1}/{len(solutions)}: {solution.get('name', '名称不明')} ( {num_evaluators}体のエージェントによる評価)"
+            valid_solutions.append(solution)
+
+        # 評価者ごとに解決案をまとめて1回で評価させ (最大 BATCH_EVALUATION_MAX 件ずつ)、取りこぼした分だけ個別に評価し直す
+        yield f"  - {len(valid_solutions)}件の解決策を {num_evaluators}体のエージェントで並列に評価中（評価者ごとに一括）..."
+        individual_results: Dict[int, List[Optional[Dict]]] = {i: [None] * num_evaluators for i in range(len(valid_solutions))}
+        pending_counts = {i: num_evaluators for i in range(len(valid_solutions))}
+        aggregated_results: Dict[int, Dict] = {}
+        keys = [[self._evaluation_key(solution, c) for c in evaluator_agent_list] for solution in valid_solutions]
+
+        def settle(i: int, j: int, evaluation: Any) -> Generator[str, None, None]:
+            solution = valid_solutions[i]
+            if self._is_valid_evaluation(evaluation):
+                individual_results[i][j] = evaluation
+            else:
+                self._report("warning", f"[EvoGenSolver] 解決策 '{solution.get('name', 'N/A')}' の評価者 {j+1} が不正な形式を返しました。デバッグ情報: {evaluation}")
 
-            individual_evaluations = []
-            
-            # 3体の評価エージェント（影響・実現性・リスク）がそれぞれ評価
-            for j, eval_context in enumerate(evaluator_agent_list):
-                yield f"    - 評価者 {j+1}/{num_evaluators} ({eval_context.get('role', 'N/A')}) が評価..."
-                prompt = self.prompter.get_evaluation_prompt(solution, problem_statement, eval_context)
-                evaluation = self._call_llm(prompt) # 修正された v9.0 の call が呼ばれる
-                
-                if isinstance(evaluation, dict) and "total_score" in evaluation and "error" not in evaluation:
-                    individual_evaluations.append(evaluation)
-                else:
-                    st.warning(f"[EvoGenSolver] 解決策 '{solution.get('name', 'N/A')}' の評価者 {j+1} が不正な形式を返しました。デバッグ情報: {evaluation}")
+            pending_counts[i] -= 1
+            if pending_counts[i]:
+                return
 
+            # 評価者の並び順は元のまま保って集計する
+            individual_evaluations = [e for e in individual_results[i] if e is not None]
             if not individual_evaluations:
-                st.warning(f"[EvoGenSolver] 解決策 '{solution.get('name', 'N/A')}' の有効な評価がありませんでした。")
-                continue
-
-            total_score_sum = sum(e.get('total_score', 0) for e in individual_evaluations)
-            aggregated_score = round(total_score_sum / len(individual_evaluations))
-            
-            agg_strengths = "\n---\n".join([f"評価者{k+1} ({e.get('role', 'N/A')}):\n{e.get('strengths', 'N/A')}" for k, e in enumerate(individual_evaluations)])
-            agg_weaknesses = "\n---\n".join([f"評価者{k+1} ({e.get('role', 'N/A')}):\n{e.get('weaknesses', 'N/A')}" for k, e in enumerate(individual_evaluations)])
-            agg_comment = "\n---\n".join([f"評価者{k+1} ({e.get('role', 'N/A')}):\n{e.get('overall_comment', 'N/A')}" for k, e in enumerate(individual_evaluations)])
-
-            aggregated_evaluation = {
-                "total_score": aggregated_score,
-                "strengths": agg_strengths,
-                "weaknesses": agg_weaknesses,
-                "overall_comment": agg_comment,
-                "individual_evals": individual_evaluations 
-            }
-            
-            evaluated_solutions.append({"solution": solution, "evaluation": aggregated_evaluation})
-            yield f"    - 総合評価スコア: {aggregated_score}"
-
+                self._report("warning", f"[EvoGenSolver] 解決策 '{solution.get('name', 'N/A')}' の有効な評価がありませんでした。")
+                return
+            aggregated_results[i] = self._aggregate_evaluations(individual_evaluations)
+            yield f"    - 総合評価スコア: {aggregated_results[i]['total_score']} ({solution.get('name', '名称不明')})"
+
+        def resolve(i: int, j: int, evaluation: Any) -> Generator[str, None, None]:
+            # LLM に評価させた結果を、同じ内容で待っている解決案にも配り、以降の世代のために残す
+            if self._is_valid_evaluation(evaluation):
+                self._eval_cache[keys[i][j]] = evaluation
+            for k in waiting.pop(keys[i][j], [i]):
+                yield from settle(k, j, evaluation)
+
+        # 既に評価済みの組は結果を使い回し、同じ内容の組は1つだけ LLM に評価させる
+        waiting: Dict[str, List[int]] = {}
+        todo: List[List[int]] = [[] for _ in range(num_evaluators)]
+        hits = []
+        reused = 0
+        for i in range(len(valid_solutions)):
+            for j in range(num_evaluators):
+                key = keys[i][j]
+                if key in self._eval_cache:
+                    hits.append((i, j))
+                elif key in waiting:
+                    reused += 1
+                    waiting[key].append(i)
+                else:
+                    waiting[key] = [i]
+                    todo[j].append(i)
+        if hits or reused:
+            yield f"  - 同じ解決案・評価者の組 {len(hits) + reused}件は評価結果を使い回します"
+        for i, j in hits:
+            yield from settle(i, j, self._eval_cache[keys[i][j]])
+
+        batches = [(todo[j][b:b + self.BATCH_EVALUATION_MAX], j) for j in range(num_evaluators) for b in range(0, len(todo[j]), self.BATCH_EVALUATION_MAX)]
+        # 評価基準の文字列と、解決案によらない前半は評価者ごとに1度だけ作り、前半は Context Cache に載せる
+        precompiled = [self.prompter.precompile_evaluator(c) for c in evaluator_agent_list]
+        batch_prefixes = [self.prompter.get_batch_evaluation_prefix(problem_statement, c, precompiled[j]) for j, c in enumerate(evaluator_agent_list)]
+        batch_contexts = self._run_blocking(lambda: [self._evaluator_context(prefix) if todo[j] else None for j, prefix in enumerate(batch_prefixes)])
+        retries = []
+
+        with self._executor(len(batches)) as executor:
+            futures = {}
+            suffixes: Dict[tuple, str] = {}
+            for batch, j in batches:
+                # 評価者ごとの対象が同じなら (ふつうはそう) 後半の文字列も1度だけ作る
+                if tuple(batch) not in suffixes:
+                    suffixes[tuple(batch)] = self.prompter.get_batch_evaluation_suffix([valid_solutions[i] for i in batch])
+                futures[self._submit_llm(executor, batch_prefixes[j] + suffixes[tuple(batch)], True, batch_contexts[j], self.EVALUATION_TEMPERATURE)] = (batch, j)
+
+            for future in self._as_completed(futures):
+                batch, j = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    response = {"error": str(e)}
+                yield f"    - 評価者 {j+1}/{num_evaluators} ({evaluator_agent_list[j].get('role', 'N/A')}) が {len(batch)}件を一括評価"
+
+                for i, evaluation in zip(batch, self._split_batch_evaluations(response, len(batch))):
+                    if evaluation is None:
+                        retries.append((i, j))
+                    else:
+                        yield from resolve(i, j, evaluation)
+
+            if retries:
+                # 一括評価で取り出せなかった (解決案, 評価者) の組だけ、従来の1件ずつの評価で補う
+                yield f"  - 一括評価で取りこぼした {len(retries)}件を個別に評価し直しています..."
+                prefixes = {j: self.prompter.get_evaluation_prefix(problem_statement, evaluator_agent_list[j], precompiled[j]) for j in {j for _, j in retries}}
+                contexts = self._run_blocking(lambda: {j: self._evaluator_context(prefix) for j, prefix in prefixes.items()})
+                futures = {
+                    self._submit_llm(executor, prefixes[j] + self.prompter.get_evaluation_suffix(valid_solutions[i]), True, contexts[j], self.EVALUATION_TEMPERATURE): (i, j)
+                    for i, j in retries
+                }
+                for future in self._as_completed(futures):
+                    i, j = futures[future]
+                    try:
+                        evaluation = future.result()
+                    except Exception as e:
+                        evaluation = {"error": str(e)}
+                    yield f"    - 評価者 {j+1}/{num_evaluators} ({evaluator_agent_list[j].get('role', 'N/A')}) が評価: {valid_solutions[i].get('name', '名称不明')}"
+                    yield from resolve(i, j, evaluation)
+
+        # 完了順ではなく元の順序で並べてからソートし、同点時の順序を決定的にする
+        for i in sorted(aggregated_results):
+            evaluated_solutions.append({"solution": valid_solutions[i], "evaluation": aggregated_results[i]})
 
         evaluated_solutions.sort(key=lambda x: x.get("evaluation", {}).get("total_score", 0), reverse=True)
         yield evaluated_solutions
 
+    @staticmethod
+    def _is_valid_evaluation(evaluation: Any) -> bool:
+        return isinstance(evaluation, dict) and "total_score" in evaluation and "error" not in evaluation
+
+    def _split_batch_evaluations(self, response: Any, num_solutions: int) -> List[Optional[Dict]]:
+        """
+        一括評価の応答を入力順の評価リストに戻す。id で対応を取り、id が使えない場合は件数が一致するときだけ並び順で対応させる。
+        取り出せなかった解決案は None。
+        """
+        evaluations: List[Optional[Dict]] = [None] * num_solutions
+        items = response.get("evaluations") if isinstance(response, dict) and "error" not in response else None
+        if not isinstance(items, list):
+            return evaluations
+        by_id = {}
+        for item in items:
+            if self._is_valid_evaluation(item) and isinstance(item.get("id"), int) and 1 <= item["id"] <= num_solutions:
+                by_id.setdefault(item["id"] - 1, item)
+        if not by_id and len(items) == num_solutions:
+            by_id = {i: item for i, item in enumerate(items) if self._is_valid_evaluation(item)}
+        for i, item in by_id.items():
+            evaluations[i] = {k: v for k, v in item.items() if k != "id"}
+        return evaluations
+
+    @staticmethod
+    def _aggregate_evaluations(individual_evaluations: List[Dict]) -> Dict[str, Any]:
+        total_score_sum = sum(e.get('total_score', 0) for e in individual_evaluations)
+        aggregated_score = round(total_score_sum / len(individual_evaluations))
+        
+        # 評価者の見出しは1度だけ作り、3つの欄を1回の走査でまとめて組み立てる
+        strengths, weaknesses, comments = [], [], []
+        for k, e in enumerate(individual_evaluations):
+            tag = f"評価者{k+1} ({e.get('role', 'N/A')}):\n"
+            strengths.append(f"{tag}{e.get('strengths', 'N/A')}")
+            weaknesses.append(f"{tag}{e.get('weaknesses', 'N/A')}")
+            comments.append(f"{tag}{e.get('overall_comment', 'N/A')}")
+        agg_strengths = "\n---\n".join(strengths)
+        agg_weaknesses = "\n---\n".join(weaknesses)
+        agg_comment = "\n---\n".join(comments)
+
+        return {
+            "total_score": aggregated_score,
+            "strengths": agg_strengths,
+            "weaknesses": agg_weaknesses,
+            "overall_comment": agg_comment,
+            "individual_evals": individual_evaluations 
+        }
+
     # === ★v9.0: 修正点 4 (突然変異ロジックの変更) ===
     def _generate_next_generation(self, evaluated_solutions: List[Dict], problem_statement: str, context: Dict) -> List[Dict[str, str]]:
         # (★v9.0: 突然変異ロジック 修正★)
         solver_agent_list = context 
         if not isinstance(solver_agent_list, list) or len(solver_agent_list) == 0:
-            st.warning(f"[EvoGenSolver] 解決・進化エージェントのリストが不正です。")
+            self._report("warning", f"[EvoGenSolver] 解決・進化エージェントのリストが不正です。")
             return []
 
         num_elites = max(1, int(len(evaluated_solutions) * 0.4))
         elite_solutions = evaluated_solutions[:num_elites]
         failed_solutions = evaluated_solutions[num_elites:]
 
-        st.info(f"🚀 {self.num_solutions} 体の解決・進化エージェントを選出して次世代を生成...")
+        self._report("info", f"🚀 {self.num_solutions} 体の解決・進化エージェントを選出して次世代を生成...")
 
-        new_solutions = []
+        # どのエージェントに何をさせるかは先にメインスレッドで決め、LLM 呼び出しだけを並列に流す
+        prompts = []
+        labels = []
         for i in range(self.num_solutions):
             
             # === ★v9.0 修正箇所 ===
             if random.random() < 0.20:
                 # 20%の確率: 革新 (新しいエージェントを動的生成)
-                st.caption(f"  - ⚡ (突然変異) エージェント {i+1}/{self.num_solutions} が「新規エージェントの定義」と「革新的な解の生成」を実行...")
+                labels.append(f"⚡ (突然変異) エージェント {i+1}")
                 
                 # 既存エージェントのロールリストを取得
                 existing_roles = [a.get('role', 'N/A') for a in solver_agent_list]
@@ -659,7 +1378,7 @@ class EvoGenSolver:
             else:
                 # 80%の確率: 進化 (既存エージェントを再利用)
                 selected_agent_context = random.choice(solver_agent_list) 
-                st.caption(f"  - 🧬 (進化) エージェント {i+1}/{self.num_solutions} ({selected_agent_context.get('role', 'N/A')}) が「既存の解」を進化...")
+                labels.append(f"🧬 (進化) エージェント {i+1} ({selected_agent_context.get('role', 'N/A')})")
                 
                 prompt = self.prompter.get_next_generation_prompt(
                     elite_solutions, 
@@ -669,20 +1388,27 @@ class EvoGenSolver:
                     selected_agent_context
                 )
             # === ★v9.0 修正終了 ===
-            
-            response = self._call_llm(prompt) # 修正された v9.0 の call が呼ばれる
-            
-            if isinstance(response, dict) and "solutions" in response and isinstance(response["solutions"], list) and len(response["solutions"]) > 0:
-                new_solutions.append(response["solutions"][0])
-            else:
-                st.warning(f"[EvoGenSolver] エージェント {i+1} が不正な形式を返しました。デバッグ情報: {response}")
+            prompts.append(prompt)
 
-        return new_solutions
+        # 進化・突然変異のプロンプトは同じ文面が繰り返し現れるため、キャッシュを使わずに毎回新しい案を得る
+        return self._generate_in_parallel(prompts, labels, use_cache=False)
     # === ★v9.0: 修正点 4 終了★ ===
 
     def solve(self, problem_statement: str, generations: int = 3) -> Generator[str | Dict, None, None]:
+        try:
+            for event in self._evolve(problem_statement, generations):
+                self._drain_progress()
+                yield event
+        finally:
+            # 途中で中断された場合も、走っている呼び出しと登録した Context Cache は残さない
+            self._cancel_pending()
+            self._release_evaluator_contexts()
+            self._drain_progress()
+
+    def _evolve(self, problem_statement: str, generations: int = 3) -> Generator[str | Dict, None, None]:
         # (v8.2のまま)
         self.history = []
+        self._eval_cache = {}
 
         yield "--- 🧠 課題を分析し、最適なAIエージェント・スウォームを編成中... ---"
         agent_personas = self._generate_agent_personas(problem_statement) 
@@ -759,18 +1485,28 @@ class EvoGenSolver_Tavily(EvoGenSolver):
     Tavily を用いて課題に関連する最新情報を収集し、その情報を
     問題文に組み込んで EvoGen のフローを回す拡張版。
     """
-    def __init__(self, llm_client: LLMClient, tavily_client: TavilyClient, num_solutions_per_generation: int = 10, tavily_results_per_search: int = 5):
-        super().__init__(llm_client, num_solutions_per_generation)
+    def __init__(self, llm_client: LLMClient, tavily_client: TavilyClient, num_solutions_per_generation: int = 10, tavily_results_per_search: int = 5, progress_queue: Optional[queue.Queue] = None):
+        super().__init__(llm_client, num_solutions_per_generation, progress_queue=progress_queue)
         self.tavily = tavily_client
         self.tavily_results_per_query = tavily_results_per_search 
 
-    def _get_snippet_text(self, results: List[Dict[str, Any]], max_snippets: int = 5) -> str:
-        # (v8.2のまま)
+    def _get_snippet_text(self, results: List[Dict[str, Any]], max_snippets: int = 5, max_chars_per_snippet: int = 400) -> str:
+        """
+        要約プロンプトに載せる検索結果のテキスト。
+        同じサイト (URL のホスト) の結果は最初の1件だけにし、各スニペットは max_chars_per_snippet 文字で切る。
+        """
         snippet_texts = []
-        for r in results[:min(len(results), max_snippets)]:
-            title = r.get("title", "")
-            snippet = r.get("snippet", "") or r.get("description", "")
+        seen_hosts = set()
+        for r in results:
+            if len(snippet_texts) >= max_snippets:
+                break
             url = r.get("url", "")
+            host = urlparse(url).netloc
+            if host and host in seen_hosts:
+                continue
+            seen_hosts.add(host)
+            title = r.get("title", "")
+            snippet = (r.get("snippet", "") or r.get("description", ""))[:max_chars_per_snippet]
             snippet_texts.append(f"Title: {title}\nSnippet: {snippet}\nURL: {url}\n---")
         return "\n".join(snippet_texts)
 
@@ -859,7 +1595,7 @@ class EvoGenSolver_Tavily(EvoGenSolver):
         
         yield "--- 💡 LLMによる最適な検索クエリ（フェーズ1 & 2）を生成中... ---"
         prompt = self.prompter.get_tavily_multi_phase_query_prompt(problem_statement)
-        query_response = self._call_llm(prompt) # 修正された v9.0 の call が呼ばれる
+        query_response = self._run_blocking(self._call_llm, prompt) # 修正された v9.0 の call が呼ばれる
 
         if not isinstance(query_response, dict) or ("analysis_queries" not in query_response and "solution_queries" not in query_response):
             yield f"エラー: Tavilyクエリの生成に失敗しました。AIからの応答が不正です: {query_response}"
@@ -874,34 +1610,26 @@ class EvoGenSolver_Tavily(EvoGenSolver):
             
             analysis_results_list = []
             solution_results_list = []
-            
-            if analysis_queries:
-                yield "--- 🌐 フェーズ1: 課題の現状分析リサーチを開始... ---"
-                for q in analysis_queries:
-                    if not q.strip(): continue
-                    yield f"  - 検索中 (分析): {q}"
-                    tavily_resp = self.tavily.search(q, num_results=self.tavily_results_per_query)
-                    if isinstance(tavily_resp, dict) and "results" in tavily_resp:
-                        analysis_results_list.extend(tavily_resp["results"])
-                    elif isinstance(tavily_resp, dict) and "error" in tavily_resp:
-                         yield f"  - Tavily エラー (分析クエリ: {q}): {tavily_resp['error']}"
-            
-            if solution_queries:
-                yield "--- 🌐 フェーズ2: 解決策の事例リサーチを開始... ---"
-                for q in solution_queries:
-                    if not q.strip(): continue
-                    yield f"  - 検索中 (解決策): {q}"
-                    tavily_resp = self.tavily.search(q, num_results=self.tavily_results_per_query)
+
+            # フェーズ1・2 のクエリをまとめて同時に検索する
+            tagged_queries = [("analysis", q) for q in analysis_queries if q.strip()] + [("solution", q) for q in solution_queries if q.strip()]
+            if tagged_queries:
+                yield f"--- 🌐 フェーズ1・2: {len(tagged_queries)}件のリサーチを並列に実行中... ---"
+                search_results = self._run_blocking(self.tavily.search_many, [q for _, q in tagged_queries], num_results=self.tavily_results_per_query)
+
+                for (phase, q), tavily_resp in zip(tagged_queries, search_results):
+                    label = "分析" if phase == "analysis" else "解決策"
                     if isinstance(tavily_resp, dict) and "results" in tavily_resp:
-                        solution_results_list.extend(tavily_resp["results"])
+                        (analysis_results_list if phase == "analysis" else solution_results_list).extend(tavily_resp["results"])
                     elif isinstance(tavily_resp, dict) and "error" in tavily_resp:
-                         yield f"  - Tavily エラー (解決策クエリ: {q}): {tavily_resp['error']}"
+                         yield f"  - Tavily エラー ({label}クエリ: {q}): {tavily_resp['error']}"
 
             yield {"tavily_info_analysis": analysis_results_list, "tavily_info_solution": solution_results_list}
 
             yield "--- ✍️ 2つのリサーチ結果を要約し、問題文に統合します... ---"
             try:
-                augmented_problem = self._summarize_multi_phase_results_with_llm(
+                augmented_problem = self._run_blocking(
+                    self._summarize_multi_phase_results_with_llm,
                     problem_statement, 
                     analysis_results_list, 
                     solution_results_list
@@ -963,7 +1691,7 @@ if st.button("解決策の生成を開始", type="primary"):
 
         with st.spinner("🌀 AIが思考中です..."):
             try:
-                gemini_client = GeminiClient(api_key=gemini_key)
+                gemini_client = GeminiClient(api_key=gemini_key, cache=get_llm_cache())
                 tavily_client = TavilyClient(api_key=tavily_key)
             except Exception as e:
                 st.error(f"クライアントの初期化に失敗しました: {e}")
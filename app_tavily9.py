@@ -23,6 +23,9 @@ v10.0 の特徴 (v9.0から変更):
 - (汎用性) `get_agent_personas_prompt` を修正し、
   AIが課題に応じて最適な「評価エージェNT」をゼロから設計するように指示。
 - (検索強化) Tavilyの検索クエリ数を2から4に増加。
+
+任意ライブラリ（あれば自動で利用）:
+    pip install diskcache sentence-transformers orjson "httpx[http2]"
 """
 
 import streamlit as st
@@ -32,6 +35,18 @@ import abc
 from typing import List, Dict, Any, Generator, Optional
 import time
 import random 
+import threading
+import hashlib
+import datetime
+import asyncio
+import collections
+import copy
+import queue
+import functools
+import heapq
+from concurrent.futures import wait, FIRST_COMPLETED
+import html
+import numpy as np
 
 # --- 外部ライブラリの読み込み ---
 try:
@@ -39,30 +54,233 @@ try:
 except Exception:
     genai = None
 
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
 try:
     import requests
+    from urllib3.util.retry import Retry
 except ImportError:
     requests = None
 
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = None
+    get_script_run_ctx = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
 # ----------------------------
 # 1) LLMクライアント層 (変更なし)
 # ----------------------------
+def loads_json(data: Any) -> Any:
+    """JSON の str / bytes を読む。orjson があれば C 実装のパーサで高速に読む。"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def dumps_json(obj: Any) -> str:
+    """JSON 文字列に書き出す。orjson があればそれを使う（どちらも非 ASCII 文字はそのまま出力する）。"""
+    return orjson.dumps(obj).decode("utf-8") if orjson is not None else json.dumps(obj, ensure_ascii=False)
+
+def dumps_json_bytes(obj: Any) -> bytes:
+    """リクエスト本文用に、UTF-8 の JSON バイト列に書き出す（orjson ならデコードを挟まずにそのまま使える）。"""
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
 class LLMClient(abc.ABC):
     """LLMクライアントの基本インタフェース"""
     @abc.abstractmethod
-    def call(self, prompt: str) -> Dict[str, Any]:
+    def call(self, prompt: str, use_cache: bool = True, semantic_key: Optional[str] = None, namespace: str = "", cached_content: Optional[str] = None, response_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         pass
 
+    async def acall(self, prompt: str, use_cache: bool = True, semantic_key: Optional[str] = None, namespace: str = "", cached_content: Optional[str] = None, response_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """非同期版。既定では同期の call を別スレッドで動かす（非同期 API を持つクライアントは上書きする）。"""
+        return await asyncio.to_thread(self.call, prompt, use_cache, semantic_key, namespace, cached_content, response_schema)
+
+    def stream_call(self, prompt: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None) -> Generator[str, None, Dict[str, Any]]:
+        """
+        ストリーミング版。受信した応答の断片を yield し、最後にパース結果を return する。
+        既定ではストリーミングせず、call の結果をそのまま返す。
+        """
+        yield from ()
+        return self.call(prompt, use_cache=use_cache, response_schema=response_schema)
+
+@st.cache_resource(show_spinner=False)
+def load_embedding_model(model_name: str):
+    """埋め込みモデルは重いので、Streamlit の再実行をまたいで1つだけ読み込む。"""
+    return SentenceTransformer(model_name)
+
+class SemanticCache:
+    """
+    LLM 応答の2段キャッシュ。
+    1段目: (モデル名, プロンプト) の SHA-256 による完全一致。diskcache があればディスクに永続化する。
+    2段目: 呼び出し側が渡した semantic_key（プロンプトのうち可変な部分）の埋め込みのコサイン類似度による近似一致。
+           プロンプト全体は定型文が大半で、埋め込むとどれも似通ってしまうため、可変部分だけを比べる。
+           namespace（評価者や課題ごと）をまたいでは一致させない。sentence-transformers が無い環境では使わない。
+           埋め込みのディスクへの書き出しは PERSIST_EVERY 件ごと（と flush）にまとめて行う。
+           課題文・解決案は日本語なので、英語専用ではなく多言語対応の埋め込みモデルを使う。
+    """
+    PERSIST_EVERY = 16
+
+    def __init__(self, directory: str = "./.llm_cache", threshold: float = 0.95, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"):
+        self.threshold = threshold
+        self.model_name = model_name
+        self._disk = diskcache.Cache(directory) if diskcache is not None else None
+        self._memory: Dict[str, str] = {}
+        self._spaces: Dict[str, Dict[str, Any]] = {}
+        # namespace -> まだディスクに書き出していない登録件数
+        self._dirty: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return SentenceTransformer is not None
+
+    @staticmethod
+    def _key(prefix: str, text: str) -> str:
+        return prefix + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, semantic_key: Optional[str] = None, namespace: str = "") -> tuple:
+        """
+        (キャッシュ済みの応答 or None, 登録用の埋め込み or None) を返す。
+        埋め込みの計算（初回はモデルの読み込みも）は重く同期的なので、非同期の呼び出し側はワーカースレッドで呼ぶ。
+        埋め込みに失敗した場合は例外を送出する（表示は呼び出し側に任せる）。
+        """
+        key = self._key("exact:", prompt)
+        stored = self._disk.get(key) if self._disk is not None else self._memory.get(key)
+        if stored is not None:
+            return loads_json(stored), None
+        if semantic_key is None or not self.semantic_enabled:
+            return None, None
+        vector = self._embed(semantic_key)
+        with self._lock:
+            space = self._space(namespace)
+            self._stack(space)
+            if space["values"]:
+                similarities = space["matrix"] @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    return dict(space["values"][best]), vector
+        return None, vector
+
+    def put(self, prompt: str, response: Dict[str, Any], vector: Optional[np.ndarray] = None, namespace: str = "") -> None:
+        # 正しく JSON として読めた応答だけを残す
+        if not isinstance(response, dict) or not response or any(k in response for k in ("error", "raw_text", "parse_error")):
+            return
+        key = self._key("exact:", prompt)
+        payload = dumps_json(response)
+        if self._disk is not None:
+            self._disk.set(key, payload)
+        else:
+            self._memory[key] = payload
+        if vector is None:
+            return
+        with self._lock:
+            space = self._space(namespace)
+            # 行列への追加は次の検索時にまとめて行う（登録のたびに行列全体をコピーしない）
+            space["values"].append(response)
+            space["pending"].append(vector)
+            self._dirty[namespace] = self._dirty.get(namespace, 0) + 1
+            snapshot = self._snapshot(namespace) if self._dirty[namespace] >= self.PERSIST_EVERY else None
+        if snapshot is not None:
+            self._persist(namespace, snapshot)
+
+    def flush(self) -> None:
+        """まだ書き出していない近似一致用の登録を、すべてディスクに書き出す。"""
+        with self._lock:
+            snapshots = {namespace: self._snapshot(namespace) for namespace in list(self._dirty)}
+        for namespace, snapshot in snapshots.items():
+            self._persist(namespace, snapshot)
+
+    def _snapshot(self, namespace: str) -> Dict[str, Any]:
+        # 書き出す内容を確定させる（呼び出し側でロック済み）。書き込み自体はロックの外で行う
+        space = self._spaces[namespace]
+        self._stack(space)
+        self._dirty.pop(namespace, None)
+        return {"matrix": space["matrix"], "values": list(space["values"])}
+
+    def _persist(self, namespace: str, snapshot: Dict[str, Any]) -> None:
+        if self._disk is not None:
+            self._disk.set(self._semantic_key(namespace), snapshot)
+
+    @staticmethod
+    def _stack(space: Dict[str, Any]) -> None:
+        # 溜まった埋め込みを1回の vstack で行列に追加する（呼び出し側でロック済み）
+        if space["pending"]:
+            rows = np.stack(space["pending"])
+            space["matrix"] = np.vstack([space["matrix"], rows]) if len(space["matrix"]) else rows
+            space["pending"] = []
+
+    def _semantic_key(self, namespace: str) -> str:
+        # 埋め込みモデルが変わるとベクトルの空間も変わるため、保存済みの行列はモデルごとに分ける
+        return self._key("semantic:", f"{self.model_name}\n{namespace}")
+
+    def _space(self, namespace: str) -> Dict[str, Any]:
+        # 名前空間ごとの (埋め込み行列, 応答) を、初回だけディスクから読み込む（呼び出し側でロック済み）
+        space = self._spaces.get(namespace)
+        if space is None:
+            stored = self._disk.get(self._semantic_key(namespace)) if self._disk is not None else None
+            space = stored if stored is not None else {"matrix": np.zeros((0, 0), dtype=np.float32), "values": []}
+            space["pending"] = []
+            self._spaces[namespace] = space
+        return space
+
+    def _embed(self, text: str) -> np.ndarray:
+        model = load_embedding_model(self.model_name)
+        # 埋め込みの計算はキャッシュのロックの外で行い、他の検索・登録を待たせない
+        vector = model.encode([text], normalize_embeddings=True, convert_to_numpy=True)[0]
+        return np.asarray(vector, dtype=np.float32)
+
+@st.cache_resource(show_spinner=False)
+def get_llm_cache() -> SemanticCache:
+    """Streamlit の再実行をまたいで LLM 応答キャッシュを共有する。"""
+    return SemanticCache()
+
+# JSON 出力の生成設定は全呼び出しで共通なので、読み込み時に1度だけ作る
+_JSON_GENERATION_CONFIG = genai.GenerationConfig(response_mime_type="application/json") if genai is not None else None
+
 class GeminiClient(LLMClient):
     """Google Gemini 用のクライアント（v9.0 JSON修復機能付き）"""
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash"): 
+    # 一時的なエラー（429 / 503 / タイムアウトなど）で再試行する回数。失敗した1手のために solve 全体をやり直させない
+    MAX_RETRIES = 2
+
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash", cache: Optional[SemanticCache] = None): 
         if genai is None:
             raise ImportError("`google-generativeai`ライブラリが未インストールです。pip install google-generativeai を実行してください。")
         genai.configure(api_key=api_key)
+        self.model_name = model_name
+        # クライアント自体は get_gemini_client で API キーごとに1つだけ作るので、モデルはクライアントごとに持つ
+        # （クラス全体で使い回すと、作り直したクライアントにも古い非同期の接続を持ったモデルが残る）
         self.model = genai.GenerativeModel(model_name)
-        self.generation_config = genai.GenerationConfig(
-            response_mime_type="application/json"
-        )
+        self.cache = cache
+        # Context Cache の名前 -> (CachedContent, そのキャッシュを使うモデル, 登録した前置き)
+        self._contexts: Dict[str, tuple] = {}
+        self._contexts_lock = threading.Lock()
+        # 警告・エラーはここに溜め、呼び出し側（EvoGenSolver）がメインスレッドで取り出して表示する。
+        # 並列呼び出しの途中で Streamlit を直接触らないため。solve ごとの書き込み先は with_log で差し替える
+        self.log: collections.deque = collections.deque(maxlen=200)
+        self.generation_config = _JSON_GENERATION_CONFIG
+        # id(response_schema) -> (response_schema, GenerationConfig)
+        self._schema_configs: Dict[int, tuple] = {}
 
     def _extract_json(self, text: str) -> Optional[str]:
         """
@@ -119,51 +337,306 @@ class GeminiClient(LLMClient):
         として修正し、そのJSONだけを出力してください。
         """
 
-    def call(self, prompt: str, is_retry: bool = False) -> Dict[str, Any]:
+    def _notify(self, level: str, message: str) -> None:
+        self.log.append((level, message))
+
+    def with_log(self, log: collections.deque) -> "GeminiClient":
         """
-        prompt -> LLM 呼び出し -> JSON クリーニング -> JSON パースを試みる
-        パースに失敗した場合、LLMに修復を依頼するリトライを1回行う。
+        警告・エラーの書き込み先だけを差し替えたクライアントを返す。
+        モデル・応答キャッシュ・Context Cache の登録は共有したまま、ログは solve（セッション）ごとに分ける。
+        """
+        client = copy.copy(self)
+        client.log = log
+        return client
+
+    def create_context_cache(self, prefix: str, ttl_minutes: int = 30) -> Optional[str]:
+        """
+        何度も送る前置き（評価者の役割・ガイドライン・課題・出力形式など）を Gemini の Context Cache に登録し、
+        call の cached_content に渡す名前を返す。トークン数が足りないなどで使えない場合は None。
         """
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config=self.generation_config
+            cached = genai.caching.CachedContent.create(
+                model=self.model_name,
+                contents=[prefix],
+                ttl=datetime.timedelta(minutes=ttl_minutes)
             )
-            text = getattr(response, "text", None) or getattr(response, "response", None) or str(response)
-            
-            cleaned_text = self._extract_json(text)
-            
-            if cleaned_text:
-                try:
-                    return json.loads(cleaned_text) 
-                except Exception as e_clean:
-                    st.warning(f"[GeminiClient Warning] JSONのパースに失敗しました (クリーニング後)。 Error: {e_clean}")
-                    
-                    if is_retry:
-                        st.error(f"[GeminiClient Error] JSON修復リトライにも失敗しました。")
-                        return {"raw_text": text, "parse_error": f"Retry failed: {e_clean}"}
-                    else:
-                        st.info(f"[GeminiClient Info] JSON修復のため、LLMにリトライします...")
-                        repair_prompt = self._get_json_repair_prompt(text)
-                        return self.call(repair_prompt, is_retry=True)
-            else:
-                st.warning(f"[GeminiClient Warning] 応答からJSONブロックが見つかりませんでした。")
+            model = genai.GenerativeModel.from_cached_content(cached)
+        except Exception:
+            return None
+        with self._contexts_lock:
+            self._contexts[cached.name] = (cached, model, prefix)
+        return cached.name
+
+    def release_context_cache(self, name: str) -> None:
+        with self._contexts_lock:
+            context = self._contexts.pop(name, None)
+        if context is not None:
+            try:
+                context[0].delete()
+            except Exception:
+                pass
+
+    def call(self, prompt: str, use_cache: bool = True, semantic_key: Optional[str] = None, namespace: str = "", cached_content: Optional[str] = None, response_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        キャッシュを引き、無ければ LLM を呼んで結果をキャッシュする。
+        semantic_key を渡した呼び出しだけ、namespace の中で近似一致も使う。
+        cached_content を渡すと、prompt のうち登録済みの前置きを除いた差分だけを送る。
+        response_schema を渡すと、その構造に沿った JSON だけを生成させる（制約付きデコード）。
+        """
+        config = self._config_for(response_schema)
+        if not use_cache or self.cache is None:
+            return self._generate(prompt, cached_content=cached_content, config=config)
+        cache_prompt = f"{self.model_name}\n{prompt}"
+        cache_namespace = f"{self.model_name}\n{namespace}"
+        cached, vector = self._cache_get(cache_prompt, semantic_key, cache_namespace)
+        if cached is not None:
+            return cached
+        response = self._generate(prompt, cached_content=cached_content, config=config)
+        self.cache.put(cache_prompt, response, vector, cache_namespace)
+        return response
+
+    async def acall(self, prompt: str, use_cache: bool = True, semantic_key: Optional[str] = None, namespace: str = "", cached_content: Optional[str] = None, response_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """call の非同期版。generate_content_async で送り、待ち時間の間に他の呼び出しを進める。"""
+        config = self._config_for(response_schema)
+        if not use_cache or self.cache is None:
+            return await self._agenerate(prompt, cached_content=cached_content, config=config)
+        cache_prompt = f"{self.model_name}\n{prompt}"
+        cache_namespace = f"{self.model_name}\n{namespace}"
+        # 埋め込みの計算とディスクの読み書きは同期的なので、共有のイベントループを止めないようワーカースレッドで行う
+        cached, vector = await asyncio.to_thread(self._cache_get, cache_prompt, semantic_key, cache_namespace)
+        if cached is not None:
+            return cached
+        response = await self._agenerate(prompt, cached_content=cached_content, config=config)
+        await asyncio.to_thread(self.cache.put, cache_prompt, response, vector, cache_namespace)
+        return response
+
+    def _cache_get(self, cache_prompt: str, semantic_key: Optional[str], cache_namespace: str) -> tuple:
+        try:
+            return self.cache.get(cache_prompt, semantic_key, cache_namespace)
+        except Exception as e:
+            self._notify("warning", f"[SemanticCache] 埋め込みの計算に失敗したため、近似一致のキャッシュを使いません: {e}")
+            return None, None
+
+    def stream_call(self, prompt: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None) -> Generator[str, None, Dict[str, Any]]:
+        """
+        call のストリーミング版。stream=True で受け取った断片をそのまま yield し、
+        全文がそろってから JSON をパースして return する。キャッシュに当たった場合は何も yield しない。
+        """
+        use_cache = use_cache and self.cache is not None
+        config = self._config_for(response_schema)
+        cache_prompt = f"{self.model_name}\n{prompt}"
+        cache_namespace = f"{self.model_name}\n"
+        vector = None
+        if use_cache:
+            cached, vector = self.cache.get(cache_prompt, None, cache_namespace)
+            if cached is not None:
+                return cached
+
+        buffer = []
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                for chunk in self.model.generate_content(prompt, generation_config=config, stream=True):
+                    text = self._chunk_text(chunk)
+                    if text:
+                        buffer.append(text)
+                        yield text
+                break
+            except Exception as e:
+                # 断片をすでに UI へ流した後は送り直さない（同じ内容が二重に表示されるため）
+                if buffer or attempt == self.MAX_RETRIES or not self._is_transient(e):
+                    self._notify("error", f"[GeminiClient Error] API 呼び出し中にエラーが発生しました: {e}")
+                    return {"error": str(e)}
+            time.sleep(self._backoff(attempt))
+
+        text = "".join(buffer)
+        response = self._parse(text, is_retry=False)
+        if response is None:
+            response = self._generate(self._get_json_repair_prompt(text), is_retry=True, config=config)
+        if use_cache:
+            self.cache.put(cache_prompt, response, vector, cache_namespace)
+        return response
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        # 本文を含まない断片（安全性フィルタの情報だけなど）では .text が ValueError を送出する
+        try:
+            return chunk.text or ""
+        except ValueError:
+            return ""
+
+    def _route(self, prompt: str, cached_content: Optional[str]) -> tuple:
+        """(送信に使うモデル, 送る本文, 使った Context Cache の名前 or None) を返す。"""
+        with self._contexts_lock:
+            context = self._contexts.get(cached_content) if cached_content else None
+        if context is not None and prompt.startswith(context[2]):
+            return context[1], prompt[len(context[2]):], cached_content
+        return self.model, prompt, None
+
+    def _config_for(self, response_schema: Optional[Dict[str, Any]]):
+        """スキーマごとの GenerationConfig を1度だけ作って使い回す（スキーマは定数なので id で引く）。"""
+        if response_schema is None:
+            return self.generation_config
+        entry = self._schema_configs.get(id(response_schema))
+        if entry is None or entry[0] is not response_schema:
+            entry = (response_schema, genai.GenerationConfig(response_mime_type="application/json", response_schema=response_schema))
+            self._schema_configs[id(response_schema)] = entry
+        return entry[1]
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        """再送すれば通る見込みのあるエラーか（同じリクエストを送り直すだけなので、生成は冪等に扱える）。"""
+        if google_exceptions is not None and isinstance(error, (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.TooManyRequests,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded,
+        )):
+            return True
+        return isinstance(error, (TimeoutError, ConnectionError))
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # 0.5 秒から倍々に、上限5秒。同時に失敗した呼び出しが揃って再送しないようジッターを足す
+        return min(0.5 * 2 ** attempt, 5.0) + random.uniform(0, 0.5)
+
+    def _with_retry(self, send):
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                return send()
+            except Exception as e:
+                if attempt == self.MAX_RETRIES or not self._is_transient(e):
+                    raise
+            time.sleep(self._backoff(attempt))
+
+    async def _awith_retry(self, send):
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                return await send()
+            except Exception as e:
+                if attempt == self.MAX_RETRIES or not self._is_transient(e):
+                    raise
+            await asyncio.sleep(self._backoff(attempt))
+
+    def _send(self, prompt: str, cached_content: Optional[str] = None, config=None):
+        config = config or self.generation_config
+        return self._with_retry(lambda: self._send_once(prompt, cached_content, config))
+
+    def _send_once(self, prompt: str, cached_content: Optional[str], config):
+        model, body, context_name = self._route(prompt, cached_content)
+        if context_name is not None:
+            try:
+                return model.generate_content(body, generation_config=config)
+            except Exception as e:
+                # 429 / 503 などの一時的なエラーはキャッシュのせいではないので、捨てずに _with_retry に再送させる
+                if self._is_transient(e):
+                    raise
+                # 期限切れなどで使えなくなったキャッシュは捨て、全文をそのまま送る
+                self.release_context_cache(context_name)
+        return self.model.generate_content(
+            prompt,
+            generation_config=config
+        )
+
+    async def _asend(self, prompt: str, cached_content: Optional[str] = None, config=None):
+        config = config or self.generation_config
+        return await self._awith_retry(lambda: self._asend_once(prompt, cached_content, config))
+
+    async def _asend_once(self, prompt: str, cached_content: Optional[str], config):
+        model, body, context_name = self._route(prompt, cached_content)
+        if context_name is not None:
+            try:
+                return await model.generate_content_async(body, generation_config=config)
+            except Exception as e:
+                if self._is_transient(e):
+                    raise
+                # 解放は同期のネットワーク呼び出し（delete）なので、ループを止めないよう別スレッドで行う
+                await asyncio.to_thread(self.release_context_cache, context_name)
+        return await self.model.generate_content_async(
+            prompt,
+            generation_config=config
+        )
+
+    def _parse(self, text: str, is_retry: bool) -> Optional[Dict[str, Any]]:
+        """
+        応答テキストから JSON を取り出してパースする。
+        修復のリトライが必要な場合は None を返す（リトライ後も失敗した場合はエラー情報の dict）。
+        """
+        cleaned_text = self._extract_json(text)
+        
+        if cleaned_text:
+            try:
+                return loads_json(cleaned_text) 
+            except Exception as e_clean:
+                self._notify("warning", f"[GeminiClient Warning] JSONのパースに失敗しました (クリーニング後)。 Error: {e_clean}")
                 
                 if is_retry:
-                    st.error(f"[GeminiClient Error] JSON修復リトライ後も、JSONブロックが見つかりませんでした。")
-                    return {"raw_text": text, "parse_error": "Retry failed: No JSON block found"}
-                else:
-                    st.info(f"[GeminiClient Info] JSON修復のため、LLMにリトライします...")
-                    repair_prompt = self._get_json_repair_prompt(text)
-                    return self.call(repair_prompt, is_retry=True)
+                    self._notify("error", f"[GeminiClient Error] JSON修復リトライにも失敗しました。")
+                    return {"raw_text": text, "parse_error": f"Retry failed: {e_clean}"}
+        else:
+            self._notify("warning", f"[GeminiClient Warning] 応答からJSONブロックが見つかりませんでした。")
+            
+            if is_retry:
+                self._notify("error", f"[GeminiClient Error] JSON修復リトライ後も、JSONブロックが見つかりませんでした。")
+                return {"raw_text": text, "parse_error": "Retry failed: No JSON block found"}
+
+        self._notify("info", f"[GeminiClient Info] JSON修復のため、LLMにリトライします...")
+        return None
+
+    @staticmethod
+    def _response_text(response) -> str:
+        return getattr(response, "text", None) or getattr(response, "response", None) or str(response)
+
+    def _generate(self, prompt: str, is_retry: bool = False, cached_content: Optional[str] = None, config=None) -> Dict[str, Any]:
+        """
+        prompt -> LLM 呼び出し -> JSON クリーニング -> JSON パースを試みる
+        パースに失敗した場合、LLMに修復を依頼するリトライを1回行う。
+        """
+        try:
+            text = self._response_text(self._send(prompt, cached_content, config))
+            parsed = self._parse(text, is_retry)
+            if parsed is None:
+                return self._generate(self._get_json_repair_prompt(text), is_retry=True, config=config)
+            return parsed
                 
         except Exception as e:
-            st.error(f"[GeminiClient Error] API 呼び出し中にエラーが発生しました: {e}")
+            self._notify("error", f"[GeminiClient Error] API 呼び出し中にエラーが発生しました: {e}")
+            if is_retry:
+                return {"error": f"API call failed during retry: {e}"}
+            else:
+                return {"error": str(e)}
+
+    async def _agenerate(self, prompt: str, is_retry: bool = False, cached_content: Optional[str] = None, config=None) -> Dict[str, Any]:
+        """_generate の非同期版。"""
+        try:
+            text = self._response_text(await self._asend(prompt, cached_content, config))
+            parsed = self._parse(text, is_retry)
+            if parsed is None:
+                return await self._agenerate(self._get_json_repair_prompt(text), is_retry=True, config=config)
+            return parsed
+
+        except Exception as e:
+            self._notify("error", f"[GeminiClient Error] API 呼び出し中にエラーが発生しました: {e}")
             if is_retry:
                 return {"error": f"API call failed during retry: {e}"}
             else:
                 return {"error": str(e)}
 
+@st.cache_resource(show_spinner=False)
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    並列呼び出しを流すイベントループ。専用スレッドで回し続け、プロセス内で共有する。
+    SDK の非同期クライアント（gRPC チャネル）はプロセス内で共有され、最初に使ったループに結び付くため、
+    solve ごとにループを作っては閉じると、次の solve 以降の非同期呼び出しがすべて失敗する。
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="evogen-event-loop", daemon=True).start()
+    return loop
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_client(api_key: str) -> GeminiClient:
+    """SDK の初期化を再実行のたびに繰り返さないよう、API キーごとにクライアントを1つだけ作る。"""
+    return GeminiClient(api_key=api_key, cache=get_llm_cache())
 
 # ----------------------------
 # 2) Tavily クライアント (変更なし)
@@ -173,6 +646,10 @@ class TavilyClient:
     Tavily Search API とのやり取りを行うシンプルなクライアント。
     """
     DEFAULT_ENDPOINT = "https://api.tavily.com/search"
+    # 一時的なエラーの再試行（同期版は urllib3 の Retry、非同期版は _post_async で同じ条件を使う）
+    MAX_RETRIES = 3
+    BACKOFF_FACTOR = 0.5
+    RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
 
     def __init__(self, api_key: str, endpoint: str = DEFAULT_ENDPOINT, timeout: int = 15):
         if requests is None:
@@ -180,22 +657,34 @@ class TavilyClient:
         self.api_key = api_key
         self.endpoint = endpoint
         self.timeout = timeout
-
-    def search(self, query: str, num_results: int = 5, domain: Optional[str] = None, lang: Optional[str] = None) -> Dict[str, Any]:
-        headers = {
+        # 接続を使い回し（keep-alive）、検索ごとの TCP/TLS ハンドシェイクを省く。
+        # 同時検索（フェーズ1・2 で最大8件）の分だけ接続をプールし、一時的なエラーは短い間隔で再試行する
+        self.session = requests.Session()
+        self.session.headers.update({
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+            "Authorization": f"Bearer {api_key}"
+        })
+        # 検索は同じクエリを送り直しても結果が変わらない（冪等な）ため、POST も再試行の対象にする
+        retry = Retry(total=self.MAX_RETRIES, backoff_factor=self.BACKOFF_FACTOR, status_forcelist=sorted(self.RETRY_STATUSES), allowed_methods=frozenset(["POST"]), raise_on_status=False)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=retry)
+        self.session.mount("https://", adapter)
+
+    def _payload(self, query: str, num_results: int, domain: Optional[str], lang: Optional[str]) -> Dict[str, Any]:
         payload = {"query": query, "max_results": num_results}
         if domain:
             payload["domain"] = domain
         if lang:
             payload["language"] = lang
+        return payload
+
+    def search(self, query: str, num_results: int = 5, domain: Optional[str] = None, lang: Optional[str] = None) -> Dict[str, Any]:
+        payload = self._payload(query, num_results, domain, lang)
 
         try:
-            resp = requests.post(self.endpoint, headers=headers, json=payload, timeout=self.timeout)
+            # Content-Type はセッションのヘッダで application/json を指定済み
+            resp = self.session.post(self.endpoint, data=dumps_json_bytes(payload), timeout=self.timeout)
             resp.raise_for_status()
-            data = resp.json()
+            data = loads_json(resp.content)
             return data
         except requests.exceptions.RequestException as e:
             return {"error": f"HTTP error: {e}"}
@@ -204,9 +693,292 @@ class TavilyClient:
         except Exception as e:
             return {"error": str(e)}
 
+    def new_async_client(self):
+        """
+        search_async 用の httpx.AsyncClient を作る（httpx が無ければ None）。
+        このクライアント自体は複数のセッションで共有されるため、非同期の接続は呼び出し側（solve）が
+        自分の分だけ作って渡し、使い終わったら aclose で閉じる。
+        """
+        if httpx is None:
+            return None
+        try:
+            return httpx.AsyncClient(http2=True, timeout=self.timeout, headers=dict(self.session.headers))
+        except ImportError:
+            # h2 が無い環境では HTTP/1.1 の接続プールで代用する
+            return httpx.AsyncClient(timeout=self.timeout, headers=dict(self.session.headers))
+
+    async def search_async(self, query: str, num_results: int = 5, domain: Optional[str] = None, lang: Optional[str] = None, client=None) -> Dict[str, Any]:
+        """search の非同期版。client（new_async_client で作ったもの）が無ければ同期版を別スレッドで動かす。"""
+        if httpx is None or client is None:
+            return await asyncio.to_thread(self.search, query, num_results, domain, lang)
+        payload = self._payload(query, num_results, domain, lang)
+
+        try:
+            resp = await self._post_async(client, dumps_json_bytes(payload))
+            resp.raise_for_status()
+            return loads_json(resp.content)
+        except httpx.HTTPError as e:
+            return {"error": f"HTTP error: {e}"}
+        except ValueError as e:
+            return {"error": f"JSON parse error: {e}", "raw": resp.text if 'resp' in locals() else None}
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def _post_async(self, client, body: bytes):
+        """同期版のセッション（urllib3 の Retry）と同じ条件で、一時的なエラーを指数バックオフで再試行する。"""
+        for attempt in range(self.MAX_RETRIES + 1):
+            last = attempt == self.MAX_RETRIES
+            try:
+                resp = await client.post(self.endpoint, content=body)
+            except httpx.TransportError:
+                if last:
+                    raise
+            else:
+                if last or resp.status_code not in self.RETRY_STATUSES:
+                    return resp
+            await asyncio.sleep(min(self.BACKOFF_FACTOR * 2 ** attempt, 5.0) + random.uniform(0, self.BACKOFF_FACTOR))
+
+@st.cache_resource(show_spinner=False)
+def get_tavily_client(api_key: str) -> TavilyClient:
+    """keep-alive のセッション（接続プール）を再実行をまたいで使い回す。"""
+    return TavilyClient(api_key=api_key)
+
 # ----------------------------
 # 3) PromptManager (★修正箇所★)
 # ----------------------------
+# 評価・生成ごとに何度も組み立てるプロンプトの定型部分は、読み込み時に1度だけ作っておき、可変部分だけを format_map で差し込む
+
+# 初期解の生成
+_INITIAL_GENERATION_TEMPLATE = """
+        # 役割: {role}
+        # 指示: {instructions}
+        # 課題文: {problem_statement}
+        # 出力形式: 
+        各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
+        
+        # !!重要!! 
+        - 「specific_method」の内容は、その方法論やメカニズム、その理由などを説明する**2〜4行程度の具体的な文章**にしてください。
+        - 「specific_method」には**箇条書き、マークダウン、ネストされたJSONを使用しないでください。** ただし、**文章内での改行コード(\n)は使用して構いません。**
+
+        {{ 
+          "solutions": [ 
+            {{ 
+              "name": "解決策1の名称", 
+              "summary": "解決策1の簡潔な概要", 
+              "specific_method": "解決策1の具体的な方法や理由を説明する2〜4行の文章です。\nこのように改行を含めても構いません。"
+            }}
+          ] 
+        }}
+        """
+
+# 評価プロンプトの前半（評価者ごとに共通）
+_EVALUATION_PREFIX_TEMPLATE = """
+        # あなたの厳格な役割
+        あなたは「{evaluator_role}」です。
+
+        # あなたの最重要評価ガイドライン
+        {evaluation_guideline}
+
+        # 評価対象の課題
+        {problem_statement}
+        
+        # タスク
+        あなたの「役割」と「最重要評価ガイドライン」に厳密に従い、末尾の「解決案」を評価してください。
+        ガイドラインに照らして、この解決策が課題をどれだけ効果的に解決できるか、または劣っているかを具体的に分析してください。
+
+        # 出力形式 (JSON)
+        以下の形式で、評価結果をJSONで厳密に出力してください。
+        - **total_score**: あなたのガイドラインに基づいた総合評価点 (0〜100点の整数)。
+        - **strengths**: あなたのガイドラインの観点で、特に優れている点。（簡潔に）
+        - **weaknesses**: あなたのガイドラインの観点で、懸念・改善が必要な点。（簡潔に）
+        - **overall_comment**: 評価の総括。（簡潔に）
+
+        {{
+          "total_score": (0-100の整数),
+          "strengths": "（{evaluator_role}の観点で優れている点）",
+          "weaknesses": "（{evaluator_role}の観点で懸念・改善が必要な点）",
+          "overall_comment": "（{evaluator_role}の観点での総括）"
+        }}
+        """
+
+# 評価プロンプトの後半（解決案ごと）
+_EVALUATION_SUFFIX_TEMPLATE = """
+        # 評価対象の解決案
+        - 名称: {name}
+        - 概要: {summary}
+        - 具体的な方法: {specific_method}
+        """
+
+# 複数の解決案をまとめて評価する場合の前半（評価者ごとに共通）
+_BATCH_EVALUATION_PREFIX_TEMPLATE = """
+        # あなたの厳格な役割
+        あなたは「{evaluator_role}」です。
+
+        # あなたの最重要評価ガイドライン
+        {evaluation_guideline}
+
+        # 評価対象の課題
+        {problem_statement}
+        
+        # タスク
+        あなたの「役割」と「最重要評価ガイドライン」に厳密に従い、末尾に列挙した「解決案」を**1件ずつ独立に**評価してください。
+        ガイドラインに照らして、各解決策が課題をどれだけ効果的に解決できるか、または劣っているかを具体的に分析してください。
+        解決案どうしを比べて点数を調整せず、それぞれをガイドラインだけに基づいて採点してください。
+
+        # 出力形式 (JSON)
+        以下の形式で、評価結果をJSONで厳密に出力してください。`evaluations` には、列挙したすべての解決案について、
+        その `id` を付けて1件ずつ、列挙した順に含めてください。
+        - **id**: 解決案の番号（列挙した `id` をそのまま使う）。
+        - **total_score**: あなたのガイドラインに基づいた総合評価点 (0〜100点の整数)。
+        - **strengths**: あなたのガイドラインの観点で、特に優れている点。（簡潔に）
+        - **weaknesses**: あなたのガイドラインの観点で、懸念・改善が必要な点。（簡潔に）
+        - **overall_comment**: 評価の総括。（簡潔に）
+
+        {{
+          "evaluations": [
+            {{
+              "id": 1,
+              "total_score": (0-100の整数),
+              "strengths": "（{evaluator_role}の観点で優れている点）",
+              "weaknesses": "（{evaluator_role}の観点で懸念・改善が必要な点）",
+              "overall_comment": "（{evaluator_role}の観点での総括）"
+            }}
+          ]
+        }}
+        """
+
+# まとめて評価する解決案1件分
+_BATCH_EVALUATION_ITEM_TEMPLATE = """
+        ## 解決案 (id: {id})
+        - 名称: {name}
+        - 概要: {summary}
+        - 具体的な方法: {specific_method}
+"""
+
+# 既存解の進化
+_NEXT_GENERATION_TEMPLATE = """
+        # 役割: {role}
+        # 指示: {instructions}
+        # タスク: 前世代の分析に基づき、次世代の新しい解決策を{num_solutions}個生成してください。
+        # 分析対象1：高評価だった解決案（優れた遺伝子）: 
+        {elite_text}
+        # 分析対象2：低評価だった解決案（学ぶべき教訓）: 
+        {failed_text}
+        # 新しい解決策の生成指示: {raw_instructions}
+        
+        # 出力形式: 
+        各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
+        
+        # !!重要!! 
+        - 「specific_method」の内容は、その方法論やメカニズム、その理由などを説明する**2〜4行程度の具体的な文章**にしてください。
+        - 「specific_method」には**箇条書き、マークダウン、ネストされたJSONを使用しないでください。** ただし、**文章内での改行コード(\n)は使用して構いません。**
+
+        {{ 
+          "solutions": [ 
+            {{ 
+              "name": "新しい解決策1の名称", 
+              "summary": "新しい解決策1の簡潔な概要", 
+              "specific_method": "新しい解決策1の具体的な方法や理由を説明する2〜4行の文章です。\nこのように改行を含めても構いません。"
+            }}
+          ] 
+        }}
+        """
+
+# --- 応答の JSON スキーマ（response_schema として渡し、構造どおりの JSON だけを生成させる） ---
+_SOLUTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "summary": {"type": "string"},
+        "specific_method": {"type": "string"},
+    },
+    "required": ["name", "summary", "specific_method"],
+}
+
+SOLUTION_LIST_SCHEMA = {
+    "type": "object",
+    "properties": {"solutions": {"type": "array", "items": _SOLUTION_SCHEMA}},
+    "required": ["solutions"],
+}
+
+AGENT_TEAM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "solver_agents": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"role": {"type": "string"}, "instructions": {"type": "string"}},
+                "required": ["role", "instructions"],
+            },
+        },
+        "evaluators": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"role": {"type": "string"}, "evaluation_guideline": {"type": "string"}},
+                "required": ["role", "evaluation_guideline"],
+            },
+        },
+    },
+    "required": ["solver_agents", "evaluators"],
+}
+
+TAVILY_QUERIES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis_queries": {"type": "array", "items": {"type": "string"}},
+        "solution_queries": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["analysis_queries", "solution_queries"],
+}
+
+TAVILY_SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary_analysis": {"type": "string"},
+        "summary_solution": {"type": "string"},
+        "key_points": {"type": "array", "items": {"type": "string"}},
+        "top_sources": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "url": {"type": "string"}},
+                "required": ["title", "url"],
+            },
+        },
+    },
+    "required": ["summary_analysis", "summary_solution", "key_points", "top_sources"],
+}
+
+_EVALUATION_PROPERTIES = {
+    "total_score": {"type": "integer"},
+    "strengths": {"type": "string"},
+    "weaknesses": {"type": "string"},
+    "overall_comment": {"type": "string"},
+}
+
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": _EVALUATION_PROPERTIES,
+    "required": list(_EVALUATION_PROPERTIES),
+}
+
+BATCH_EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "evaluations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "integer"}, **_EVALUATION_PROPERTIES},
+                "required": ["id", *_EVALUATION_PROPERTIES],
+            },
+        },
+    },
+    "required": ["evaluations"],
+}
+
 class PromptManager:
     """AIへの指示書（プロンプト）を管理するクラス"""
     
@@ -329,73 +1101,67 @@ class PromptManager:
         """
         (v8.2のまま)
         """
-        return f"""
-        # 役割: {context.get('role', 'あなたは一流のイノベーターです。')}
-        # 指示: {context.get('instructions', f'以下の課題に対し、互いに全く異なるアプローチからの解決策を{num_solutions}個提案してください。')}
-        # 課題文: {problem_statement}
-        # 出力形式: 
-        各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
-        
-        # !!重要!! 
-        - 「specific_method」の内容は、その方法論やメカニズム、その理由などを説明する**2〜4行程度の具体的な文章**にしてください。
-        - 「specific_method」には**箇条書き、マークダウン、ネストされたJSONを使用しないでください。** ただし、**文章内での改行コード(\n)は使用して構いません。**
-
-        {{ 
-          "solutions": [ 
-            {{ 
-              "name": "解決策1の名称", 
-              "summary": "解決策1の簡潔な概要", 
-              "specific_method": "解決策1の具体的な方法や理由を説明する2〜4行の文章です。\nこのように改行を含めても構いません。"
-            }}
-          ] 
-        }}
-        """
+        return _INITIAL_GENERATION_TEMPLATE.format_map({
+            "role": context.get('role', 'あなたは一流のイノベーターです。'),
+            "instructions": context.get('instructions', f'以下の課題に対し、互いに全く異なるアプローチからの解決策を{num_solutions}個提案してください。'),
+            "problem_statement": problem_statement
+        })
 
     # === ★v11.0: 修正点 2 (高精度評価プロンプト構築) ===
-    def get_evaluation_prompt(self, solution: Dict[str, str], problem_statement: str, context: Dict[str, Any]) -> str:
+    def get_evaluation_prefix(self, problem_statement: str, context: Dict[str, Any]) -> str:
         """
-        (★v11.0: 高精度評価プロンプト版★)
-        AIが生成した「役割」と「評価ガイドライン」に基づき、
-        精度の高い評価用プロンプトを動的に構築する。
+        評価プロンプトのうち、解決案によらない前半（役割・ガイドライン・課題・タスク・出力形式）。
+        同じ評価者では全解決案で共通なので、Context Cache に載せて使い回せるよう先頭にまとめる。
         """
-        
         evaluator_role = context.get('role', 'あなたは客観的で厳しい批評家です。')
         # ★修正点: 'instructions' や 'criteria' の代わりに 'evaluation_guideline' を使用
         evaluation_guideline = context.get('evaluation_guideline', '提示された解決案を、課題の要件に基づき厳密に評価してください。')
 
-        return f"""
-        # あなたの厳格な役割
-        あなたは「{evaluator_role}」です。
-
-        # あなたの最重要評価ガイドライン
-        {evaluation_guideline}
-
-        # 評価対象の課題
-        {problem_statement}
-        
-        # 評価対象の解決案
-        - 名称: {solution.get('name', '名称不明')}
-        - 概要: {solution.get('summary', '概要なし')}
-        - 具体的な方法: {solution.get('specific_method', '具体的な方法なし')}
-        
-        # タスク
-        あなたの「役割」と「最重要評価ガイドライン」に厳密に従い、上記の「解決案」を評価してください。
-        ガイドラインに照らして、この解決策が課題をどれだけ効果的に解決できるか、または劣っているかを具体的に分析してください。
+        return _EVALUATION_PREFIX_TEMPLATE.format_map({
+            "evaluator_role": evaluator_role,
+            "evaluation_guideline": evaluation_guideline,
+            "problem_statement": problem_statement
+        })
+
+    def get_evaluation_suffix(self, solution: Dict[str, str]) -> str:
+        """評価プロンプトのうち、解決案ごとに変わる後半。"""
+        return _EVALUATION_SUFFIX_TEMPLATE.format_map({
+            "name": solution.get('name', '名称不明'),
+            "summary": solution.get('summary', '概要なし'),
+            "specific_method": solution.get('specific_method', '具体的な方法なし')
+        })
+
+    def get_batch_evaluation_prefix(self, problem_statement: str, context: Dict[str, Any]) -> str:
+        """複数の解決案を1回の呼び出しで評価するプロンプトの前半。get_evaluation_prefix と同じく評価者ごとに共通。"""
+        return _BATCH_EVALUATION_PREFIX_TEMPLATE.format_map({
+            "evaluator_role": context.get('role', 'あなたは客観的で厳しい批評家です。'),
+            "evaluation_guideline": context.get('evaluation_guideline', '提示された解決案を、課題の要件に基づき厳密に評価してください。'),
+            "problem_statement": problem_statement
+        })
+
+    def get_batch_evaluation_suffix(self, solutions: List[Dict[str, str]]) -> str:
+        """評価対象の解決案を、入力順に 1 から id を振って列挙する。"""
+        return "\n        # 評価対象の解決案\n" + "".join(
+            _BATCH_EVALUATION_ITEM_TEMPLATE.format_map({
+                "id": k + 1,
+                "name": solution.get('name', '名称不明'),
+                "summary": solution.get('summary', '概要なし'),
+                "specific_method": solution.get('specific_method', '具体的な方法なし')
+            })
+            for k, solution in enumerate(solutions)
+        )
 
-        # 出力形式 (JSON)
-        以下の形式で、評価結果をJSONで厳密に出力してください。
-        - **total_score**: あなたのガイドラインに基づいた総合評価点 (0〜100点の整数)。
-        - **strengths**: あなたのガイドラインの観点で、特に優れている点。（簡潔に）
-        - **weaknesses**: あなたのガイドラインの観点で、懸念・改善が必要な点。（簡潔に）
-        - **overall_comment**: 評価の総括。（簡潔に）
+    def get_batch_evaluation_prompt(self, solutions: List[Dict[str, str]], problem_statement: str, context: Dict[str, Any]) -> str:
+        """1体の評価者が、複数の解決案を1回の呼び出しでまとめて評価するためのプロンプト。"""
+        return self.get_batch_evaluation_prefix(problem_statement, context) + self.get_batch_evaluation_suffix(solutions)
 
-        {{
-          "total_score": (0-100の整数),
-          "strengths": "（{evaluator_role}の観点で優れている点）",
-          "weaknesses": "（{evaluator_role}の観点で懸念・改善が必要な点）",
-          "overall_comment": "（{evaluator_role}の観点での総括）"
-        }}
+    def get_evaluation_prompt(self, solution: Dict[str, str], problem_statement: str, context: Dict[str, Any]) -> str:
         """
+        (★v11.0: 高精度評価プロンプト版★)
+        AIが生成した「役割」と「評価ガイドライン」に基づき、
+        精度の高い評価用プロンプトを動的に構築する。
+        """
+        return self.get_evaluation_prefix(problem_statement, context) + self.get_evaluation_suffix(solution)
     # === ★v11.0: 修正点 2 終了★ ===
 
     def get_next_generation_prompt(self, elite_solutions: List[Dict], failed_solutions: List[Dict], problem_statement: str, num_solutions: int, context: Dict[str, str]) -> str:
@@ -403,36 +1169,17 @@ class PromptManager:
         (v8.2のまま)
         既存の解を「進化」させるためのプロンプト (80%の確率で使われる)
         """
-        elite_text = "\n".join([f"- {s['solution'].get('name', 'N/A')} (スコア: {s['evaluation'].get('total_score', 0)})" for s in elite_solutions])
-        failed_text = "\n".join([f"- {s['solution'].get('name', 'N/A')} (弱点: {s['evaluation'].get('weaknesses', 'N/A')})" for s in failed_solutions])
-
-        return f"""
-        # 役割: {context.get('role', 'あなたは優れた戦略家であり編集者です。')}
-        # 指示: {context.get('instructions', '高評価案の良い点を組み合わせ、低評価案の失敗から学び、新しい解決策を生成してください。')}
-        # タスク: 前世代の分析に基づき、次世代の新しい解決策を{num_solutions}個生成してください。
-        # 分析対象1：高評価だった解決案（優れた遺伝子）: 
-        {elite_text}
-        # 分析対象2：低評価だった解決案（学ぶべき教訓）: 
-        {failed_text}
-        # 新しい解決策の生成指示: {context.get('instructions')}
-        
-        # 出力形式: 
-        各解決策に「name」「summary」「specific_method」を必ず含め、JSON形式でリストとして出力してください。
-        
-        # !!重要!! 
-        - 「specific_method」の内容は、その方法論やメカニズム、その理由などを説明する**2〜4行程度の具体的な文章**にしてください。
-        - 「specific_method」には**箇条書き、マークダウン、ネストされたJSONを使用しないでください。** ただし、**文章内での改行コード(\n)は使用して構いません。**
-
-        {{ 
-          "solutions": [ 
-            {{ 
-              "name": "新しい解決策1の名称", 
-              "summary": "新しい解決策1の簡潔な概要", 
-              "specific_method": "新しい解決策1の具体的な方法や理由を説明する2〜4行の文章です。\nこのように改行を含めても構いません。"
-            }}
-          ] 
-        }}
-        """
+        elite_text = "\n".join(f"- {s['solution'].get('name', 'N/A')} (スコア: {s['evaluation'].get('total_score', 0)})" for s in elite_solutions)
+        failed_text = "\n".join(f"- {s['solution'].get('name', 'N/A')} (弱点: {s['evaluation'].get('weaknesses', 'N/A')})" for s in failed_solutions)
+
+        return _NEXT_GENERATION_TEMPLATE.format_map({
+            "role": context.get('role', 'あなたは優れた戦略家であり編集者です。'),
+            "instructions": context.get('instructions', '高評価案の良い点を組み合わせ、低評価案の失敗から学び、新しい解決策を生成してください。'),
+            "raw_instructions": context.get('instructions'),
+            "num_solutions": num_solutions,
+            "elite_text": elite_text,
+            "failed_text": failed_text
+        })
 
     def get_revolutionary_generation_prompt(self, problem_statement: str, num_solutions: int, existing_roles: List[str]) -> str:
         """
@@ -490,49 +1237,140 @@ class PromptManager:
 # ----------------------------
 class EvoGenSolver:
     """元の EvoGenSolver（主要ロジック）"""
-    def __init__(self, llm_client: LLMClient, num_solutions_per_generation: int = 10):
-        self.client = llm_client
+    # ストリーミング中に UI へ流す、受信済みテキスト末尾の文字数
+    STREAM_PREVIEW_CHARS = 300
+    # 1回の呼び出しでまとめて評価する解決案数の上限。これを超える場合は出力トークンが長くなりすぎるため、解決案ごとに評価する
+    BATCH_EVALUATION_MAX = 10
+
+    def __init__(self, llm_client: LLMClient, num_solutions_per_generation: int = 10, max_concurrency: int = 16):
+        # 並列処理の途中で出た (レベル, メッセージ)。solve が結果を yield するたびにまとめて UI へ流す。
+        # クライアントはセッション間で共有されるので、書き込み先をこのソルバーの分に差し替えて使う
+        self._log: collections.deque = collections.deque()
+        with_log = getattr(llm_client, "with_log", None)
+        self.client = with_log(self._log) if with_log is not None else llm_client
         self.num_solutions = num_solutions_per_generation 
         self.prompter = PromptManager()
         self.history = []
-
-    def _call_llm(self, prompt: str) -> Dict[str, Any]:
-        return self.client.call(prompt) 
+        # LLM 呼び出しを同時に発行する数の上限（レート制限に当たらない程度に抑える）
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # このソルバーが共有ループに投げて、まだ結果を受け取っていない呼び出し。solve の終わりに取り消す
+        self._pending: set = set()
+        # 評価者ごとの前置きを登録した Context Cache の名前（登録できなかった評価者は None）。solve の終わりに解放する
+        self._evaluator_contexts: Dict[str, Optional[str]] = {}
+
+    def _call_llm(self, prompt: str, use_cache: bool = True, semantic_key: Optional[str] = None, namespace: str = "", cached_content: Optional[str] = None, response_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self.client.call(prompt, use_cache=use_cache, semantic_key=semantic_key, namespace=namespace, cached_content=cached_content, response_schema=response_schema) 
+
+    def _evaluator_context(self, key: str, prefix: str) -> Optional[str]:
+        """評価者の前置きを Context Cache に1度だけ登録し、世代をまたいで使い回す。"""
+        if key not in self._evaluator_contexts:
+            create = getattr(self.client, "create_context_cache", None)
+            self._evaluator_contexts[key] = create(prefix) if create is not None else None
+        return self._evaluator_contexts[key]
+
+    def _release_evaluator_contexts(self) -> None:
+        release = getattr(self.client, "release_context_cache", None)
+        for name in self._evaluator_contexts.values():
+            if name is not None and release is not None:
+                release(name)
+        self._evaluator_contexts = {}
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        並列呼び出し用のイベントループ（get_event_loop で共有する、回り続けているループ）。
+        solve はジェネレータのまま保ち、並列区間だけこのループにコルーチンを投げて、完了した順に UI へ逐次 yield する。
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return get_event_loop()
+
+    def _run(self, coroutine) -> Any:
+        """コルーチンを共有ループで1つ実行し、終わるまで待って結果を返す。"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._get_loop()).result()
+
+    def _cancel_pending(self) -> None:
+        # 中断で残った呼び出しは取り消し、取り消しが反映されるまで待つ（ループ自体は他の solve と共有なので閉じない）
+        pending, self._pending = self._pending, set()
+        for future in pending:
+            future.cancel()
+        if pending:
+            wait(pending, timeout=5)
+
+    async def _bounded(self, awaitable):
+        async with self._semaphore:
+            return await awaitable
+
+    def _as_completed(self, jobs: Dict[Any, Any]) -> Generator[tuple, None, None]:
+        """{キー: コルーチン} を同時に走らせ、完了した順に (キー, 結果 or 例外) を返す。"""
+        loop = self._get_loop()
+        futures = {asyncio.run_coroutine_threadsafe(self._bounded(coroutine), loop): key for key, coroutine in jobs.items()}
+        self._pending.update(futures)
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._pending.discard(future)
+                yield futures[future], (future.exception() or future.result())
 
     def _generate_agent_personas(self, problem_statement: str) -> Dict:
         # (v11.0 のプロンプトが呼ばれる)
         prompt = self.prompter.get_agent_personas_prompt(problem_statement)
-        return self._call_llm(prompt)
+        # 言い換えただけの課題なら、過去に編成したチームを再利用する
+        return self._call_llm(prompt, semantic_key=problem_statement, namespace="agent_personas", response_schema=AGENT_TEAM_SCHEMA)
 
-    def _generate_initial_solutions(self, problem_statement: str, context: Dict) -> List[Dict[str, str]]:
-        # (v9.0のまま)
+    def _stream_llm(self, prompt: str, label: str, use_cache: bool = True, response_schema: Optional[Dict[str, Any]] = None) -> Generator[str, None, Dict[str, Any]]:
+        """
+        LLM の応答をストリーミングで受け取り、受信中の末尾を label 付きで yield する。
+        全文を受け取ってパースした結果を return する。
+        """
+        received = ""
+        stream = self.client.stream_call(prompt, use_cache=use_cache, response_schema=response_schema)
+        while True:
+            try:
+                chunk = next(stream)
+            except StopIteration as done:
+                return done.value
+            received += chunk
+            yield f"{label}\n\n```\n…{received[-self.STREAM_PREVIEW_CHARS:]}\n```"
+
+    def _generate_initial_solutions(self, problem_statement: str, context: Dict) -> Generator[str | List[Dict[str, str]], None, None]:
+        # (v9.0のまま / 各エージェントの応答はストリーミングで受け取り、受信中の内容を UI に流す)
         initial_agent_list = context 
         if not isinstance(initial_agent_list, list) or len(initial_agent_list) == 0:
-            st.warning(f"[EvoGenSolver] 解決・進化エージェントのリストが不正です。")
-            return []
+            self._log.append(("warning", f"[EvoGenSolver] 解決・進化エージェントのリストが不正です。"))
+            yield []
+            return
         
         num_initial_agents = len(initial_agent_list)
-        st.info(f"💡 {num_initial_agents}体の専門エージェントが初期解（10個）を分担して生成中...")
+        self._log.append(("info", f"💡 {num_initial_agents}体の専門エージェントが初期解（10個）を分担して生成中..."))
         
+        # ループ内で繰り返し引く属性はローカルに束縛しておく
+        build_prompt = self.prompter.get_initial_generation_prompt
+        stream_llm = self._stream_llm
+        log = self._log.append
         all_solutions = []
         for i, agent_context in enumerate(initial_agent_list):
-            st.caption(f"  - エージェント {i+1}/{num_initial_agents} ({agent_context.get('role', 'N/A')}) が生成中...")
+            label = f"  - エージェント {i+1}/{num_initial_agents} ({agent_context.get('role', 'N/A')}) が生成中..."
+            log(("caption", label))
+            yield label
             
-            prompt = self.prompter.get_initial_generation_prompt(problem_statement, 1, agent_context)
-            response = self._call_llm(prompt) 
+            prompt = build_prompt(problem_statement, 1, agent_context)
+            # 生成は毎回新しい案を得たいので、初期解もキャッシュを使わない（同じ課題で同じ Generation 0 を再生しない）
+            response = yield from stream_llm(prompt, label, use_cache=False, response_schema=SOLUTION_LIST_SCHEMA)
             
             if isinstance(response, dict) and "solutions" in response and isinstance(response["solutions"], list) and len(response["solutions"]) > 0:
                 all_solutions.append(response["solutions"][0])
             else:
-                st.warning(f"[EvoGenSolver] エージェント {i+1} が不正な形式を返しました。デバッグ情報: {response}")
+                log(("warning", f"[EvoGenSolver] エージェント {i+1} が不正な形式を返しました。デバッグ情報: {response}"))
                 
-        return all_solutions
+        yield all_solutions
 
     def _evaluate_solutions(self, solutions: List[Dict[str, str]], problem_statement: str, context: Dict) -> Generator[str | List[Dict], None, None]:
         # (v9.0のまま / v11.0 の高精度評価プロンプトでも集計ロジックは変更不要)
         evaluator_agent_list = context
         if not isinstance(evaluator_agent_list, list) or len(evaluator_agent_list) == 0:
-            st.error("[EvoGenSolver] 評価エージェントのリストが不正です。処理を中断します。")
+            self._log.append(("error", "[EvoGenSolver] 評価エージェントのリストが不正です。処理を中断します。"))
             yield []
             return
 
@@ -543,78 +1381,182 @@ class EvoGenSolver:
 
         num_evaluators = len(evaluator_agent_list)
 
-        for i, solution in enumerate(solutions):
+        valid_solutions = []
+        for solution in solutions:
             if not isinstance(solution, dict) or "name" not in solution:
                 yield f"  - 評価スキップ: 不正な形式の解決策データです。"
                 continue
-                
-            yield f"  - 評価中 {i+1}/{len(solutions)}: {solution.get('name', '名称不明')} ( {num_evaluators}体のエージェントによる評価)"
-
-            individual_evaluations = []
-            
-            for j, eval_context in enumerate(evaluator_agent_list):
-                yield f"    - 評価者 {j+1}/{num_evaluators} ({eval_context.get('role', 'N/A')}) が評価..."
-                
-                # (v11.0 の高精度評価プロンプトがここで生成される)
-                prompt = self.prompter.get_evaluation_prompt(solution, problem_statement, eval_context)
-                evaluation = self._call_llm(prompt)
-                
-                # (v11.0 の出力JSONにも total_score が含まれるため、このチェックは有効)
-                if isinstance(evaluation, dict) and "total_score" in evaluation and "error" not in evaluation:
-                    individual_evaluations.append(evaluation)
-                else:
-                    st.warning(f"[EvoGenSolver] 解決策 '{solution.get('name', 'N/A')}' の評価者 {j+1} が不正な形式を返しました。デバッグ情報: {evaluation}")
+            valid_solutions.append(solution)
+
+        # 評価者ごとに全解決案をまとめて1回で評価し、一括評価できなかった (解決策, 評価者) だけを個別に評価し直す
+        batch = len(valid_solutions) <= self.BATCH_EVALUATION_MAX
+        yield f"  - {len(valid_solutions)}件の解決策を {num_evaluators}体のエージェントで並列に評価中{'（評価者ごとに一括）' if batch else ''}..."
+        individual_results: Dict[int, List[Optional[Dict]]] = {i: [None] * num_evaluators for i in range(len(valid_solutions))}
+        pending_counts = {i: num_evaluators for i in range(len(valid_solutions))}
+        aggregated_results: Dict[int, Dict] = {}
+
+        # 近似一致のキャッシュは評価者（役割・ガイドライン）と課題ごとに分け、解決策の中身だけで比べる
+        namespaces = [
+            "evaluation\n" + hashlib.sha256(f"{problem_statement}\n{c.get('role', '')}\n{c.get('evaluation_guideline', '')}".encode("utf-8")).hexdigest()
+            for c in evaluator_agent_list
+        ]
 
+        # 完了ごとに繰り返し引く属性・名前はローカルに束縛しておく
+        acall = self.client.acall
+        log = self._log.append
+        is_valid = self._is_valid_evaluation
+        names = [solution.get('name', '名称不明') for solution in valid_solutions]
+        roles = [c.get('role', 'N/A') for c in evaluator_agent_list]
+
+        def settle(i: int, j: int, evaluation: Optional[Dict]) -> Generator[str, None, None]:
+            # 1件の (解決策, 評価者) の結果を記録し、その解決策の評価者がそろったら集計する
+            if evaluation is not None:
+                individual_results[i][j] = evaluation
+            pending_counts[i] -= 1
+            if pending_counts[i]:
+                return
+
+            # 評価者の並び順は元のまま保って集計する
+            individual_evaluations = [e for e in individual_results[i] if e is not None]
             if not individual_evaluations:
-                st.warning(f"[EvoGenSolver] 解決策 '{solution.get('name', 'N/A')}' の有効な評価がありませんでした。")
-                continue
-
-            # (v11.0 でもこの集計ロジックは有効)
-            total_score_sum = sum(e.get('total_score', 0) for e in individual_evaluations)
-            aggregated_score = round(total_score_sum / len(individual_evaluations))
-            
-            agg_strengths = "\n---\n".join([f"評価者{k+1} ({e.get('role', 'N/A')}):\n{e.get('strengths', 'N/A')}" for k, e in enumerate(individual_evaluations)])
-            agg_weaknesses = "\n---\n".join([f"評価者{k+1} ({e.get('role', 'N/A')}):\n{e.get('weaknesses', 'N/A')}" for k, e in enumerate(individual_evaluations)])
-            agg_comment = "\n---\n".join([f"評価者{k+1} ({e.get('role', 'N/A')}):\n{e.get('overall_comment', 'N/A')}" for k, e in enumerate(individual_evaluations)])
-
-            aggregated_evaluation = {
-                "total_score": aggregated_score,
-                "strengths": agg_strengths,
-                "weaknesses": agg_weaknesses,
-                "overall_comment": agg_comment,
-                "individual_evals": individual_evaluations 
+                log(("warning", f"[EvoGenSolver] 解決策 '{names[i]}' の有効な評価がありませんでした。"))
+                return
+            aggregated_results[i] = self._aggregate_evaluations(individual_evaluations)
+            yield f"    - 総合評価スコア: {aggregated_results[i]['total_score']} ({names[i]})"
+
+        retry = [(i, j) for j in range(num_evaluators) for i in range(len(valid_solutions))]
+        if batch:
+            retry = []
+            batch_prefixes = [self.prompter.get_batch_evaluation_prefix(problem_statement, c) for c in evaluator_agent_list]
+            batch_contexts = [self._evaluator_context(namespaces[j] + "\nbatch", batch_prefixes[j]) for j in range(num_evaluators)]
+            batch_suffix = self.prompter.get_batch_evaluation_suffix(valid_solutions)
+            jobs = {
+                j: acall(batch_prefixes[j] + batch_suffix, namespace=namespaces[j] + "\nbatch", cached_content=batch_contexts[j], response_schema=BATCH_EVALUATION_SCHEMA)
+                for j in range(num_evaluators)
             }
-            
-            evaluated_solutions.append({"solution": solution, "evaluation": aggregated_evaluation})
-            yield f"    - 総合評価スコア: {aggregated_score}"
+            for j, response in self._as_completed(jobs):
+                evaluations = self._split_batch_evaluations(response, len(valid_solutions))
+                missing = [i for i, e in enumerate(evaluations) if e is None]
+                if missing:
+                    log(("warning", f"[EvoGenSolver] 評価者 {j+1} の一括評価で {len(missing)}件が不正な形式だったため、個別に評価し直します。"))
+                yield f"    - 評価者 {j+1}/{num_evaluators} ({roles[j]}) が {len(valid_solutions) - len(missing)}件を一括評価"
+                for i, evaluation in enumerate(evaluations):
+                    if evaluation is None:
+                        retry.append((i, j))
+                    else:
+                        yield from settle(i, j, evaluation)
+
+        if retry:
+            # (v11.0 の高精度評価プロンプト) 解決案によらない前半は評価者ごとに1度だけ作り、Context Cache に載せる
+            needed = sorted({j for _, j in retry})
+            prefixes = {j: self.prompter.get_evaluation_prefix(problem_statement, evaluator_agent_list[j]) for j in needed}
+            contexts = {j: self._evaluator_context(namespaces[j], prefixes[j]) for j in needed}
+            suffixes = {}
+            solution_texts = {}
+            for i in sorted({i for i, _ in retry}):
+                solution = valid_solutions[i]
+                suffixes[i] = self.prompter.get_evaluation_suffix(solution)
+                solution_texts[i] = f"{solution.get('name', '')}\n{solution.get('summary', '')}\n{solution.get('specific_method', '')}"
+
+            jobs = {
+                (i, j): acall(prefixes[j] + suffixes[i], semantic_key=solution_texts[i], namespace=namespaces[j], cached_content=contexts[j], response_schema=EVALUATION_SCHEMA)
+                for i, j in retry
+            }
+
+            for (i, j), evaluation in self._as_completed(jobs):
+                if isinstance(evaluation, BaseException):
+                    evaluation = {"error": str(evaluation)}
+
+                # (v11.0 の出力JSONにも total_score が含まれるため、このチェックは有効)
+                if not is_valid(evaluation):
+                    log(("warning", f"[EvoGenSolver] 解決策 '{names[i]}' の評価者 {j+1} が不正な形式を返しました。デバッグ情報: {evaluation}"))
+                    evaluation = None
+                yield f"    - 評価者 {j+1}/{num_evaluators} ({roles[j]}) が評価: {names[i]}"
+                yield from settle(i, j, evaluation)
 
+        # 完了順ではなく元の順序で返す。スコア順が要る箇所（エリート選択・表示）は、必要な件数だけその場で選ぶ
+        for i in sorted(aggregated_results):
+            evaluated_solutions.append({"solution": valid_solutions[i], "evaluation": aggregated_results[i]})
 
-        evaluated_solutions.sort(key=lambda x: x.get("evaluation", {}).get("total_score", 0), reverse=True)
         yield evaluated_solutions
 
-    def _generate_next_generation(self, evaluated_solutions: List[Dict], problem_statement: str, context: Dict) -> List[Dict[str, str]]:
-        # (v9.0のまま)
+    @staticmethod
+    def _score_of(evaluated_solution: Dict) -> int:
+        return evaluated_solution.get("evaluation", {}).get("total_score", 0)
+
+    @staticmethod
+    def _is_valid_evaluation(evaluation: Any) -> bool:
+        return isinstance(evaluation, dict) and "total_score" in evaluation and "error" not in evaluation
+
+    def _split_batch_evaluations(self, response: Any, num_solutions: int) -> List[Optional[Dict]]:
+        """
+        一括評価の応答を入力順の評価リストに戻す。id で対応を取り、id が使えない場合は件数が一致するときだけ並び順で対応させる。
+        取り出せなかった解決案は None。
+        """
+        evaluations: List[Optional[Dict]] = [None] * num_solutions
+        items = response.get("evaluations") if isinstance(response, dict) and "error" not in response else None
+        if not isinstance(items, list):
+            return evaluations
+        by_id = {}
+        for item in items:
+            if self._is_valid_evaluation(item) and isinstance(item.get("id"), int) and 1 <= item["id"] <= num_solutions:
+                by_id.setdefault(item["id"] - 1, item)
+        if not by_id and len(items) == num_solutions:
+            by_id = {i: item for i, item in enumerate(items) if self._is_valid_evaluation(item)}
+        for i, item in by_id.items():
+            evaluations[i] = {k: v for k, v in item.items() if k != "id"}
+        return evaluations
+
+    @staticmethod
+    def _aggregate_evaluations(individual_evaluations: List[Dict]) -> Dict[str, Any]:
+        # (v11.0 でもこの集計ロジックは有効)
+        total_score_sum = sum(e.get('total_score', 0) for e in individual_evaluations)
+        aggregated_score = round(total_score_sum / len(individual_evaluations))
+        
+        agg_strengths = "\n---\n".join([f"評価者{k+1} ({e.get('role', 'N/A')}):\n{e.get('strengths', 'N/A')}" for k, e in enumerate(individual_evaluations)])
+        agg_weaknesses = "\n---\n".join([f"評価者{k+1} ({e.get('role', 'N/A')}):\n{e.get('weaknesses', 'N/A')}" for k, e in enumerate(individual_evaluations)])
+        agg_comment = "\n---\n".join([f"評価者{k+1} ({e.get('role', 'N/A')}):\n{e.get('overall_comment', 'N/A')}" for k, e in enumerate(individual_evaluations)])
+
+        return {
+            "total_score": aggregated_score,
+            "strengths": agg_strengths,
+            "weaknesses": agg_weaknesses,
+            "overall_comment": agg_comment,
+            "individual_evals": individual_evaluations 
+        }
+
+    def _generate_next_generation(self, evaluated_solutions: List[Dict], problem_statement: str, context: Dict) -> Generator[str | List[Dict[str, str]], None, None]:
+        # (v9.0のまま / エージェントごとの進捗を yield し、最後に新しい解決策のリストを yield する)
         solver_agent_list = context 
         if not isinstance(solver_agent_list, list) or len(solver_agent_list) == 0:
-            st.warning(f"[EvoGenSolver] 解決・進化エージェントのリストが不正です。")
-            return []
+            self._log.append(("warning", f"[EvoGenSolver] 解決・進化エージェントのリストが不正です。"))
+            yield []
+            return
 
+        # 上位 num_elites 件だけを部分選択する（全件のソートはしない）。同点は元の順序の早いほうを残す
         num_elites = max(1, int(len(evaluated_solutions) * 0.4))
-        elite_solutions = evaluated_solutions[:num_elites]
-        failed_solutions = evaluated_solutions[num_elites:]
+        elite_solutions = heapq.nlargest(num_elites, evaluated_solutions, key=self._score_of)
+        elite_ids = {id(s) for s in elite_solutions}
+        failed_solutions = [s for s in evaluated_solutions if id(s) not in elite_ids]
+
+        self._log.append(("info", f"🚀 {self.num_solutions} 体の解決・進化エージェントを選出して次世代を生成..."))
 
-        st.info(f"🚀 {self.num_solutions} 体の解決・進化エージェントを選出して次世代を生成...")
+        # ループ内で繰り返し引く属性や、ループ中に変わらない値は先に用意しておく
+        num_solutions = self.num_solutions
+        build_revolutionary = self.prompter.get_revolutionary_generation_prompt
+        build_next = self.prompter.get_next_generation_prompt
+        call_llm = self._call_llm
+        log = self._log.append
+        existing_roles = [a.get('role', 'N/A') for a in solver_agent_list]
 
         new_solutions = []
-        for i in range(self.num_solutions):
+        for i in range(num_solutions):
             
             if random.random() < 0.20:
                 # 20%の確率: 革新 (新しいエージェントを動的生成)
-                st.caption(f"  - ⚡ (突然変異) エージェント {i+1}/{self.num_solutions} が「新規エージェントの定義」と「革新的な解の生成」を実行...")
+                label = f"  - ⚡ (突然変異) エージェント {i+1}/{num_solutions} が「新規エージェントの定義」と「革新的な解の生成」を実行..."
                 
-                existing_roles = [a.get('role', 'N/A') for a in solver_agent_list]
-                
-                prompt = self.prompter.get_revolutionary_generation_prompt(
+                prompt = build_revolutionary(
                     problem_statement, 
                     1, 
                     existing_roles 
@@ -622,9 +1564,9 @@ class EvoGenSolver:
             else:
                 # 80%の確率: 進化 (既存エージェントを再利用)
                 selected_agent_context = random.choice(solver_agent_list) 
-                st.caption(f"  - 🧬 (進化) エージェント {i+1}/{self.num_solutions} ({selected_agent_context.get('role', 'N/A')}) が「既存の解」を進化...")
+                label = f"  - 🧬 (進化) エージェント {i+1}/{num_solutions} ({selected_agent_context.get('role', 'N/A')}) が「既存の解」を進化..."
                 
-                prompt = self.prompter.get_next_generation_prompt(
+                prompt = build_next(
                     elite_solutions, 
                     failed_solutions, 
                     problem_statement, 
@@ -632,16 +1574,44 @@ class EvoGenSolver:
                     selected_agent_context
                 )
             
-            response = self._call_llm(prompt) 
+            log(("caption", label))
+            yield label
+
+            # 突然変異のプロンプトは毎回同じ文面になるため、キャッシュを使わずに毎回新しい案を得る
+            response = call_llm(prompt, use_cache=False, response_schema=SOLUTION_LIST_SCHEMA) 
             
             if isinstance(response, dict) and "solutions" in response and isinstance(response["solutions"], list) and len(response["solutions"]) > 0:
                 new_solutions.append(response["solutions"][0])
             else:
-                st.warning(f"[EvoGenSolver] エージェント {i+1} が不正な形式を返しました。デバッグ情報: {response}")
+                log(("warning", f"[EvoGenSolver] エージェント {i+1} が不正な形式を返しました。デバッグ情報: {response}"))
+
+        yield new_solutions
 
-        return new_solutions
+    def _drain_log(self) -> Generator[Dict, None, None]:
+        """溜まった警告・エラー（クライアント側のものも含む）を {"log": {...}} として順に返す。"""
+        client_log = getattr(self.client, "log", None)
+        while client_log and client_log is not self._log:
+            self._log.append(client_log.popleft())
+        while self._log:
+            level, message = self._log.popleft()
+            yield {"log": {"level": level, "message": message}}
 
     def solve(self, problem_statement: str, generations: int = 3) -> Generator[str | Dict, None, None]:
+        try:
+            for item in self._evolve(problem_statement, generations):
+                yield from self._drain_log()
+                yield item
+            yield from self._drain_log()
+        finally:
+            # 途中で中断された場合も、登録した Context Cache や実行中の呼び出しは残さない
+            self._release_evaluator_contexts()
+            self._cancel_pending()
+            # まとめ書きにしている近似一致キャッシュの残りを書き出す
+            flush = getattr(getattr(self.client, "cache", None), "flush", None)
+            if flush is not None:
+                flush()
+
+    def _evolve(self, problem_statement: str, generations: int = 3) -> Generator[str | Dict, None, None]:
         # (v9.0のまま)
         self.history = []
 
@@ -657,7 +1627,12 @@ class EvoGenSolver:
         yield {"agent_team": agent_personas}
 
         yield "\n--- 💡 Generation 0: 最初のアイデア (10個) を生成中... ---"
-        solutions = self._generate_initial_solutions(problem_statement, agent_personas["solver_agents"])
+        solutions = []
+        for item in self._generate_initial_solutions(problem_statement, agent_personas["solver_agents"]):
+            if isinstance(item, str):
+                yield item
+            else:
+                solutions = item
         
         if not solutions:
              yield "エラー: 最初の解決策生成に失敗しました。AIが適切な応答を返さなかった可能性があります。処理を終了します。"
@@ -687,7 +1662,12 @@ class EvoGenSolver:
                 yield f"エラー: 前世代 ({i-1}) の有効な評価結果がありません。進化を停止します。"
                 break
             
-            solutions = self._generate_next_generation(previous_generation_results, problem_statement, agent_personas["solver_agents"]) 
+            solutions = []
+            for item in self._generate_next_generation(previous_generation_results, problem_statement, agent_personas["solver_agents"]):
+                if isinstance(item, str):
+                    yield item
+                else:
+                    solutions = item
 
             if not solutions:
                 yield f"エラー: Generation {i} の解決策生成に失敗しました。AIが適切な応答を返さなかった可能性があります。処理を終了します。"
@@ -720,21 +1700,70 @@ class EvoGenSolver_Tavily(EvoGenSolver):
     Tavily を用いて課題に関連する最新情報を収集し、その情報を
     問題文に組み込んで EvoGen のフローを回す拡張版。
     """
+    # 要約プロンプトに載せるスニペットの上限（フェーズごとの見積もりトークン数と、1件あたりの文字数）
+    SNIPPET_TOKEN_BUDGET = 1500
+    SNIPPET_MAX_CHARS = 200
+
     def __init__(self, llm_client: LLMClient, tavily_client: TavilyClient, num_solutions_per_generation: int = 10, tavily_results_per_search: int = 5):
         super().__init__(llm_client, num_solutions_per_generation)
         self.tavily = tavily_client
         self.tavily_results_per_query = tavily_results_per_search 
 
-    def _get_snippet_text(self, results: List[Dict[str, Any]], max_snippets: int = 5) -> str:
-        # (v9.0のまま)
+    @staticmethod
+    def _approx_tokens(text: str) -> int:
+        # 英数字はおよそ4文字で1トークン、日本語などの非 ASCII 文字はおよそ1文字で1トークンとして見積もる
+        ascii_chars = sum(1 for c in text if c.isascii())
+        return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+    def _get_snippet_text(self, results: List[Dict[str, Any]], token_budget: Optional[int] = None) -> str:
+        """
+        関連度 (score) の高い順に、各スニペットを SNIPPET_MAX_CHARS 文字に切り詰めて並べ、
+        見積もりトークン数が token_budget に達したところで打ち切る。冗長な検索結果が1件あっても要約プロンプトが膨らまない。
+        """
+        budget = self.SNIPPET_TOKEN_BUDGET if token_budget is None else token_budget
         snippet_texts = []
-        for r in results[:min(len(results), max_snippets)]:
+        used = 0
+        for r in sorted(results, key=lambda r: r.get("score") or 0, reverse=True):
             title = r.get("title", "")
             snippet = r.get("snippet", "") or r.get("description", "")
+            if len(snippet) > self.SNIPPET_MAX_CHARS:
+                snippet = snippet[:self.SNIPPET_MAX_CHARS] + "…"
             url = r.get("url", "")
-            snippet_texts.append(f"Title: {title}\nSnippet: {snippet}\nURL: {url}\n---")
+            text = f"Title: {title}\nSnippet: {snippet}\nURL: {url}\n---"
+            cost = self._approx_tokens(text)
+            if snippet_texts and used + cost > budget:
+                break
+            snippet_texts.append(text)
+            used += cost
         return "\n".join(snippet_texts)
 
+    @staticmethod
+    def _shingles(text: str, size: int = 5) -> set:
+        text = " ".join(text.split())
+        return {text[i:i + size] for i in range(max(1, len(text) - size + 1))} if text else set()
+
+    def _dedupe_results(self, results: List[Dict[str, Any]], threshold: float = 0.8) -> List[Dict[str, Any]]:
+        """
+        複数クエリの結果を連結したリストから、同じ URL と、本文がほぼ同じ（5文字シングルの Jaccard 係数 >= threshold）
+        結果を除く。要約 LLM に送るスニペット枠とトークンを重複で無駄にしないため、先に出た（上位の）結果を残す。
+        """
+        seen_urls = set()
+        kept_shingles: List[set] = []
+        deduped = []
+        for r in results:
+            url = (r.get("url") or "").split("#", 1)[0].rstrip("/")
+            if url and url in seen_urls:
+                continue
+            shingles = self._shingles(r.get("snippet", "") or r.get("description", "") or r.get("content", ""))
+            if shingles and any(len(shingles & k) / len(shingles | k) >= threshold for k in kept_shingles):
+                continue
+            if url:
+                seen_urls.add(url)
+            if shingles:
+                kept_shingles.append(shingles)
+            deduped.append(r)
+        return deduped
+
     def _summarize_multi_phase_results_with_llm(
         self, 
         problem_statement: str, 
@@ -745,8 +1774,10 @@ class EvoGenSolver_Tavily(EvoGenSolver):
         if not analysis_results and not solution_results:
             return problem_statement
 
-        analysis_snippets = self._get_snippet_text(analysis_results, max_snippets=5)
-        solution_snippets = self._get_snippet_text(solution_results, max_snippets=5) 
+        analysis_results = self._dedupe_results(analysis_results)
+        solution_results = self._dedupe_results(solution_results)
+        analysis_snippets = self._get_snippet_text(analysis_results)
+        solution_snippets = self._get_snippet_text(solution_results) 
 
         prompt = f"""
         あなたは、2段階のウェブ調査結果を分析し、元の課題文に統合する専門家です。
@@ -778,7 +1809,7 @@ class EvoGenSolver_Tavily(EvoGenSolver):
         }}
         """
         
-        llm_ret = self._call_llm(prompt) 
+        llm_ret = self._call_llm(prompt, response_schema=TAVILY_SUMMARY_SCHEMA) 
         
         if isinstance(llm_ret, dict) and any(k in llm_ret for k in ["summary_analysis", "summary_solution", "key_points"]):
             try:
@@ -815,12 +1846,12 @@ class EvoGenSolver_Tavily(EvoGenSolver):
                    "\n\n" + "--- (以下、元の課題文) ---\n" + problem_statement
         return fallback
 
-    def solve(self, problem_statement: str, generations: int = 3) -> Generator[str | Dict, None, None]:
-        # (v10.1のまま)
+    def _evolve(self, problem_statement: str, generations: int = 3) -> Generator[str | Dict, None, None]:
+        # (v10.1のまま) solve の後片付け（Context Cache・実行中の呼び出し）がリサーチ中の中断にも効くよう、_evolve を拡張する
         
         yield "--- 💡 LLMによる最適な検索クエリ（フェーズ1 & 2）を生成中... ---"
         prompt = self.prompter.get_tavily_multi_phase_query_prompt(problem_statement)
-        query_response = self._call_llm(prompt)
+        query_response = self._call_llm(prompt, semantic_key=problem_statement, namespace="tavily_queries", response_schema=TAVILY_QUERIES_SCHEMA)
 
         if not isinstance(query_response, dict) or ("analysis_queries" not in query_response and "solution_queries" not in query_response):
             yield f"エラー: Tavilyクエリの生成に失敗しました。AIからの応答が不正です: {query_response}"
@@ -833,30 +1864,39 @@ class EvoGenSolver_Tavily(EvoGenSolver):
             yield f"  - 分析クエリ: {', '.join(analysis_queries) if analysis_queries else 'なし'}"
             yield f"  - 解決策クエリ: {', '.join(solution_queries) if solution_queries else 'なし'}"
             
+            # 2フェーズのクエリをまとめて同時に検索し、結果はフェーズごと・クエリ順に戻す
+            tagged_queries = [("analysis", q) for q in analysis_queries if q.strip()] + \
+                             [("solution", q) for q in solution_queries if q.strip()]
+            phase_labels = {"analysis": "分析", "solution": "解決策"}
+            search_results: List[Optional[Dict[str, Any]]] = [None] * len(tagged_queries)
+
+            if tagged_queries:
+                yield f"--- 🌐 フェーズ1・2のリサーチ（{len(tagged_queries)}件のクエリ）を同時に開始... ---"
+                search = getattr(self.tavily, "search_async", None)
+                # 非同期の接続はこの solve の分だけ作り、検索が終わったら閉じる（Tavily クライアント自体はセッション間で共有）
+                new_async_client = getattr(self.tavily, "new_async_client", None)
+                http = new_async_client() if search is not None and new_async_client is not None else None
+                jobs = {
+                    k: search(q, num_results=self.tavily_results_per_query, client=http) if search is not None
+                    else asyncio.to_thread(self.tavily.search, q, num_results=self.tavily_results_per_query)
+                    for k, (_, q) in enumerate(tagged_queries)
+                }
+                try:
+                    for k, result in self._as_completed(jobs):
+                        phase, q = tagged_queries[k]
+                        search_results[k] = {"error": str(result)} if isinstance(result, BaseException) else result
+                        yield f"  - 検索完了 ({phase_labels[phase]}): {q}"
+                finally:
+                    if http is not None:
+                        self._run(http.aclose())
+
             analysis_results_list = []
             solution_results_list = []
-            
-            if analysis_queries:
-                yield "--- 🌐 フェーズ1: 課題の現状分析リサーチを開始... ---"
-                for q in analysis_queries:
-                    if not q.strip(): continue
-                    yield f"  - 検索中 (分析): {q}"
-                    tavily_resp = self.tavily.search(q, num_results=self.tavily_results_per_query)
-                    if isinstance(tavily_resp, dict) and "results" in tavily_resp:
-                        analysis_results_list.extend(tavily_resp["results"])
-                    elif isinstance(tavily_resp, dict) and "error" in tavily_resp:
-                         yield f"  - Tavily エラー (分析クエリ: {q}): {tavily_resp['error']}"
-            
-            if solution_queries:
-                yield "--- 🌐 フェーズ2: 解決策の事例リサーチを開始... ---"
-                for q in solution_queries:
-                    if not q.strip(): continue
-                    yield f"  - 検索中 (解決策): {q}"
-                    tavily_resp = self.tavily.search(q, num_results=self.tavily_results_per_query)
-                    if isinstance(tavily_resp, dict) and "results" in tavily_resp:
-                        solution_results_list.extend(tavily_resp["results"])
-                    elif isinstance(tavily_resp, dict) and "error" in tavily_resp:
-                         yield f"  - Tavily エラー (解決策クエリ: {q}): {tavily_resp['error']}"
+            for (phase, q), tavily_resp in zip(tagged_queries, search_results):
+                if isinstance(tavily_resp, dict) and "results" in tavily_resp:
+                    (analysis_results_list if phase == "analysis" else solution_results_list).extend(tavily_resp["results"])
+                elif isinstance(tavily_resp, dict) and "error" in tavily_resp:
+                     yield f"  - Tavily エラー ({phase_labels[phase]}クエリ: {q}): {tavily_resp['error']}"
 
             yield {"tavily_info_analysis": analysis_results_list, "tavily_info_solution": solution_results_list}
 
@@ -875,7 +1915,51 @@ class EvoGenSolver_Tavily(EvoGenSolver):
         yield {"augmented_problem": augmented_problem}
 
         # 拡張された問題文で EvoGen の本体 (v11.0 の高精度評価スウォームロジック) を実行
-        yield from super().solve(augmented_problem, generations)
+        yield from super()._evolve(augmented_problem, generations)
+
+
+_SOLVE_DONE = object()
+
+
+def run_in_background(make_events, poll_interval: float = 0.1) -> Generator[Any, None, None]:
+    """
+    make_events() が返すジェネレータ (solver.solve など) をワーカースレッドで回し、
+    得られた要素を queue.Queue 経由でスクリプトスレッドに渡す。
+    埋め込み計算・JSON解析・LLM待ちはワーカー側で行い、st.* の描画はすべて呼び出し側のスレッドで行う。
+    """
+    events: "queue.Queue[Any]" = queue.Queue()
+    stop = threading.Event()
+
+    def worker():
+        source = make_events()
+        try:
+            for item in source:
+                if stop.is_set():
+                    break
+                events.put(item)
+        except Exception as e:
+            events.put({"log": {"level": "error", "message": f"バックグラウンド処理中にエラーが発生しました: {e}"}})
+        finally:
+            source.close()
+            events.put(_SOLVE_DONE)
+
+    thread = threading.Thread(target=worker, name="evogen-solve", daemon=True)
+    if add_script_run_ctx is not None and get_script_run_ctx is not None:
+        # まれに残る st.* 呼び出し (SemanticCache の警告など) がワーカーから実行されても失敗しないようにする
+        add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    try:
+        while True:
+            try:
+                item = events.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+            if item is _SOLVE_DONE:
+                return
+            yield item
+    finally:
+        # 再実行などでスクリプト側が途中で抜けた場合はワーカーにも止まってもらう
+        stop.set()
 
 
 # ----------------------------
@@ -910,6 +1994,130 @@ default_problem = """
 """
 problem_statement = st.text_area("解決したい課題を入力してください", value=default_problem, height=260)
 
+# --- 結果表示 (st.fragment にすることで、結果部分だけを再描画できるようにする) ---
+@functools.lru_cache(maxsize=1024)
+def _format_solution_md(name: str, method: str, score: Any) -> str:
+    # 同じ解は再描画のたびに同じ文字列になるため、整形結果を使い回す
+    return (
+        f"**題名:** {name} (スコア: {score})\n\n"
+        f"**具体的な方法:**\n {method}"
+    )
+
+
+@st.fragment
+def render_generation(gen_data: Dict) -> None:
+    st.subheader(f"第 {gen_data['generation']} 世代の結果")
+    with st.container(border=True):
+        gen_results = gen_data.get('results')
+        if not gen_results:
+            st.write("この世代では有効な解決策が生成されませんでした。")
+            return
+        
+        # 世代の結果は生成順で届くため、表示はスコア順に並べ替える
+        # 1件ずつ st.markdown を呼ぶとメッセージが解の数だけ増えるため、1つの Markdown にまとめて描画する
+        parts = []
+        append = parts.append
+        for item in sorted(gen_results, key=EvoGenSolver._score_of, reverse=True):
+            sol = item.get('solution') or {}
+            eva = item.get('evaluation') or {}
+            append(_format_solution_md(
+                str(sol.get('name', 'N/A')),
+                str(sol.get('specific_method', 'N/A')),
+                eva.get('total_score', 0),
+            ))
+        st.markdown("\n\n---\n\n".join(parts))
+
+
+def update_top5(state, results: List[Dict], k: int = 5) -> None:
+    """
+    新しく届いた世代の結果だけを、セッションに保持した上位k件の最小ヒープへ反映する。
+    ヒープの要素は (スコア, -到着順, 解)。同点時は到着順で比較されるため dict 同士は比較されず、先に届いた解が残る。
+    """
+    heap = state["top5_heap"]
+    seen = state["top5_seen"]
+    for item in results:
+        # ほとんどの解はスコアを持っているため、事前確認せずに取り出して欠けている場合だけ飛ばす
+        try:
+            entry = (item["evaluation"]["total_score"], -seen, item)
+        except (KeyError, TypeError):
+            continue
+        seen += 1
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+    state["top5_seen"] = seen
+
+
+# st.info / st.warning / st.success に近い配色 (背景色, 文字色)
+_CALLOUT_STYLES = {
+    "info": ("rgba(28, 131, 225, 0.1)", "rgb(0, 66, 128)"),
+    "warning": ("rgba(255, 227, 18, 0.1)", "rgb(146, 108, 5)"),
+    "success": ("rgba(33, 195, 84, 0.1)", "rgb(23, 114, 51)"),
+}
+
+
+# 最終結果の各欄に表示する最大文字数 (LLM の長い出力で送信量が膨らまないようにする)
+FINAL_FIELD_MAX_CHARS = 4000
+
+
+def _truncate(text: Any, limit: int = FINAL_FIELD_MAX_CHARS) -> str:
+    # 改行を保ったまま末尾を切り詰める (textwrap.shorten は空白を潰すため使わない)
+    text = str(text)
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _callout_html(kind: str, title: str, body: Any, full_width: bool = False, max_height: int = 250) -> str:
+    """ 1つの評価欄を、コールアウト風の div として組み立てる (本文は必ずエスケープする) """
+    background, color = _CALLOUT_STYLES[kind]
+    span = "grid-column:1 / -1;" if full_width else ""
+    return (
+        f'<div style="{span}background:{background};color:{color};border-radius:0.5rem;padding:0.75rem 1rem;">'
+        f'<strong>{html.escape(title)}</strong>'
+        f'<div style="white-space:pre-wrap;max-height:{max_height}px;overflow-y:auto;margin-top:0.5rem;">{html.escape(str(body))}</div>'
+        f'</div>'
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def _format_final_entry_html(rank: int, name: str, score: Any, method: str, strengths: str, weaknesses: str, overall_comment: str) -> str:
+    """ 上位解1件分の見出し・スコア・評価欄を <section> として組み立てる """
+    return (
+        f'<section>'
+        f'<h2>🏅 第 {rank} 位: {html.escape(name)}</h2>'
+        f'<div style="font-size:0.875rem;opacity:0.7;">最終スコア (3エージェント平均)</div>'
+        f'<div style="font-size:2.25rem;margin-bottom:0.75rem;">{html.escape(str(score))}</div>'
+        f'<div style="display:grid;grid-template-columns:1fr 1fr;gap:8px;">'
+        + _callout_html("info", "具体的な方法", method, max_height=400)
+        + _callout_html("success", "優れた点 (3名の評価者より)", strengths, max_height=400)
+        + _callout_html("warning", "懸念点・改善点 (3名の評価者より)", weaknesses, full_width=True)
+        + _callout_html("info", "総評 (3名の評価者より)", overall_comment, full_width=True, max_height=200)
+        + '</div><hr></section>'
+    )
+
+
+@st.fragment
+def render_final_results(top_5_solutions: List[Dict]) -> None:
+    st.success("🏆 処理完了！スコアトップ5の解決策はこちらです。")
+
+    # 5件分の見出し・スコア・評価欄を1つの HTML にまとめ、1回の st.markdown で送る
+    html_parts = []
+    append = html_parts.append
+    for i, item in enumerate(top_5_solutions):
+        sol = item.get('solution') or {}
+        eva = item.get('evaluation') or {}
+        append(_format_final_entry_html(
+            i + 1,
+            str(sol.get('name', 'N/A')),
+            eva.get('total_score', 'N/A'),
+            _truncate(sol.get('specific_method', 'N/A')),
+            _truncate(eva.get('strengths', 'N/A')),
+            _truncate(eva.get('weaknesses', 'N/A')),
+            _truncate(eva.get('overall_comment', 'N/A')),
+        ))
+    st.markdown("\n".join(html_parts), unsafe_allow_html=True)
+
+
 # (v10.1のまま)
 if st.button("解決策の生成を開始", type="primary"):
     if not gemini_key:
@@ -919,17 +2127,24 @@ if st.button("解決策の生成を開始", type="primary"):
     elif not problem_statement.strip():
         st.warning("課題を入力してください。")
     else:
+        st.session_state["finalized"] = False
+        st.session_state["balloons_shown"] = False
+        st.session_state["last_rendered_gen"] = -1
+        st.session_state["top5_heap"] = []
+        st.session_state["top5_seen"] = 0
         status_placeholder = st.empty()
+        log_area = st.container()
         team_placeholder = st.empty()
         augmented_problem_placeholder = st.container() 
         tavily_placeholder = st.container() 
         results_area = st.container()
+        gen_slots = {}
         final_result_placeholder = st.container()
 
         with st.spinner("🌀 AIが思考中です..."):
             try:
-                gemini_client = GeminiClient(api_key=gemini_key)
-                tavily_client = TavilyClient(api_key=tavily_key)
+                gemini_client = get_gemini_client(gemini_key)
+                tavily_client = get_tavily_client(tavily_key)
             except Exception as e:
                 st.error(f"クライアントの初期化に失敗しました: {e}")
                 st.stop()
@@ -958,10 +2173,14 @@ if st.button("解決策の生成を開始", type="primary"):
 
 
             # --- Solverを実行し、結果をUIにストリーミング表示 (v10.1のまま) ---
-            for result in solver.solve(problem_statement, generations=num_generations):
+            for result in run_in_background(lambda: solver.solve(problem_statement, generations=num_generations)):
                 if isinstance(result, str):
                     status_placeholder.info(result) 
 
+                elif isinstance(result, dict) and "log" in result:
+                    # 生成・評価の途中で溜まった警告やエラーを、メインスレッドでまとめて表示する
+                    getattr(log_area, result["log"]["level"], log_area.info)(result["log"]["message"])
+
                 elif isinstance(result, dict) and ("tavily_info_analysis" in result or "tavily_info_solution" in result):
                     tavily_placeholder.empty()
                     analysis_data = result.get("tavily_info_analysis", [])
@@ -1007,88 +2226,38 @@ if st.button("解決策の生成を開始", type="primary"):
 
                 elif isinstance(result, dict) and "generation" in result:
                     # (世代ごと結果表示 - v10.1のまま)
-                    gen_data = result
-                    with results_area.container():
-                        st.subheader(f"第 {gen_data['generation']} 世代の結果")
-                        with st.container(border=True):
-                            if not gen_data.get('results'):
-                                st.write("この世代では有効な解決策が生成されませんでした。")
-                                continue
-                            
-                            for item in gen_data.get('results', []):
-                                sol = item.get('solution', {})
-                                eva = item.get('evaluation', {})
-                                score = eva.get('total_score', 0)
-                                
-                                st.markdown(f"**題名:** {sol.get('name', 'N/A')} (スコア: {score})")
-                                content = sol.get('specific_method', 'N/A') 
-                                st.markdown(f"**具体的な方法:**\n {content}")
-                                
-                                if item != gen_data.get('results', [])[-1]:
-                                    st.markdown("---")
+                    # 世代ごとに1つの枠を確保して追記していき、描画済みの世代は送り直さない
+                    generation = result["generation"]
+                    if generation <= st.session_state["last_rendered_gen"]:
+                        continue
+                    slot = gen_slots.get(generation)
+                    if slot is None:
+                        slot = gen_slots[generation] = results_area.empty()
+                    with slot.container():
+                        render_generation(result)
+                    update_top5(st.session_state, result.get("results", ()))
+                    st.session_state["last_rendered_gen"] = generation
 
         # === 最終結果の表示（v10.1のまま） ===
         
-        all_solutions = [
-            item for gen in solver.history
-            for item in gen.get("results", [])
-            if item.get("evaluation") and "total_score" in item["evaluation"]
-        ]
+        # 上位5件は世代が届くたびに更新済みなので、ここでは並べ替えるだけ (履歴全体は走査しない)
+        top_5_solutions = [item for *_, item in sorted(st.session_state["top5_heap"], key=lambda e: e[:2], reverse=True)]
 
-        if all_solutions:
-            sorted_solutions = sorted(
-                all_solutions,
-                key=lambda x: x["evaluation"]["total_score"],
-                reverse=True
-            )
-            
-            top_5_solutions = sorted_solutions[:5]
+        if top_5_solutions:
+            # 画面操作による再実行で再計算しないよう、確定した上位5件はセッションに保持する
+            st.session_state["top_5_solutions"] = top_5_solutions
+            st.session_state["finalized"] = True
 
             status_placeholder.empty()
-            st.balloons()
+            # 完了演出は1回の実行につき1度だけ
+            if not st.session_state.get("balloons_shown"):
+                st.balloons()
+                st.session_state["balloons_shown"] = True
 
             with final_result_placeholder:
-                st.success("🏆 処理完了！スコアトップ5の解決策はこちらです。")
-                
-                for i, item in enumerate(top_5_solutions):
-                    sol = item.get('solution', {})
-                    eva = item.get('evaluation', {})
-                    score = eva.get('total_score', 'N/A')
-                    
-                    st.header(f"🏅 第 {i + 1} 位: {sol.get('name', 'N/A')}")
-                    st.metric(label="最終スコア (3エージェント平均)", value=f"{score}")
-
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.info(f"**具体的な方法**\n\n{sol.get('specific_method', 'N/A')}")
-                        st.warning(f"**懸念点・改善点 (3名の評価者より)**")
-                        st.text_area(
-                            f"懸念点・改善点 {i+1}", 
-                            value=eva.get('weaknesses', 'N/A'), 
-                            height=250, 
-                            disabled=True,
-                            label_visibility="collapsed"
-                        )
-                    with col2:
-                        st.success(f"**優れた点 (3名の評価者より)**")
-                        st.text_area(
-                            f"優れた点 {i+1}", 
-                            value=eva.get('strengths', 'N/A'), 
-                            height=250, 
-                            disabled=True,
-                            label_visibility="collapsed"
-                        )
-                    
-                    st.info(f"**総評 (3名の評価者より)**")
-                    st.text_area(
-                        f"総評 {i+1}",
-                        value=eva.get('overall_comment', 'N/A'),
-                        height=200,
-                        disabled=True,
-                        label_visibility="collapsed"
-                    )
-                    
-                    st.markdown("---")
+                render_final_results(top_5_solutions)
         else:
-            status_placeholder.warning("処理が完了しましたが、最終的な解決策は見つかりませんでした。")
\ No newline at end of file
+            status_placeholder.warning("処理が完了しましたが、最終的な解決策は見つかりませんでした。")
+elif st.session_state.get("finalized"):
+    # 生成済みの結果は、サイドバー操作などの再実行時にも計算し直さずにそのまま表示する
+    render_final_results(st.session_state["top_5_solutions"])